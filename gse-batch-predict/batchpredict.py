@@ -20,8 +20,22 @@
 # SPDX-License-Identifier: MIT
 
 import argparse
+import csv
+import glob
+import hashlib
+import heapq
+import json
+import multiprocessing
 import os
+import time
+import torch
 import yaml
+from concurrent.futures import ProcessPoolExecutor
+from detect import count_detections, run, summarize_detections
+from models.common import select_backend
+from utils.dataloaders import IMG_FORMATS, VID_FORMATS
+from utils.general import check_requirements, file_sha256, xyxy2xywhn
+from utils.s3 import S3, is_s3
 
 cnvrg_workdir = os.environ.get("CNVRG_WORKDIR", "/cnvrg")
 
@@ -37,17 +51,6 @@ class ModelNotFoundError(Exception):
         return f"ModelNotFoundError: The model file does not exist at {self.model_path}. Please check the previous library!"
 
 
-class CommandFailedError(Exception):
-    """Raise if os.system() returns non-zero exit code"""
-
-    def __init__(self, exit_code):
-        super().__init__(exit_code)
-        self.exit_code = exit_code
-
-    def __str__(self):
-        return f"CommandFailedError: The os command returned exit code {self.exit_code}. Exit code cannot be non-zero!"
-
-
 def parse_parameters():  # pragma: no cover
     """Command line parser"""
     parser = argparse.ArgumentParser(description="""Batch Predict""")
@@ -66,9 +69,417 @@ def parse_parameters():  # pragma: no cover
         default=cnvrg_workdir,
         help="""--- The path to save library artifacts to ---""",
     )
+    parser.add_argument(
+        "--batch_size",
+        action="store",
+        dest="batch_size",
+        required=False,
+        default=None,
+        help="""--- Number of images per forward pass. Defaults to batch_size in batchpredict_config.yaml ---""",
+    )
+    parser.add_argument(
+        "--num_processes",
+        action="store",
+        dest="num_processes",
+        required=False,
+        default=None,
+        help="""--- Number of worker processes to shard the test images across. Defaults to num_processes in batchpredict_config.yaml ---""",
+    )
+    parser.add_argument(
+        "--shard_by",
+        action="store",
+        dest="shard_by",
+        required=False,
+        default=None,
+        choices=["count", "size"],
+        help="""--- Balance shards by file count or by total file size. Defaults to shard_by in batchpredict_config.yaml ---""",
+    )
+    parser.add_argument(
+        "--output_format",
+        action="store",
+        dest="output_format",
+        required=False,
+        default=None,
+        choices=["txt", "csv", "jsonl", "parquet"],
+        help="""--- txt for one label and count file per image, or csv/jsonl/parquet for one detections and one counts file. Defaults to output_format in batchpredict_config.yaml ---""",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store",
+        dest="resume",
+        required=False,
+        default=None,
+        choices=["true", "false"],
+        help="""--- true to skip images processed by an earlier run with the same model and unchanged since. Defaults to resume in batchpredict_config.yaml ---""",
+    )
+    parser.add_argument(
+        "--counts_only",
+        action="store",
+        dest="counts_only",
+        required=False,
+        default=None,
+        choices=["true", "false"],
+        help="""--- true to only count objects per class, without saving images, labels or detections. Defaults to counts_only in batchpredict_config.yaml ---""",
+    )
     return parser.parse_args()
 
 
+class ResultsWriter:
+    """Writes the detections and object counts of all images to two consolidated files
+
+    Rows are buffered in memory and appended to detections.<format> and
+    counts.<format> every chunk_size rows, instead of opening one label file and
+    one count file per image.
+
+    Args:
+        save_dir: directory to write the files to
+        output_format: csv, jsonl or parquet
+        chunk_size: number of rows to buffer before writing them to disk
+        suffix: optional suffix for the file names, i.e. .part0 for a shard
+        counts_only: only write the counts file
+    """
+
+    columns = {
+        "detections": ["image", "class_id", "class", "conf", "x", "y", "w", "h"],
+        "counts": ["image", "class", "count"],
+    }
+
+    def __init__(
+        self,
+        save_dir,
+        output_format="csv",
+        chunk_size=10000,
+        suffix="",
+        counts_only=False,
+    ):
+        if output_format == "parquet":
+            check_requirements("pyarrow")
+        os.makedirs(save_dir, exist_ok=True)
+        self.output_format = output_format
+        self.chunk_size = chunk_size
+        self.paths = {
+            table: os.path.join(save_dir, f"{table}{suffix}.{output_format}")
+            for table in self.columns
+        }
+        for path in self.paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+        if counts_only:
+            del self.paths["detections"]
+        self.buffers = {table: [] for table in self.paths}
+        self.parquet_writers = {}
+
+    def add(self, img_name, det, names, shape):
+        """Buffers the detections and per-class counts of one image
+
+        Args:
+            img_name: name of the image
+            det: NMS output (xyxy, conf, cls) scaled to the original image
+            names: class names of the model
+            shape: shape of the original image
+
+        Returns:
+            flushed: True if the buffered rows were written to disk
+        """
+        if "detections" in self.buffers:
+            xywhn = xyxy2xywhn(det[:, :4], w=shape[1], h=shape[0]).tolist()
+            cls = det[:, 5].int().tolist()
+            conf = det[:, 4].tolist()
+            self.buffers["detections"] += [
+                [img_name, c, names[c], p, *box] for c, p, box in zip(cls, conf, xywhn)
+            ]
+
+        counts = count_detections(det, names)
+        rows = [[img_name, name, n] for name, n in counts.items()]
+        self.buffers["counts"] += rows or [[img_name, "", 0]]
+
+        if any(len(buffer) >= self.chunk_size for buffer in self.buffers.values()):
+            for table in self.buffers:
+                self.flush(table)
+            return True
+        return False
+
+    def flush(self, table):
+        """Appends the buffered rows of a table to its file"""
+        rows, path, columns = (
+            self.buffers[table],
+            self.paths[table],
+            self.columns[table],
+        )
+        if self.output_format == "csv":
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="") as file:
+                writer = csv.writer(file)
+                if new_file:
+                    writer.writerow(columns)
+                writer.writerows(rows)
+        elif self.output_format == "jsonl":
+            with open(path, "a") as file:
+                file.writelines(
+                    json.dumps(dict(zip(columns, row))) + "\n" for row in rows
+                )
+        elif self.output_format == "parquet" and len(rows):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            data = pa.table({c: list(values) for c, values in zip(columns, zip(*rows))})
+            if table not in self.parquet_writers:
+                self.parquet_writers[table] = pq.ParquetWriter(path, data.schema)
+            self.parquet_writers[table].write_table(data)
+        self.buffers[table] = []
+
+    def close(self):
+        """Writes the remaining buffered rows and closes the files"""
+        for table in self.buffers:
+            self.flush(table)
+        if self.output_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            for table, path in self.paths.items():
+                if table not in self.parquet_writers:  # no rows, write an empty table
+                    pq.write_table(pa.table({c: [] for c in self.columns[table]}), path)
+        for writer in self.parquet_writers.values():
+            writer.close()
+
+    @staticmethod
+    def merge(part_paths, save_path):
+        """Concatenates the files written by several shards into one file
+
+        save_path may itself be one of the parts, i.e. to append to earlier results.
+        """
+        part_paths = [path for path in part_paths if os.path.exists(path)]
+        if not part_paths:
+            return
+        tmp_path = save_path + ".tmp"
+        if save_path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            tables = [pq.read_table(path) for path in part_paths]
+            tables = [data for data in tables if data.num_rows] or tables[:1]
+            with pq.ParquetWriter(tmp_path, tables[0].schema) as writer:
+                for data in tables:
+                    writer.write_table(data)
+        else:
+            with open(tmp_path, "w", newline="") as save_file:
+                for i, path in enumerate(part_paths):
+                    with open(path, newline="") as file:
+                        if i and save_path.endswith(".csv"):
+                            file.readline()  # skip the header of all but the first part
+                        save_file.writelines(file)
+        os.replace(tmp_path, save_path)
+        for path in part_paths:
+            if path != save_path:
+                os.remove(path)
+
+    @classmethod
+    def retain(cls, save_dir, output_format, images):
+        """Drops the rows of all images not in images from the consolidated files
+
+        Args:
+            save_dir: directory containing the consolidated files
+            output_format: csv, jsonl or parquet
+            images: set of image names whose rows are kept
+        """
+        for table in cls.columns:
+            path = os.path.join(save_dir, f"{table}.{output_format}")
+            if not os.path.exists(path):
+                continue
+            tmp_path = path + ".tmp"
+            if output_format == "parquet":
+                import pyarrow as pa
+                import pyarrow.compute as pc
+                import pyarrow.parquet as pq
+
+                data = pq.read_table(path)
+                value_set = pa.array(sorted(images), type=pa.string())
+                mask = pc.is_in(data["image"], value_set=value_set)
+                pq.write_table(data.filter(mask), tmp_path)
+            else:
+                with open(path, newline="") as file, open(
+                    tmp_path, "w", newline=""
+                ) as tmp_file:
+                    if output_format == "csv":
+                        tmp_file.write(file.readline())  # header
+                        rows = csv.reader(file)
+                        csv.writer(tmp_file).writerows(
+                            row for row in rows if row[0] in images
+                        )
+                    else:
+                        tmp_file.writelines(
+                            line
+                            for line in file
+                            if line.endswith("\n")  # skip a line cut off by a crash
+                            and json.loads(line)["image"] in images
+                        )
+            os.replace(tmp_path, path)
+
+
+class Manifest:
+    """Records the processed images so that reruns only process new or modified images
+
+    Every processed image is appended to manifest<suffix>.jsonl as one json line
+    with its path, size, modification time, the sha256 of the model and its results.
+
+    Args:
+        save_dir: directory to write the manifest to
+        model_hash: sha256 of the model used for detection
+        suffix: optional suffix for the file name, i.e. .part0 for a shard
+    """
+
+    def __init__(self, save_dir, model_hash, suffix=""):
+        os.makedirs(save_dir, exist_ok=True)
+        self.path = os.path.join(save_dir, f"manifest{suffix}.jsonl")
+        self.model_hash = model_hash
+        self.buffer = []
+
+    def add(self, path, result):
+        """Buffers the manifest entry of one processed image"""
+        self.buffer.append(
+            {**file_stat(path), "model": self.model_hash, "result": result}
+        )
+
+    def flush(self):
+        """Appends the buffered entries to the manifest file"""
+        if self.buffer:
+            with open(self.path, "a") as file:
+                file.writelines(json.dumps(entry) + "\n" for entry in self.buffer)
+            self.buffer = []
+
+    @staticmethod
+    def load(save_dir):
+        """Reads the entries of all manifest files in a directory
+
+        Returns:
+            entries: dictionary mapping absolute image paths to their latest entry
+        """
+        entries = {}
+        for path in sorted(glob.glob(os.path.join(save_dir, "manifest*.jsonl"))):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:  # line cut off by an interrupted run
+                        continue
+                    entries[entry["path"]] = entry
+        return entries
+
+    @staticmethod
+    def compact(save_dir, files):
+        """Rewrites all manifest files into one manifest.jsonl containing only files
+
+        Returns:
+            entries: dictionary mapping absolute image paths to their latest entry
+        """
+        files = {file_stat(file, stat=False)["path"] for file in files}
+        entries = {
+            path: entry
+            for path, entry in Manifest.load(save_dir).items()
+            if path in files
+        }
+        manifest_path = os.path.join(save_dir, "manifest.jsonl")
+        with open(manifest_path + ".tmp", "w") as file:
+            file.writelines(json.dumps(entry) + "\n" for entry in entries.values())
+        for path in glob.glob(os.path.join(save_dir, "manifest*.jsonl")):
+            os.remove(path)
+        os.replace(manifest_path + ".tmp", manifest_path)
+        return entries
+
+
+def file_stat(path, stat=True):
+    """Returns the manifest fields identifying an image and its version
+
+    Local images are identified by their absolute path, size and modification
+    time, s3:// images by their URL, size and ETag from the bucket listing.
+
+    Args:
+        path: local image path or s3:// URL
+        stat: if False only the path is returned, without reading the file info
+
+    Returns:
+        fields: dictionary with the path and, if stat, the size and mtime or etag
+    """
+    if is_s3(path):
+        if not stat:
+            return {"path": path}
+        size, etag = S3.stat(path)
+        return {"path": path, "size": size, "etag": etag}
+    if not stat:
+        return {"path": os.path.abspath(path)}
+    info = os.stat(path)
+    return {"path": os.path.abspath(path), "size": info.st_size, "mtime": info.st_mtime}
+
+
+def split_processed(files, entries, model_hash):
+    """Splits images into those still to process and those unchanged since the last run
+
+    An image is unchanged if the manifest has an entry for it with the same size,
+    modification time (ETag for s3:// images) and model hash.
+
+    Args:
+        files: list of image paths
+        entries: dictionary mapping absolute image paths or s3:// URLs to manifest entries
+        model_hash: sha256 of the model used for detection
+
+    Returns:
+        todo: list of image paths to process
+        processed: dictionary mapping unchanged image paths to their manifest entry
+    """
+    todo, processed = [], {}
+    for file in files:
+        stat = file_stat(file)
+        entry = entries.get(stat["path"])
+        if (
+            entry
+            and all(entry.get(key) == value for key, value in stat.items())
+            and entry["model"] == model_hash
+        ):
+            processed[file] = entry
+        else:
+            todo.append(file)
+    return todo, processed
+
+
+def backend_sha256(path):
+    """Returns the sha256 of a model file, or of all files in a model directory
+
+    Args:
+        path: path to a model file or directory, i.e. an OpenVINO model
+
+    Returns:
+        sha256: hex digest of the file, or of the names and digests of the files
+    """
+    if not os.path.isdir(path):
+        return file_sha256(path)
+    h = hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            file = os.path.join(root, name)
+            h.update(f"{os.path.relpath(file, path)} {file_sha256(file)}\n".encode())
+    return h.hexdigest()
+
+
+def remove_txt_results(save_dir, files):
+    """Deletes the label and counts files of images that are processed again
+
+    detect.py appends to these files, so rows of an earlier run would remain.
+
+    Args:
+        save_dir: directory the results are written to
+        files: list of image paths
+    """
+    for file in files:
+        stem = os.path.splitext(os.path.basename(file))[0]
+        for path in (
+            os.path.join(save_dir, "labels", f"{stem}.txt"),
+            os.path.join(save_dir, "counts", f"{stem}_counts.txt"),
+        ):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
 def validate_model_location(model_loc):
     """Validates the path to the trained model (best.pt)
 
@@ -84,6 +495,245 @@ def validate_model_location(model_loc):
         raise ModelNotFoundError(model_loc)
 
 
+def list_images(test_dir):
+    """Returns the sorted paths of all images in the test directory or s3:// prefix
+
+    Videos are skipped with a warning, as images are predicted in batches.
+    """
+    if is_s3(test_dir):
+        files = [
+            f for f in S3.list(test_dir) if "/" not in f[len(test_dir) :].strip("/")
+        ]
+    else:
+        files = sorted(glob.glob(os.path.join(test_dir, "*.*")))
+    videos = [file for file in files if file.split(".")[-1].lower() in VID_FORMATS]
+    if videos:
+        print(
+            f"WARNING: Skipping {len(videos)} videos, only images are processed: "
+            + ", ".join(os.path.basename(file) for file in videos)
+        )
+    return [file for file in files if file.split(".")[-1].lower() in IMG_FORMATS]
+
+
+def shard_files(files, num_shards, shard_by="count", sizes=None):
+    """Splits a list of files into at most num_shards shards
+
+    Args:
+        files: list of file paths
+        num_shards: number of shards to create
+        shard_by: "count" deals files out round-robin, "size" assigns the largest
+            remaining file to the shard with the smallest total size
+        sizes: optional list of file sizes in bytes, read from disk or the s3:// listing if None
+
+    Returns:
+        shards: list of non-empty lists of file paths
+    """
+    if shard_by == "size":
+        if sizes is None:
+            sizes = [file_stat(file)["size"] for file in files]
+        shards = [[] for _ in range(num_shards)]
+        heap = [(0, i) for i in range(num_shards)]  # (total size, shard index)
+        for size, file in sorted(zip(sizes, files), reverse=True):
+            total, i = heapq.heappop(heap)
+            shards[i].append(file)
+            heapq.heappush(heap, (total + size, i))
+    else:
+        shards = [files[i::num_shards] for i in range(num_shards)]
+    return [sorted(shard) for shard in shards if len(shard)]
+
+
+def batch_predict(
+    test_dir,
+    project_loc,
+    config_dict,
+    batch_size,
+    output_format="txt",
+    suffix="",
+    model_hash=None,
+):  # pragma: no cover
+    """Runs YOLOv5 detection in-process on the test images
+
+    Args:
+        test_dir: path to the directory containing test images, or a list of image paths
+        project_loc: path to save the detection results to
+        config_dict: dictionary containing the library config
+        batch_size: number of images per forward pass
+        output_format: txt, csv, jsonl or parquet
+        suffix: suffix for consolidated output files, i.e. .part0 for a shard
+        model_hash: sha256 of the model, records processed images in a manifest if set
+
+    Returns:
+        result: dictionary mapping image names to detected object info and counts
+        timings: dictionary containing the number of images and per-stage times
+    """
+    timings = {}
+    start = time.perf_counter()
+    save_dir = os.path.join(project_loc, "exp")
+    counts_only = config_dict["counts_only"]
+    writer, manifest = None, None
+    if output_format != "txt":
+        writer = ResultsWriter(
+            save_dir,
+            output_format,
+            config_dict["output_chunk_size"],
+            suffix,
+            counts_only,
+        )
+    if model_hash:
+        manifest = Manifest(save_dir, model_hash, suffix)
+        paths = {os.path.basename(file): file for file in test_dir}
+
+    def on_result(img_name, det, names, shape):
+        # Manifest entries are written once the image's rows, or in txt mode its
+        # label and count files written by detect.py before this call, are on disk
+        flushed = writer.add(img_name, det, names, shape) if writer else True
+        if manifest:
+            if counts_only:
+                summary = [{}, count_detections(det, names)]
+            else:
+                summary = summarize_detections(det, names, shape)
+            manifest.add(paths[img_name], summary)
+            if flushed:
+                manifest.flush()
+
+    result = run(
+        weights=config_dict["model_loc"],
+        source=test_dir,
+        project=project_loc,
+        save_txt=writer is None,
+        save_conf=True,
+        save_counts=writer is None,
+        hide_conf=True,
+        batch_size=batch_size,
+        workers=config_dict["workers"],
+        topk=config_dict["topk"],
+        topk_objectness=config_dict["topk_objectness"],
+        timings=timings,
+        on_result=on_result if writer or manifest else None,
+        counts_only=counts_only,
+    )
+    if writer:
+        writer.close()
+    if manifest:
+        manifest.flush()
+    timings["total"] = time.perf_counter() - start
+    return result, timings
+
+
+def predict_shard(
+    files,
+    project_loc,
+    config_dict,
+    batch_size,
+    output_format,
+    suffix,
+    model_hash,
+    num_threads,
+):  # pragma: no cover
+    """Runs batch prediction on one shard of images in a worker process"""
+    torch.set_num_threads(num_threads)
+    return batch_predict(
+        files, project_loc, config_dict, batch_size, output_format, suffix, model_hash
+    )
+
+
+def sharded_batch_predict(
+    files,
+    project_loc,
+    config_dict,
+    batch_size,
+    num_processes,
+    shard_by,
+    output_format="txt",
+    model_hash=None,
+    append=False,
+):  # pragma: no cover
+    """Splits the test images across worker processes and merges their results
+
+    Every worker loads its own model and uses an equal share of the CPU cores.
+    With append, the consolidated files of the shards are appended to the existing
+    ones instead of replacing them.
+
+    Returns:
+        result: merged dictionary mapping image names to detected object info and counts
+        timings: dictionary containing the number of images, per-stage times summed
+            over all workers and the wall-clock total
+    """
+    start = time.perf_counter()
+    shards = shard_files(files, num_processes, shard_by)
+    num_threads = max((os.cpu_count() or 1) // len(shards), 1)
+
+    result, timings = {}, {}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(len(shards), mp_context=context) as executor:
+        futures = [
+            executor.submit(
+                predict_shard,
+                shard,
+                project_loc,
+                config_dict,
+                batch_size,
+                output_format,
+                f".part{i}",
+                model_hash,
+                num_threads,
+            )
+            for i, shard in enumerate(shards)
+        ]
+        for future in futures:
+            shard_result, shard_timings = future.result()
+            result.update(shard_result)
+            for stage, value in shard_timings.items():
+                timings[stage] = timings.get(stage, 0) + value
+
+    # Merge the consolidated files of all shards
+    if output_format != "txt":
+        merge_parts(os.path.join(project_loc, "exp"), output_format, append)
+    timings["total"] = time.perf_counter() - start
+    return result, timings
+
+
+def merge_parts(save_dir, output_format, append=False):  # pragma: no cover
+    """Merges the .part<k> consolidated files into detections and counts files
+
+    With append, the parts are appended to the existing files instead of replacing them.
+    """
+    for table in ResultsWriter.columns:
+        save_path = os.path.join(save_dir, f"{table}.{output_format}")
+        part_paths = sorted(
+            glob.glob(os.path.join(save_dir, f"{table}.part*.{output_format}"))
+        )
+        ResultsWriter.merge([save_path] * append + part_paths, save_path)
+
+
+def save_results(result, save_path):  # pragma: no cover
+    """Writes the detected object info and counts of all images to one json file"""
+    with open(save_path, "w") as file:
+        json.dump(result, file)
+
+
+def format_timings(timings):
+    """Returns a summary of throughput and per-stage timings
+
+    Args:
+        timings: dictionary containing the number of images, the wall-clock total and
+            per-stage times in seconds (summed over workers when sharded)
+
+    Returns:
+        summary: multi-line string reporting images per second and time spent per stage
+    """
+    images, total = timings["images"], timings["total"]
+    lines = [
+        f"Processed {images} images in {total:.2f}s ({images / max(total, 1e-9):.2f} images/s)",
+        f"  load: {timings['load']:.2f}s",
+    ]
+    for stage in ["pre-process", "inference", "nms"]:
+        lines.append(
+            f"  {stage}: {timings[stage]:.2f}s ({timings[stage] / max(images, 1) * 1e3:.1f}ms per image)"
+        )
+    return "\n".join(lines)
+
+
 def batchpredict_main():  # pragma: no cover
     """Command line execution"""
     # Get input parameters
@@ -96,13 +746,89 @@ def batchpredict_main():  # pragma: no cover
         config_dict = yaml.load(file, Loader=yaml.FullLoader)
     validate_model_location(config_dict["model_loc"])
 
-    # Run YOLOv5 detection script
-    model_loc = config_dict["model_loc"]
+    # Run YOLOv5 detection in this process, or sharded across worker processes
     project_loc = args.output_dir + config_dict["project_name"]
-    command = f"python detect.py --weights {model_loc} --source {args.test_dir} --project {project_loc} --save-txt --save-conf --hide-conf"
-    exit_code = os.system(command)
-    if exit_code != 0:
-        raise CommandFailedError(exit_code)
+    batch_size = int(args.batch_size or config_dict["batch_size"])
+    num_processes = int(args.num_processes or config_dict["num_processes"])
+    shard_by = args.shard_by or config_dict["shard_by"]
+    output_format = args.output_format or config_dict["output_format"]
+    resume = (args.resume or str(config_dict["resume"])).lower() == "true"
+    counts_only = args.counts_only or str(config_dict["counts_only"])
+    config_dict["counts_only"] = counts_only.lower() == "true"
+
+    # Skip the images processed by an earlier run with the same model
+    save_dir = os.path.join(project_loc, "exp")
+    files, processed, model_hash = list_images(args.test_dir), {}, None
+
+    # Use the OpenVINO or ONNX export of the model if it is faster and matches it
+    weights = config_dict["model_loc"]
+    if files and config_dict["auto_backend"]:
+        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        config_dict["model_loc"] = select_backend(weights, device)
+
+    if resume:
+        model_hash = file_sha256(weights)
+        if config_dict["model_loc"] != weights:  # results differ slightly by backend
+            model_hash += "-" + backend_sha256(config_dict["model_loc"])
+        if config_dict["counts_only"]:  # counts-only results lack the object info
+            model_hash += "-counts_only"
+        if config_dict["topk"]:  # the pre-filter may drop detections
+            model_hash += f"-topk{config_dict['topk']}"
+            model_hash += "-objectness" if config_dict["topk_objectness"] else ""
+        files, processed = split_processed(files, Manifest.load(save_dir), model_hash)
+        if output_format != "txt":
+            merge_parts(
+                save_dir, output_format, append=True
+            )  # left by an interrupted run
+            ResultsWriter.retain(
+                save_dir, output_format, {os.path.basename(f) for f in processed}
+            )
+        print(f"Skipping {len(processed)} unchanged images, processing {len(files)}")
+    if output_format == "txt":
+        remove_txt_results(save_dir, files)
+
+    if not files:
+        result = {}
+        timings = dict.fromkeys(
+            ["images", "load", "pre-process", "inference", "nms"], 0
+        )
+        timings["total"] = 0
+    elif num_processes > 1:
+        result, timings = sharded_batch_predict(
+            files,
+            project_loc,
+            config_dict,
+            batch_size,
+            num_processes,
+            shard_by,
+            output_format,
+            model_hash,
+            append=resume,
+        )
+    else:
+        # Write to a part to append it to the consolidated files of the earlier run
+        append = resume and output_format != "txt"
+        suffix = ".part0" if append else ""
+        result, timings = batch_predict(
+            files,
+            project_loc,
+            config_dict,
+            batch_size,
+            output_format,
+            suffix,
+            model_hash,
+        )
+        if append:
+            merge_parts(save_dir, output_format, append)
+
+    # Merge the results of unchanged images into the results of this run
+    if resume:
+        entries = Manifest.compact(save_dir, files + list(processed))
+        merged = {os.path.basename(p): entry["result"] for p, entry in entries.items()}
+        merged.update(result)
+        result = merged
+    save_results(result, os.path.join(save_dir, "results.json"))
+    print(format_timings(timings))
 
 
 if __name__ == "__main__":
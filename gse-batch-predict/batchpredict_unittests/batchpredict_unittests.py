@@ -3,12 +3,18 @@ import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import csv
 import numpy as np
 import shutil
+import torch
 import unittest
 import yaml
 from batchpredict import ModelNotFoundError
-from batchpredict import validate_model_location
+from batchpredict import ResultsWriter, shard_files, validate_model_location
+from batchpredict import Manifest, split_processed
+from batchpredict import backend_sha256, remove_txt_results
+from detect import count_detections, run, summarize_detections
+from models.common import exported_weights, select_backend
 
 np.random.seed(2)
 
@@ -69,6 +75,136 @@ class TestBatchPredict(unittest.TestCase):
         self.assertAlmostEqual(self.img1_labels, self.config["img1_ref_labels"])
         self.assertAlmostEqual(self.img2_labels, self.config["img2_ref_labels"])
 
+    def test_shard_files(self):
+        """Checks if test images are split into balanced shards by file count and by file size"""
+        files = ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"]
+        sizes = [50, 10, 10, 10, 20]
+        self.assertEqual(
+            shard_files(files, 2), [["a.jpg", "c.jpg", "e.jpg"], ["b.jpg", "d.jpg"]]
+        )
+        self.assertEqual(
+            shard_files(files, 2, "size", sizes),
+            [["a.jpg"], ["b.jpg", "c.jpg", "d.jpg", "e.jpg"]],
+        )
+        self.assertEqual(len(shard_files(files, 8)), len(files))
+
+    def test_results_writer(self):
+        """Checks if detections and object counts are written to consolidated csv files"""
+        writer = ResultsWriter("runs/consolidated", "csv", chunk_size=2)
+        det = torch.tensor([[0, 0, 320, 240, 0.9, 1], [320, 240, 640, 480, 0.5, 1]])
+        writer.add("img1.jpg", det, ["person", "bus"], (480, 640, 3))
+        writer.add("img2.jpg", det[:0], ["person", "bus"], (480, 640, 3))
+        writer.close()
+        with open("runs/consolidated/detections.csv") as file:
+            detections = list(csv.reader(file))
+        with open("runs/consolidated/counts.csv") as file:
+            counts = list(csv.reader(file))
+        self.assertEqual(detections[0], ResultsWriter.columns["detections"])
+        self.assertEqual(detections[1][:3], ["img1.jpg", "1", "bus"])
+        np.testing.assert_allclose(
+            [float(x) for x in detections[1][3:]], [0.9, 0.25, 0.25, 0.5, 0.5]
+        )
+        self.assertEqual(len(detections), 3)
+        self.assertEqual(
+            counts,
+            [
+                ["image", "class", "count"],
+                ["img1.jpg", "bus", "2"],
+                ["img2.jpg", "", "0"],
+            ],
+        )
+
+    def test_count_detections(self):
+        """Checks if counts-only mode counts the same objects per class as the full output"""
+        names = ["person", "bus", "tie"]
+        det = torch.tensor(
+            [[0, 0, 9, 9, 0.9, 2], [0, 0, 5, 5, 0.8, 0], [1, 1, 8, 8, 0.7, 2]]
+        )
+        _, object_counter = summarize_detections(det, names, (10, 10, 3))
+        self.assertEqual(count_detections(det, names), object_counter)
+        self.assertEqual(count_detections(det, names), {"person": 1, "tie": 2})
+        self.assertEqual(count_detections(det[:0], names), {})
+
+    def test_split_processed(self):
+        """Checks if only new, modified or re-modelled images are processed again"""
+        files = ["images/bus.jpg", "images/zidane.jpg"]
+        manifest = Manifest("runs/manifest", "model1")
+        manifest.add(files[0], [{}, {}])
+        manifest.add(files[1], [{}, {}])
+        manifest.flush()
+        entries = Manifest.load("runs/manifest")
+        entries[os.path.abspath(files[1])]["size"] += 1
+
+        todo, processed = split_processed(files, entries, "model1")
+        self.assertEqual(todo, ["images/zidane.jpg"])
+        self.assertEqual(list(processed), ["images/bus.jpg"])
+        todo, processed = split_processed(files, entries, "model2")
+        self.assertEqual(todo, files)
+
+    def test_on_result_after_txt(self):
+        """Checks if results are handed over only once the image's count and label files exist"""
+        shutil.rmtree("runs/on_result", ignore_errors=True)
+        written = []
+
+        def on_result(img_name, det, names, shape):
+            stem = os.path.splitext(img_name)[0]
+            files = [f"counts/{stem}_counts.txt"]
+            if len(det):  # label files are only written for images with detections
+                files.append(f"labels/{stem}.txt")
+            written.append(
+                all(os.path.exists(f"runs/on_result/exp/{f}") for f in files)
+            )
+
+        run(
+            weights=self.config["yolo_loc"],
+            source="images/",
+            project="runs/on_result",
+            save_txt=True,
+            nosave=True,
+            on_result=on_result,
+        )
+        self.assertEqual(written, [True, True])
+
+    def test_remove_txt_results(self):
+        """Checks if only the label and counts files of reprocessed images are deleted"""
+        for d, suffix in (("labels", ""), ("counts", "_counts")):
+            os.makedirs(f"runs/txt/{d}", exist_ok=True)
+            for stem in ("bus", "zidane"):
+                open(f"runs/txt/{d}/{stem}{suffix}.txt", "w").close()
+        remove_txt_results("runs/txt", ["images/bus.jpg", "images/missing.jpg"])
+        self.assertEqual(os.listdir("runs/txt/labels"), ["zidane.txt"])
+        self.assertEqual(os.listdir("runs/txt/counts"), ["zidane_counts.txt"])
+
+    def test_backend_sha256(self):
+        """Checks if model directories are hashed by the names and contents of their files"""
+        os.makedirs("runs/hash/model", exist_ok=True)
+        with open("runs/hash/model/model.xml", "w") as f:
+            f.write("a")
+        h = backend_sha256("runs/hash/model")
+        self.assertEqual(
+            backend_sha256("runs/hash/model/model.xml"),
+            "ca978112ca1bbdcafac231b39a23dc4da786eff8147c4e72b9807785afee48bb",
+        )
+        with open("runs/hash/model/model.xml", "w") as f:
+            f.write("b")
+        self.assertNotEqual(backend_sha256("runs/hash/model"), h)
+
+    def test_select_backend(self):
+        """Checks if the exports next to a model are found and the model is kept without them"""
+        os.makedirs("runs/backend")
+        shutil.copy(self.config["yolo_loc"], "runs/backend/best.pt")
+        self.assertEqual(
+            select_backend("runs/backend/best.pt", imgsz=(64, 64), runs=1),
+            "runs/backend/best.pt",
+        )
+        os.makedirs("runs/backend/best_openvino_model")
+        open("runs/backend/best.onnx", "w").close()
+        self.assertEqual(
+            exported_weights("runs/backend/best.pt"),
+            ["runs/backend/best_openvino_model", "runs/backend/best.onnx"],
+        )
+        self.assertEqual(exported_weights("runs/backend/best.onnx"), [])
+
     @classmethod
     def tearDownClass(self):
         """Deletes artiacts generated by unittests"""
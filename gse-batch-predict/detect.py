@@ -64,6 +64,8 @@ from models.common import DetectMultiBackend
 from utils.dataloaders import (
     IMG_FORMATS,
     VID_FORMATS,
+    LoadArrays,
+    LoadImageBatches,
     LoadImages,
     LoadScreenshots,
     LoadStreams,
@@ -88,6 +90,61 @@ from utils.plots import Annotator, colors, save_one_box
 from utils.torch_utils import select_device, smart_inference_mode
 
 
+def summarize_detections(det, names, shape):
+    """Builds the detected object info and per-class object counts for one image
+
+    Args:
+        det: NMS output (xyxy, conf, cls) already scaled to the original image
+        names: class names of the model
+        shape: shape of the original image
+
+    Returns:
+        object_info: dictionary mapping class names to a list of detections
+        object_counter: dictionary mapping class names to object counts
+    """
+    object_info, object_counter = dict(), dict()
+    img_height, img_width = shape[:2]
+    gn = torch.tensor(shape)[[1, 0, 1, 0]]  # normalization gain whwh
+
+    for c in det[:, 5].unique():
+        n = int((det[:, 5] == c).sum())  # detections per class
+        object_counter[names[int(c)]] = object_counter.get(names[int(c)], 0) + n
+
+    for *xyxy, conf, cls in reversed(det):
+        xywh = (
+            (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()
+        )  # normalized xywh
+        detection = dict()
+        detection["class"] = names[int(cls)]
+        detection["conf"] = round(float(conf), 2)
+        detection["bbox"] = [
+            int(xywh[0] * img_width),
+            int(xywh[1] * img_height),
+            int(xywh[2] * img_width),
+            int(xywh[3] * img_height),
+        ]
+
+        if detection["class"] not in object_info:
+            object_info[detection["class"]] = []
+        object_info[detection["class"]].append(detection)
+
+    return object_info, object_counter
+
+
+def count_detections(det, names):
+    """Counts the detected objects per class with one vectorized bincount
+
+    Args:
+        det: NMS output (xyxy, conf, cls)
+        names: class names of the model
+
+    Returns:
+        object_counter: dictionary mapping class names to object counts
+    """
+    counts = torch.bincount(det[:, 5].long(), minlength=len(names)).tolist()
+    return {names[c]: n for c, n in enumerate(counts) if n}
+
+
 @smart_inference_mode()
 def run(
     weights=ROOT / "yolov5s.pt",  # model path or triton URL
@@ -101,10 +158,13 @@ def run(
     view_img=False,  # show results
     save_txt=False,  # save results to *.txt
     save_conf=False,  # save confidences in --save-txt labels
+    save_counts=True,  # save object counts to counts/*_counts.txt
     save_crop=False,  # save cropped prediction boxes
     nosave=False,  # do not save images/videos
     classes=None,  # filter by class: --class 0, or --class 0 2 3
     agnostic_nms=False,  # class-agnostic NMS
+    topk=0,  # keep only the topk candidate boxes per image before NMS, 0 keeps up to max_nms
+    topk_objectness=False,  # pre-select the topk candidates by objectness before class scoring
     augment=False,  # augmented inference
     visualize=False,  # visualize features
     update=False,  # update all models
@@ -117,8 +177,19 @@ def run(
     half=False,  # use FP16 half-precision inference
     dnn=False,  # use OpenCV DNN for ONNX inference
     vid_stride=1,  # video frame-rate stride
+    model=None,  # preloaded DetectMultiBackend, skips model loading and warmup
+    batch_size=1,  # batch size for image files/directories
+    workers=8,  # max dataloader threads decoding images ahead when batch_size > 1
+    timings=None,  # dict filled with the number of images and per-stage times (s)
+    on_result=None,  # callback(name, det, names, shape) called after each image's txt files
+    counts_only=False,  # only count objects, skips rendering, images, labels and crops
 ):
-    source = str(source)
+    if counts_only:
+        nosave, save_txt, save_crop, view_img = True, False, False, False
+    in_memory = isinstance(source, dict)  # {name: BGR ndarray} decoded by the caller
+    file_list = isinstance(source, (list, tuple))  # explicit list of file paths
+    sources = source if in_memory or file_list else None
+    source = "" if sources is not None else str(source)
     save_img = not nosave and not source.endswith(".txt")  # save inference images
     is_file = Path(source).suffix[1:] in (IMG_FORMATS + VID_FORMATS)
     is_url = source.lower().startswith(("rtsp://", "rtmp://", "http://", "https://"))
@@ -130,34 +201,57 @@ def run(
     # Directories
     # save_dir = increment_path(Path(project) / name, exist_ok=exist_ok)  # increment run
     save_dir = Path(project) / name
-    (save_dir / "labels" if save_txt else save_dir).mkdir(
-        parents=True, exist_ok=True
-    )  # make dir
+    if save_img or save_txt or save_counts or save_crop:
+        (save_dir / "labels" if save_txt else save_dir).mkdir(
+            parents=True, exist_ok=True
+        )  # make dir
 
     # Load model
-    device = select_device(device)
-    model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
+    preloaded = model is not None
+    t_load = Profile()
+    if not preloaded:
+        with t_load:
+            device = select_device(device)
+            model = DetectMultiBackend(
+                weights, device=device, dnn=dnn, data=data, fp16=half
+            )
     stride, names, pt = model.stride, model.names, model.pt
     imgsz = check_img_size(imgsz, s=stride)  # check image size
 
     # Dataloader
     bs = 1  # batch_size
     if webcam:
-        view_img = check_imshow(warn=True)
+        view_img = not counts_only and check_imshow(warn=True)
         dataset = LoadStreams(
             source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride
         )
         bs = len(dataset)
     elif screenshot:
         dataset = LoadScreenshots(source, img_size=imgsz, stride=stride, auto=pt)
+    elif in_memory:
+        dataset = LoadArrays(sources, img_size=imgsz, stride=stride, auto=pt)
+    elif batch_size > 1:
+        dataset = LoadImageBatches(
+            sources if file_list else source,
+            img_size=imgsz,
+            stride=stride,
+            batch_size=batch_size,
+            workers=workers,
+        )
+        bs = batch_size
     else:
         dataset = LoadImages(
-            source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride
+            sources if file_list else source,
+            img_size=imgsz,
+            stride=stride,
+            auto=pt,
+            vid_stride=vid_stride,
         )
     vid_path, vid_writer = [None] * bs, [None] * bs
 
     # Run inference
-    model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
+    if not preloaded:
+        model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
     seen, windows, dt = 0, [], (Profile(), Profile(), Profile())
 
     # Declare output dictionary for json response
@@ -183,7 +277,14 @@ def run(
         # NMS
         with dt[2]:
             pred = non_max_suppression(
-                pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det
+                pred,
+                conf_thres,
+                iou_thres,
+                classes,
+                agnostic_nms,
+                max_det=max_det,
+                topk=topk,
+                topk_objectness=topk_objectness,
             )
 
         # Second-stage classifier (optional)
@@ -193,10 +294,14 @@ def run(
         for i, det in enumerate(pred):  # per image
             seen += 1
             if webcam:  # batch_size >= 1
-                p, im0, frame = path[i], im0s[i].copy(), dataset.count
+                p, im0, frame = path[i], im0s[i], dataset.count
                 s += f"{i}: "
+            elif bs > 1:  # batched image files
+                p, im0, frame = path[i], im0s[i], 0
             else:
-                p, im0, frame = path, im0s.copy(), getattr(dataset, "frame", 0)
+                p, im0, frame = path, im0s, getattr(dataset, "frame", 0)
+            if not counts_only:
+                im0 = im0.copy()  # annotated below
 
             p = Path(p)  # to Path
             save_path = str(save_dir / p.name)  # im.jpg
@@ -206,11 +311,12 @@ def run(
             s += "%gx%g " % im.shape[2:]  # print string
             gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
             imc = im0.copy() if save_crop else im0  # for save_crop
-            annotator = Annotator(im0, line_width=line_thickness, example=str(names))
+            if not counts_only:
+                annotator = Annotator(
+                    im0, line_width=line_thickness, example=str(names)
+                )
             object_info = dict()
             object_counter = dict()
-            img_width = im0.shape[1]
-            img_height = im0.shape[0]
             img_name = p.name
             if p.name.split(".")[-1] in [
                 "mov",
@@ -228,81 +334,78 @@ def run(
                 # Rescale boxes from img_size to im0 size
                 det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
 
+                # Store detected object info and counts
+                if counts_only:
+                    object_counter = count_detections(det, names)
+                else:
+                    object_info, object_counter = summarize_detections(
+                        det, names, im0.shape
+                    )
+
                 # Print results
-                for c in det[:, 5].unique():
-                    n = int((det[:, 5] == c).sum())  # detections per class
-                    s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
-                    object_counter[names[int(c)]] = (
-                        object_counter.get(names[int(c)], 0) + n
-                    )  # store counts in dictionary
+                for obj, n in object_counter.items():
+                    s += f"{n} {obj}{'s' * (n > 1)}, "  # add to string
 
                 # Write results
-                for *xyxy, conf, cls in reversed(det):
-                    detection = dict()
-
-                    if save_txt:  # Write to file
-                        xywh = (
-                            (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn)
-                            .view(-1)
-                            .tolist()
-                        )  # normalized xywh
-                        line = (
-                            (cls, *xywh, conf) if save_conf else (cls, *xywh)
-                        )  # label format
-                        with open(f"{txt_path}.txt", "a") as f:
-                            f.write(("%g " * len(line)).rstrip() % line + "\n")
-
-                        # Store detected object info
-                        detection["class"] = names[int(line[0])]
-                        detection["conf"] = round(float(conf), 2)
-                        detection["bbox"] = [
-                            int(line[1] * img_width),
-                            int(line[2] * img_height),
-                            int(line[3] * img_width),
-                            int(line[4] * img_height),
-                        ]
-
-                        if detection["class"] not in object_info:
-                            object_info[detection["class"]] = []
-                        object_info[detection["class"]].append(detection)
-
-                    if save_img or save_crop or view_img:  # Add bbox to image
-                        c = int(cls)  # integer class
-                        label = (
-                            None
-                            if hide_labels
-                            else (names[c] if hide_conf else f"{names[c]} {conf:.2f}")
-                        )
-                        annotator.box_label(xyxy, label, color=colors(c, True))
-
-                    if save_crop:
-                        save_one_box(
-                            xyxy,
-                            imc,
-                            file=save_dir / "crops" / names[c] / f"{p.stem}.jpg",
-                            BGR=True,
-                        )
+                if save_txt or save_img or save_crop or view_img:
+                    for *xyxy, conf, cls in reversed(det):
+                        if save_txt:  # Write to file
+                            xywh = (
+                                (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn)
+                                .view(-1)
+                                .tolist()
+                            )  # normalized xywh
+                            line = (
+                                (cls, *xywh, conf) if save_conf else (cls, *xywh)
+                            )  # label format
+                            with open(f"{txt_path}.txt", "a") as f:
+                                f.write(("%g " * len(line)).rstrip() % line + "\n")
+
+                        if save_img or save_crop or view_img:  # Add bbox to image
+                            c = int(cls)  # integer class
+                            label = (
+                                None
+                                if hide_labels
+                                else (
+                                    names[c] if hide_conf else f"{names[c]} {conf:.2f}"
+                                )
+                            )
+                            annotator.box_label(xyxy, label, color=colors(c, True))
+
+                        if save_crop:
+                            save_one_box(
+                                xyxy,
+                                imc,
+                                file=save_dir / "crops" / names[c] / f"{p.stem}.jpg",
+                                BGR=True,
+                            )
 
             result[img_name] = [object_info, object_counter]
 
             # Add object counts to images
-            annotator.show_counts(object_counter)
+            if not counts_only:
+                annotator.show_counts(object_counter)
+                im0 = annotator.result()
 
             # Write object counts to file
-            (save_dir / "counts").mkdir(parents=True, exist_ok=True)
-            count_path = str(save_dir / "counts" / p.stem) + (
-                "" if dataset.mode == "image" else f"_{frame}"
-            )  # im_counts.txt
-            if len(object_counter):
-                for obj, count in object_counter.items():
+            if save_counts:
+                (save_dir / "counts").mkdir(parents=True, exist_ok=True)
+                count_path = str(save_dir / "counts" / p.stem) + (
+                    "" if dataset.mode == "image" else f"_{frame}"
+                )  # im_counts.txt
+                if len(object_counter):
+                    for obj, count in object_counter.items():
+                        with open(f"{count_path}_counts.txt", "a") as f:
+                            f.write("{}: {}".format(obj, count) + "\n")
+                else:
                     with open(f"{count_path}_counts.txt", "a") as f:
-                        f.write("{}: {}".format(obj, count) + "\n")
-            else:
-                with open(f"{count_path}_counts.txt", "a") as f:
-                    f.write("No detections")
+                        f.write("No detections")
+
+            # Hand the results over once the label and count files are written
+            if on_result:
+                on_result(img_name, det, names, im0.shape)
 
             # Stream results
-            im0 = annotator.result()
             if view_img:
                 if platform.system() == "Linux" and p not in windows:
                     windows.append(p)
@@ -356,6 +459,16 @@ def run(
         LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
     if update:
         strip_optimizer(weights[0])  # update model (to fix SourceChangeWarning)
+    if timings is not None:
+        timings.update(
+            {
+                "images": seen,
+                "load": t_load.t,
+                "pre-process": dt[0].t,
+                "inference": dt[1].t,
+                "nms": dt[2].t,
+            }
+        )
 
     return result
 
@@ -422,6 +535,17 @@ def parse_opt():
     parser.add_argument(
         "--agnostic-nms", action="store_true", help="class-agnostic NMS"
     )
+    parser.add_argument(
+        "--topk",
+        type=int,
+        default=0,
+        help="keep only the topk candidate boxes per image before NMS, 0 disables",
+    )
+    parser.add_argument(
+        "--topk-objectness",
+        action="store_true",
+        help="pre-select the --topk candidates by objectness before class scoring",
+    )
     parser.add_argument("--augment", action="store_true", help="augmented inference")
     parser.add_argument("--visualize", action="store_true", help="visualize features")
     parser.add_argument("--update", action="store_true", help="update all models")
@@ -452,6 +576,15 @@ def parse_opt():
     parser.add_argument(
         "--vid-stride", type=int, default=1, help="video frame-rate stride"
     )
+    parser.add_argument(
+        "--batch-size", type=int, default=1, help="batch size for image files"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="max dataloader threads when --batch-size > 1",
+    )
     opt = parser.parse_args()
     opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
     print_args(vars(opt))
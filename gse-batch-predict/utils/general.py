@@ -5,6 +5,7 @@ General utils
 
 import contextlib
 import glob
+import hashlib
 import inspect
 import logging
 import math
@@ -38,7 +39,7 @@ import yaml
 
 from utils import TryExcept, emojis
 from utils.downloads import gsutil_getsize
-from utils.metrics import box_iou, fitness
+from utils.metrics import fitness
 
 FILE = Path(__file__).resolve()
 ROOT = FILE.parents[1]  # YOLOv5 root directory
@@ -323,6 +324,15 @@ def file_size(path):
         return 0.0
 
 
+def file_sha256(path):
+    # Return the sha256 hex digest of a file, read in 1 MB blocks
+    h = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
 def check_online():
     # Check internet connectivity
     import socket
@@ -591,19 +601,26 @@ def check_dataset(data, autodownload=True):
     for k in "train", "val", "test":
         if data.get(k):  # prepend path
             if isinstance(data[k], str):
+                if data[k].startswith("s3://"):  # S3 dataset source, read on demand
+                    continue
                 x = (path / data[k]).resolve()
                 if not x.exists() and data[k].startswith("../"):
                     x = (path / data[k][3:]).resolve()
                 data[k] = str(x)
             else:
-                data[k] = [str((path / x).resolve()) for x in data[k]]
+                data[k] = [
+                    x if x.startswith("s3://") else str((path / x).resolve())
+                    for x in data[k]
+                ]
 
     # Parse yaml
     train, val, test, s = (data.get(x) for x in ("train", "val", "test", "download"))
     if val:
         val = [
-            Path(x).resolve() for x in (val if isinstance(val, list) else [val])
-        ]  # val path
+            Path(x).resolve()
+            for x in (val if isinstance(val, list) else [val])
+            if not x.startswith("s3://")
+        ]  # local val path
         if not all(x.exists() for x in val):
             LOGGER.info(
                 "\nDataset not found ⚠️, missing paths %s"
@@ -1088,9 +1105,19 @@ def non_max_suppression(
     labels=(),
     max_det=300,
     nm=0,  # number of masks
+    topk=0,  # keep the topk most confident boxes per image before NMS, 0 to sort all of them
+    topk_objectness=False,  # select the topk boxes by objectness, before the class scores
+    batched=None,  # one NMS call for the whole batch, None to batch on CUDA only
 ):
     """Non-Maximum Suppression (NMS) on inference results to reject overlapping detections
 
+    On dense scenes with many candidates, topk selects the most confident boxes of every
+    image with torch.topk instead of sorting all of them. With topk_objectness, they are
+    selected by objectness alone, so the class scores are only multiplied on the topk rows.
+
+    With batched, batches of at most max_nms candidates skip the per-image loop and run
+    batched_non_max_suppression instead, with the same detections.
+
     Returns:
          list of detections, on (n,6) tensor per image [xyxy, conf, cls]
     """
@@ -1120,12 +1147,24 @@ def non_max_suppression(
     # min_wh = 2  # (pixels) minimum box width and height
     max_wh = 7680  # (pixels) maximum box width and height
     max_nms = 30000  # maximum number of boxes into torchvision.ops.nms()
-    time_limit = 0.5 + 0.05 * bs  # seconds to quit after
-    redundant = True  # require redundant detections
     multi_label &= nc > 1  # multiple labels per box (adds 0.5ms/img)
-    merge = False  # use merge-NMS
+    topk = min(topk, max_nms)
+    if batched is None:
+        batched = device.type == "cuda"
+
+    # Whole batch at once, the NMS cost grows with the square of the number of candidates
+    if batched and not labels and not topk and not mps and xc.sum() <= max_nms:
+        return batched_non_max_suppression(
+            prediction,
+            conf_thres,
+            iou_thres,
+            classes,
+            agnostic,
+            multi_label,
+            max_det,
+            nm,
+        )
 
-    t = time.time()
     mi = 5 + nc  # mask start index
     output = [torch.zeros((0, 6 + nm), device=prediction.device)] * bs
     for xi, x in enumerate(prediction):  # image index, image inference
@@ -1146,6 +1185,10 @@ def non_max_suppression(
         if not x.shape[0]:
             continue
 
+        # Pre-select by objectness
+        if topk and topk_objectness:
+            x = x[x[:, 4].topk(min(topk, x.shape[0]))[1]]
+
         # Compute conf
         x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
 
@@ -1175,6 +1218,8 @@ def non_max_suppression(
         n = x.shape[0]  # number of boxes
         if not n:  # no boxes
             continue
+        elif topk:  # most confident boxes
+            x = x[x[:, 4].topk(min(topk, n))[1]]  # sorted by confidence
         elif n > max_nms:  # excess boxes
             x = x[x[:, 4].argsort(descending=True)[:max_nms]]  # sort by confidence
         else:
@@ -1186,26 +1231,73 @@ def non_max_suppression(
         i = torchvision.ops.nms(boxes, scores, iou_thres)  # NMS
         if i.shape[0] > max_det:  # limit detections
             i = i[:max_det]
-        if merge and (1 < n < 3e3):  # Merge NMS (boxes merged using weighted mean)
-            # update boxes as boxes(i,4) = weights(i,n) * boxes(n,4)
-            iou = box_iou(boxes[i], boxes) > iou_thres  # iou matrix
-            weights = iou * scores[None]  # box weights
-            x[i, :4] = torch.mm(weights, x[:, :4]).float() / weights.sum(
-                1, keepdim=True
-            )  # merged boxes
-            if redundant:
-                i = i[iou.sum(1) > 1]  # require redundancy
 
         output[xi] = x[i]
         if mps:
             output[xi] = output[xi].to(device)
-        if (time.time() - t) > time_limit:
-            LOGGER.warning(f"WARNING ⚠️ NMS time limit {time_limit:.3f}s exceeded")
-            break  # time limit exceeded
 
     return output
 
 
+def batched_non_max_suppression(
+    prediction,
+    conf_thres=0.25,
+    iou_thres=0.45,
+    classes=None,
+    agnostic=False,
+    multi_label=False,
+    max_det=300,
+    nm=0,  # number of masks
+):
+    """Non-Maximum Suppression (NMS) on the whole batch at once, without the per-image loop
+
+    The candidates of all images are scored and filtered together, and one NMS call runs on
+    the boxes offset by class as in non_max_suppression, and by image in float64 so that the
+    offset boxes stay exact.
+
+    Returns:
+         list of detections, on (n,6) tensor per image [xyxy, conf, cls]
+    """
+    bs = prediction.shape[0]  # batch size
+    nc = prediction.shape[2] - nm - 5  # number of classes
+    mi = 5 + nc  # mask start index
+    max_wh = 7680  # (pixels) maximum box width and height
+    multi_label &= nc > 1  # multiple labels per box
+
+    xc = prediction[..., 4] > conf_thres  # candidates
+    xi = xc.nonzero(as_tuple=False)[:, 0]  # image index of every candidate
+    x = prediction[xc]  # confidence
+    x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
+    box = xywh2xyxy(x[:, :4])  # center_x, center_y, width, height) to (x1, y1, x2, y2)
+    mask = x[:, mi:]  # zero columns if no masks
+
+    # Detections matrix nx6 (xyxy, conf, cls)
+    if multi_label:
+        i, j = (x[:, 5:mi] > conf_thres).nonzero(as_tuple=False).T
+        x = torch.cat((box[i], x[i, 5 + j, None], j[:, None].float(), mask[i]), 1)
+    else:  # best class only
+        conf, j = x[:, 5:mi].max(1, keepdim=True)
+        i = conf.view(-1) > conf_thres
+        x = torch.cat((box, conf, j.float(), mask), 1)[i]
+    xi = xi[i]
+
+    # Filter by class
+    if classes is not None:
+        i = (x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)
+        x, xi = x[i], xi[i]
+
+    # NMS on the boxes offset by class, then by image
+    c = x[:, 5:6] * (0 if agnostic else max_wh)  # classes
+    boxes = (x[:, :4] + c).double() + xi[:, None].double() * max_wh * (nc + 1)
+    i = torchvision.ops.nms(boxes, x[:, 4].double(), iou_thres)  # NMS
+
+    # Group by image, most confident first, and limit detections
+    x, xi = x[i], xi[i]
+    x, xi = x[(xi.double() * 2 - x[:, 4].double()).argsort()], xi.sort()[0]  # conf <= 1
+    n = torch.bincount(xi, minlength=bs).tolist()  # detections per image
+    return [d[:max_det] for d in x.split(n)]
+
+
 def strip_optimizer(
     f="best.pt", s=""
 ):  # from utils.general import *; strip_optimizer()
@@ -1226,7 +1318,15 @@ def strip_optimizer(
     )
 
 
-def print_mutation(keys, results, hyp, save_dir, bucket, prefix=colorstr("evolve: ")):
+def print_mutation(
+    keys,
+    results,
+    hyp,
+    save_dir,
+    bucket,
+    fitness_mode="map",
+    prefix=colorstr("evolve: "),
+):
     evolve_csv = save_dir / "evolve.csv"
     evolve_yaml = save_dir / "hyp_evolve.yaml"
     keys = tuple(keys) + tuple(hyp.keys())  # [results + hyps]
@@ -1255,20 +1355,20 @@ def print_mutation(keys, results, hyp, save_dir, bucket, prefix=colorstr("evolve
     with open(evolve_yaml, "w") as f:
         data = pd.read_csv(evolve_csv)
         data = data.rename(columns=lambda x: x.strip())  # strip keys
-        i = np.argmax(fitness(data.values[:, :4]))  #
+        i = np.argmax(fitness(data.values, fitness_mode))  #
         generations = len(data)
         f.write(
             "# YOLOv5 Hyperparameter Evolution Results\n"
             + f"# Best generation: {i}\n"
             + f"# Last generation: {generations - 1}\n"
             + "# "
-            + ", ".join(f"{x.strip():>20s}" for x in keys[:7])
+            + ", ".join(f"{x.strip():>20s}" for x in keys[:10])
             + "\n"
             + "# "
-            + ", ".join(f"{x:>20.5g}" for x in data.values[i, :7])
+            + ", ".join(f"{x:>20.5g}" for x in data.values[i, :10])
             + "\n\n"
         )
-        yaml.safe_dump(data.loc[i][7:].to_dict(), f, sort_keys=False)
+        yaml.safe_dump(data.loc[i][10:].to_dict(), f, sort_keys=False)
 
     # Print to screen
     LOGGER.info(
@@ -1356,6 +1456,10 @@ imshow_ = cv2.imshow  # copy to avoid recursion errors
 
 
 def imread(path, flags=cv2.IMREAD_COLOR):
+    if str(path).startswith("s3://"):  # S3 dataset source
+        from utils.s3 import S3
+
+        return cv2.imdecode(np.frombuffer(S3.read(path), np.uint8), flags)
     return cv2.imdecode(np.fromfile(path, np.uint8), flags)
 
 
@@ -476,7 +476,7 @@ def plot_val_study(
     fig2, ax2 = plt.subplots(1, 1, figsize=(8, 4), tight_layout=True)
     # for f in [save_dir / f'study_coco_{x}.txt' for x in ['yolov5n6', 'yolov5s6', 'yolov5m6', 'yolov5l6', 'yolov5x6']]:
     for f in sorted(save_dir.glob("study*.txt")):
-        y = np.loadtxt(f, dtype=np.float32, usecols=[0, 1, 2, 3, 7, 8, 9], ndmin=2).T
+        y = np.loadtxt(f, dtype=np.float32, usecols=[0, 1, 2, 3, 10, 11, 12], ndmin=2).T
         x = np.arange(y.shape[1]) if x is None else np.array(x)
         if plot2:
             s = [
@@ -614,20 +614,20 @@ def imshow_cls(
 
 
 def plot_evolve(
-    evolve_csv="path/to/evolve.csv",
+    evolve_csv="path/to/evolve.csv", fitness_mode="map"
 ):  # from utils.plots import *; plot_evolve()
     # Plot evolve.csv hyp evolution results
     evolve_csv = Path(evolve_csv)
     data = pd.read_csv(evolve_csv)
     keys = [x.strip() for x in data.columns]
     x = data.values
-    f = fitness(x)
+    f = fitness(x, fitness_mode)
     j = np.argmax(f)  # max fitness index
     plt.figure(figsize=(10, 12), tight_layout=True)
     matplotlib.rc("font", **{"size": 8})
     print(f"Best results from row {j} of {evolve_csv}:")
-    for i, k in enumerate(keys[7:]):
-        v = x[:, 7 + i]
+    for i, k in enumerate(keys[10:]):
+        v = x[:, 10 + i]
         mu = v[j]  # best single result
         plt.subplot(6, 5, i + 1)
         plt.scatter(
@@ -1,11 +1,15 @@
+import json
 import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import numpy as np
+import tarfile
+import tempfile
 import unittest
 import yaml
+from PIL import Image
 from data_preparation import (
     NoneDatasetError,
     DatasetPathError,
@@ -14,8 +18,14 @@ from data_preparation import (
     DatasetSizeError,
     DatasetNamingError,
     NumberOfClassesError,
+    ImageListError,
 )
+from data_preparation import remove_corrupt, validate_labels, verify_label
 from data_preparation import validate_arguments, validate_dataset, train_valid_split
+from data_preparation import stratified_split
+from data_preparation import transfer_files, write_image_list, write_shards
+from data_preparation import imap_bounded
+from multiprocessing.pool import ThreadPool
 
 np.random.seed(2)
 
@@ -119,6 +129,18 @@ class TestValidateDataset(TestDataPreparation):
             [len(result[0]), len(result[1])], [self.num_images, self.num_labels]
         )
 
+    def test_dotted_names(self):
+        """Checks if every label is paired with its image when the file names contain dots"""
+        images, labels = validate_dataset(
+            [],
+            ["a.q.jpg", "a.png"],
+            ["a.txt", "a.q.txt"],
+            ["jpg", "png"],
+            self.class_list,
+        )
+        self.assertEqual(images, ["a.png", "a.q.jpg"])
+        self.assertEqual(labels, ["a.txt", "a.q.txt"])
+
     def test_dataset_size_error(self):
         """Checks for DatasetSizeError if number of images is not equal to number of labels"""
         with self.assertRaises(DatasetSizeError):
@@ -174,6 +196,193 @@ class TrainValidSplit(TestDataPreparation):
         self.assertEqual(train_lbls, self.train_lbls)
         self.assertEqual(val_lbls, self.valid_lbls)
 
+    def test_stratified_split(self):
+        """Checks if rare classes and object counts are represented in both sets"""
+        rng = np.random.default_rng(0)
+        class_counts = np.zeros((1000, 3), dtype=np.int32)
+        class_counts[:, 0] = rng.integers(1, 40, 1000)
+        class_counts[:4, 2] = 1  # rare class in 4 images
+        class_counts[4:200] = 0  # empty images
+        valid = stratified_split(class_counts, 0.3)
+        self.assertEqual(valid.dtype, bool)
+        self.assertAlmostEqual(valid.mean(), 0.3, delta=0.02)
+        self.assertTrue(valid[:4].any() and not valid[:4].all())
+        self.assertAlmostEqual(valid[4:200].mean(), 0.3, delta=0.02)
+        objects = class_counts.sum(axis=1)
+        self.assertAlmostEqual(objects[valid].mean(), objects[~valid].mean(), delta=0.5)
+        np.testing.assert_array_equal(stratified_split(class_counts, 0.3), valid)
+
+        # Images and labels are returned in pairs
+        train_imgs, val_imgs, train_lbls, val_lbls = train_valid_split(
+            self.img_list, self.lbl_list, self.valid_size, np.eye(5, dtype=np.int32)
+        )
+        self.assertEqual(
+            [len(train_imgs), len(val_imgs)], [self.num_train, self.num_valid]
+        )
+        self.assertEqual(
+            [x.rsplit(".", 1)[0] for x in val_imgs], [x[:-4] for x in val_lbls]
+        )
+
+    def test_pairs_kept(self):
+        """Checks if the labels follow their images when sorting them apart would mix them up"""
+        images = ["a.q.jpg", "a.png", "b.jpg", "c.jpg", "d.jpg"]
+        labels = ["a.q.txt", "a.txt", "b.txt", "c.txt", "d.txt"]
+        for class_counts in (None, np.eye(5, dtype=np.int32)):
+            train_imgs, val_imgs, train_lbls, val_lbls = train_valid_split(
+                images, labels, self.valid_size, class_counts
+            )
+            self.assertEqual(
+                [x.rsplit(".", 1)[0] + ".txt" for x in train_imgs + val_imgs],
+                train_lbls + val_lbls,
+            )
+
+
+class TestValidateLabels(TestDataPreparation):
+    def write_dataset(self, tmp, labels):
+        """Writes a 20x10 image and a label file for every label in labels"""
+        for i, label in enumerate(labels):
+            Image.new("RGB", (20, 10)).save(os.path.join(tmp, f"{i}.jpg"))
+            with open(os.path.join(tmp, f"{i}.txt"), "w") as file:
+                file.write(label)
+        return [f"{i}.jpg" for i in range(len(labels))], [
+            f"{i}.txt" for i in range(len(labels))
+        ]
+
+    def test_verify_label(self):
+        """Checks if class ids, box coordinates and the number of columns are validated"""
+        labels = [
+            "0 0.5 0.5 0.2 0.2\n2 0.1 0.1 0.1 0.1\n",
+            "",
+            "3 0.5 0.5 0.2 0.2\n",
+            "0 0.5 0.5 1.2 0.2\n",
+            "0 0.5 0.5 0.2\n",
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            images, labels = self.write_dataset(tmp, labels)
+            results = [
+                verify_label((os.path.join(tmp, x), os.path.join(tmp, y), 3))
+                for x, y in zip(images, labels)
+            ]
+        self.assertEqual(results[0][1], (20, 10))
+        self.assertEqual(results[0][2].tolist(), [0, 2])
+        self.assertEqual(results[1][2].tolist(), [])
+        self.assertEqual(
+            [bool(x[3]) for x in results], [False, False, True, True, True]
+        )
+
+    def test_validate_labels(self):
+        """Checks if the summary report counts objects per class and lists invalid labels"""
+        labels = ["0 0.5 0.5 0.2 0.2\n2 0.1 0.1 0.1 0.1\n", "", "5 0.5 0.5 0.2 0.2\n"]
+        with tempfile.TemporaryDirectory() as tmp:
+            images, labels = self.write_dataset(tmp, labels)
+            report, class_counts = validate_labels(
+                images, labels, tmp, tmp, self.class_list, 2
+            )
+        self.assertEqual(report["images"], 3)
+        self.assertEqual(report["objects"], 2)
+        self.assertEqual(report["empty"], 1)
+        self.assertEqual(report["instances"], {"oranges": 1, "apples": 0, "bananas": 1})
+        self.assertEqual(report["min_size"], [20, 10])
+        self.assertEqual(
+            [x[0] for x in report["corrupt"]], [os.path.join(tmp, "2.jpg")]
+        )
+        self.assertEqual(class_counts.tolist(), [[1, 0, 1], [0, 0, 0], [0, 0, 0]])
+
+        # Invalid images are skipped with their labels
+        images, labels, class_counts = remove_corrupt(
+            images, labels, class_counts, report["corrupt"], tmp
+        )
+        self.assertEqual(images, ["0.jpg", "1.jpg"])
+        self.assertEqual(labels, ["0.txt", "1.txt"])
+        self.assertEqual(class_counts.tolist(), [[1, 0, 1], [0, 0, 0]])
+
+
+class TestSplitMode(TestDataPreparation):
+    def test_transfer_files(self):
+        """Checks if files are hardlinked or symlinked into a directory and the originals are kept"""
+        with tempfile.TemporaryDirectory() as tmp:
+            files = [os.path.join(tmp, lbl) for lbl in self.lbl_list]
+            for file in files:
+                open(file, "w").close()
+            for split_mode in ("hardlink", "symlink"):
+                dst = os.path.join(tmp, split_mode)
+                os.makedirs(dst)
+                result = transfer_files(files, dst, split_mode, 4)
+                self.assertEqual(sorted(os.listdir(dst)), self.lbl_list)
+                self.assertEqual(result[0], os.path.join(dst, self.lbl_list[0]))
+                self.assertTrue(all(os.path.exists(file) for file in files))
+            self.assertTrue(os.path.islink(os.path.join(tmp, "symlink", "1.txt")))
+
+    def test_write_image_list(self):
+        """Checks if images are listed in place only if YOLOv5 finds their labels"""
+        with tempfile.TemporaryDirectory() as tmp:
+            img_dir, lbl_dir = os.path.join(tmp, "images"), os.path.join(tmp, "labels")
+            list_file = os.path.join(tmp, "train.txt")
+            write_image_list(
+                self.img_list[:2], self.lbl_list[:2], img_dir, lbl_dir, list_file
+            )
+            with open(list_file) as file:
+                paths = file.read().splitlines()
+            self.assertEqual(
+                paths, [os.path.join(img_dir, "1.jpg"), os.path.join(img_dir, "2.jpg")]
+            )
+            with self.assertRaises(ImageListError):
+                write_image_list(
+                    self.img_list,
+                    self.lbl_list,
+                    img_dir,
+                    tmp + "/annotations",
+                    list_file,
+                )
+
+    def test_write_shards(self):
+        """Checks if images and labels are packed into shards at the offsets listed in the index"""
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, (image, label) in enumerate(zip(self.img_list, self.lbl_list)):
+                Image.new("RGB", (20 + i, 10)).save(os.path.join(tmp, image))
+                with open(os.path.join(tmp, label), "w") as file:
+                    file.write(f"{i % 3} 0.5 0.5 0.2 0.2\n" if i else "")
+            index_file = os.path.join(tmp, "shards", "training.json")
+            index = write_shards(
+                self.img_list, self.lbl_list, tmp, tmp, index_file, 1500, 2
+            )
+            with open(index_file) as file:
+                self.assertEqual(json.load(file), index)
+            shards = index["shards"]
+            self.assertGreater(len(shards), 1)
+            self.assertEqual(shards[0]["file"], "training-000000.tar")
+            samples = [x for shard in shards for x in shard["samples"]]
+            self.assertEqual([x["image"] for x in samples], self.img_list)
+            self.assertEqual(samples[0]["labels"], [])
+            self.assertEqual(samples[2]["labels"], [[2, 0.5, 0.5, 0.2, 0.2]])
+            self.assertEqual(samples[4]["shape"], [24, 10])
+            for shard in shards:
+                path = os.path.join(tmp, "shards", shard["file"])
+                with tarfile.open(path) as tar:
+                    names = tar.getnames()
+                with open(path, "rb") as file:
+                    data = file.read()
+                for x in shard["samples"]:
+                    self.assertIn(x["image"].replace(".jpg", ".txt"), names)
+                    with open(os.path.join(tmp, x["image"]), "rb") as file:
+                        self.assertEqual(
+                            data[x["offset"] : x["offset"] + x["size"]], file.read()
+                        )
+
+    def test_imap_bounded(self):
+        """Checks if the results are returned in order with a bounded number of items submitted ahead"""
+        submitted = []
+
+        def items():
+            for i in range(100):
+                submitted.append(i)
+                yield i
+
+        with ThreadPool(4) as pool:
+            for i, result in enumerate(imap_bounded(pool, lambda x: x * x, items(), 8)):
+                self.assertEqual(result, i * i)
+                self.assertLessEqual(len(submitted), i + 8)
+
 
 if __name__ == "__main__":
     unittest.main()
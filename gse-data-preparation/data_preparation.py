@@ -20,10 +20,19 @@
 # SPDX-License-Identifier: MIT
 
 import argparse
+import io
+import json
+import numpy as np
 import os
 import pandas as pd
 import shutil
+import tarfile
 import yaml
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from multiprocessing.pool import ThreadPool
+from PIL import Image
 from sklearn.model_selection import train_test_split
 
 cnvrg_workdir = os.environ.get("CNVRG_WORKDIR", "/cnvrg")
@@ -108,6 +117,30 @@ class DatasetNamingError(Exception):
         return f"DatasetNamingError: No label found for image {self.image}. Images and labels should have the same file names without extensions!"
 
 
+class LabelContentError(Exception):
+    """Raise if none of the images and labels/annotations can be used for training"""
+
+    def __init__(self, corrupt):
+        super().__init__(corrupt)
+        self.corrupt = corrupt
+
+    def __str__(self):
+        details = "\n".join(f"{image}: {msg}" for image, msg in self.corrupt[:10])
+        return f"LabelContentError: {len(self.corrupt)} images or labels/annotations are invalid, for example:\n{details}"
+
+
+class ImageListError(Exception):
+    """Raise if YOLOv5 cannot find the label of a listed image next to it"""
+
+    def __init__(self, image, label):
+        super().__init__(image, label)
+        self.image = image
+        self.label = label
+
+    def __str__(self):
+        return f"ImageListError: YOLOv5 looks for the label of {self.image} at {yolo_label_path(self.image)}, but it is at {self.label}. Use a split mode other than list, or keep the labels next to the images or in a labels directory next to the images directory!"
+
+
 def parse_parameters():  # pragma: no cover
     """Command line parser."""
     parser = argparse.ArgumentParser(description="""Dataset Preparation""")
@@ -155,6 +188,24 @@ def parse_parameters():  # pragma: no cover
         default=0.3,
         help="""--- Size of validation set as percentage of entire dataset ---""",
     )
+    parser.add_argument(
+        "--split_mode",
+        action="store",
+        dest="split_mode",
+        required=False,
+        default="move",
+        choices=["move", "hardlink", "symlink", "list", "shards"],
+        help="""--- Move, hardlink or symlink the files into training and validation directories, only list the image paths in train.txt and val.txt, or pack them into tar shards ---""",
+    )
+    parser.add_argument(
+        "--split_strategy",
+        action="store",
+        dest="split_strategy",
+        required=False,
+        default="random",
+        choices=["random", "stratified"],
+        help="""--- Split images at random, or stratified on the rarest class and number of objects in every image ---""",
+    )
     return parser.parse_args()
 
 
@@ -206,6 +257,7 @@ def validate_dataset(
 
     Checks if number of images is same as number of labels.
     Raises an error if an image does not have a corresponding label/annotation file.
+    The label of every image is named after the image, so the lists are returned in pairs.
 
     Args:
         data_dir_list:  list containing names of all files present in the data directory
@@ -220,8 +272,8 @@ def validate_dataset(
         NumberOfClassesError: If number of classes is less than 1
 
     Returns:
-        image_list: a list containing filenames for images
-        label_list: a list containing filenames for labels/annotations
+        image_list: a sorted list containing filenames for images
+        label_list: a list containing the label/annotation filename of every image in image_list
     """
     image_list, label_list = [], []
 
@@ -239,10 +291,11 @@ def validate_dataset(
     if len(image_list) != len(label_list):
         raise DatasetSizeError(len(image_list), len(label_list))
 
-    for image in image_list:
-        image_name = image.split(".")[0]
-        label_file = image_name + ".txt"
-        if label_file not in label_list:
+    label_set = set(label_list)
+    image_list.sort()
+    label_list = [image.rsplit(".", 1)[0] + ".txt" for image in image_list]
+    for image, label_file in zip(image_list, label_list):
+        if label_file not in label_set:
             raise DatasetNamingError(image)
 
     if len(class_list) < 1:
@@ -251,13 +304,173 @@ def validate_dataset(
     return image_list, label_list
 
 
-def train_valid_split(images, labels, valid_size):
+def verify_label(args):
+    """Checks the contents of an image and its label/annotation file
+
+    Applies the checks of YOLOv5's verify_image_label, except that only the image header is read.
+
+    Args:
+        args: a tuple of the image path, the label/annotation path and the number of classes
+
+    Returns:
+        image: the image path
+        shape: the (width, height) of the image
+        classes: an array containing the class of every object, or None if the files are invalid
+        msg: a description of the problem, or an empty string
+    """
+    image, label, num_classes = args
+    try:
+        with Image.open(image) as im:  # only reads the header
+            shape = im.size
+            assert (shape[0] > 9) & (shape[1] > 9), f"image size {shape} <10 pixels"
+            assert im.format, "unknown image format"
+
+        with open(label) as f:
+            lb = [x.split() for x in f.read().strip().splitlines() if len(x)]
+        if any(len(x) > 6 for x in lb):  # segments
+            coords = np.concatenate([np.array(x[1:], dtype=np.float32) for x in lb])
+            lb = np.array([[x[0]] for x in lb], dtype=np.float32)
+        else:  # boxes
+            lb = np.array(lb, dtype=np.float32) if lb else np.zeros((0, 5), np.float32)
+            assert (
+                lb.shape[1] == 5
+            ), f"labels require 5 columns, {lb.shape[1]} columns detected"
+            coords = lb[:, 1:]
+        classes = lb[:, 0]
+        bad = (classes < 0) | (classes >= num_classes) | (classes != classes.round())
+        assert not bad.any(), f"class ids {classes[bad]} not in 0-{num_classes - 1}"
+        bad = (coords < 0) | (coords > 1)
+        assert not bad.any(), f"non-normalized coordinates {coords[bad]}"
+        return image, shape, classes.astype(int), ""
+    except Exception as e:
+        return image, None, None, str(e)
+
+
+def validate_labels(images, labels, img_src, lbl_src, class_list, workers=8):
+    """Validates the contents of all images and labels/annotations in a pool of threads
+
+    The results are aggregated as they arrive, so memory does not grow with the dataset.
+
+    Args:
+        images: a list containing filenames for images
+        labels: a list containing the label/annotation filenames of the images
+        img_src: directory containing the images
+        lbl_src: directory containing the labels/annotations
+        class_list: A list containing all classes/categories in the dataset
+        workers: number of threads
+
+    Returns:
+        report: a dictionary summarizing the dataset, with the number of images, empty labels and objects,
+            the number of objects per class, the smallest and largest image sizes and a list of
+            (image, problem) tuples for invalid images or labels
+        class_counts: an array with the number of objects per class (columns) of every image (rows)
+    """
+    nc = len(class_list)
+    class_counts = np.zeros((len(images), nc), dtype=np.int32)
+    min_size, max_size = np.full(2, np.inf), np.zeros(2)
+    report = {"images": len(images), "empty": 0, "corrupt": []}
+    args = (
+        (os.path.join(img_src, image), os.path.join(lbl_src, label), nc)
+        for image, label in zip(images, labels)
+    )
+    index = {os.path.join(img_src, image): i for i, image in enumerate(images)}
+    with ThreadPool(max(workers, 1)) as pool:
+        for image, shape, classes, msg in pool.imap_unordered(verify_label, args, 64):
+            if msg:
+                report["corrupt"].append((image, msg))
+                continue
+            report["empty"] += len(classes) == 0
+            class_counts[index[image]] = np.bincount(classes, minlength=nc)
+            min_size = np.minimum(min_size, shape)
+            max_size = np.maximum(max_size, shape)
+    instances = class_counts.sum(axis=0, dtype=np.int64)
+    report["objects"] = int(instances.sum())
+    report["instances"] = dict(zip(class_list, instances.tolist()))
+    if len(report["corrupt"]) < len(images):
+        report["min_size"] = min_size.astype(int).tolist()
+        report["max_size"] = max_size.astype(int).tolist()
+    return report, class_counts
+
+
+def remove_corrupt(images, labels, class_counts, corrupt, img_src):
+    """Removes the images listed as invalid by validate_labels, together with their labels/annotations
+
+    Args:
+        images: a list containing filenames for images
+        labels: a list containing the label/annotation filename of every image in images
+        class_counts: an array with the number of objects per class (columns) of every image (rows)
+        corrupt: a list of (image path, problem) tuples, as in the report of validate_labels
+        img_src: directory containing the images
+
+    Returns:
+        images: a list containing filenames for the valid images
+        labels: a list containing the label/annotation filename of every valid image
+        class_counts: an array with the number of objects per class of every valid image
+    """
+    corrupt = {image for image, _ in corrupt}
+    keep = np.array(
+        [os.path.join(img_src, image) not in corrupt for image in images], dtype=bool
+    )
+    images = [image for image, k in zip(images, keep) if k]
+    labels = [label for label, k in zip(labels, keep) if k]
+    return images, labels, class_counts[keep]
+
+
+def stratified_split(class_counts, valid_size, random_state=42):
+    """Selects a validation set with the same class and object count distribution as the dataset
+
+    Every image is assigned to a stratum made of the rarest class it contains and the log2 bin of
+    its number of objects. The images of every stratum are shuffled and the first valid_size share
+    of them is used for validation, rounded so that the strata with the largest remainders (ties
+    broken at random) make up the total. Every stratum with at least two images keeps at least one
+    image in both sets, so rare classes and object counts are not lost.
+
+    Args:
+        class_counts: an array with the number of objects per class (columns) of every image (rows)
+        valid_size: size of validation set as percentage of entire dataset
+        random_state: seed for shuffling the images and breaking ties between strata
+
+    Returns:
+        valid: a boolean array which is True for the images in the validation set
+    """
+    rng = np.random.default_rng(random_state)
+    n, nc = class_counts.shape
+    presence = class_counts > 0
+    by_frequency = np.argsort(presence.sum(axis=0), kind="stable")
+    rarest = by_frequency[presence[:, by_frequency].argmax(axis=1)]
+    rarest[~presence.any(axis=1)] = nc  # images without objects
+    objects = class_counts.sum(axis=1)
+    count_bin = np.floor(np.log2(np.maximum(objects, 1))).astype(np.int64) + (
+        objects > 0
+    )
+    strata = rarest.astype(np.int64) * (count_bin.max() + 1) + count_bin
+
+    # Group the shuffled images by stratum and take the first images of every stratum
+    order = rng.permutation(n)
+    order = order[np.argsort(strata[order], kind="stable")]
+    _, inverse, sizes = np.unique(
+        strata[order], return_inverse=True, return_counts=True
+    )
+    quota = sizes * float(valid_size)
+    num_valid = np.floor(quota).astype(int)
+    extra = int(round(n * float(valid_size))) - num_valid.sum()
+    num_valid[np.lexsort((rng.random(len(sizes)), num_valid - quota))[:extra]] += 1
+    num_valid = np.where(sizes > 1, np.clip(num_valid, 1, sizes - 1), num_valid)
+    rank = np.arange(n) - (np.cumsum(sizes) - sizes)[inverse]
+    valid = np.zeros(n, dtype=bool)
+    valid[order] = rank < num_valid[inverse]
+    return valid
+
+
+def train_valid_split(images, labels, valid_size, class_counts=None):
     """Splits data into training and validation sets
 
     Args:
         images: a list containing filenames for images
-        labels: a list containing filenames for labels/annotations
+        labels: a list containing the label/annotation filename of every image in images
         valid_size: size of validation set as percentage of entire dataset
+        class_counts: an array with the number of objects per class of every image, in the order
+            of images. If given, the split is stratified on the classes and number of objects.
 
     Returns:
         train_images: a list containing image filenames from the training set
@@ -265,14 +478,223 @@ def train_valid_split(images, labels, valid_size):
         train_labels: a list containing label/annotation filenames from the training set
         train_labels: a list containing label/annotation filenames from the validation set
     """
-    images.sort()
-    labels.sort()
+    order = sorted(range(len(images)), key=images.__getitem__)
+    images, labels = [images[i] for i in order], [labels[i] for i in order]
+    if class_counts is not None:
+        valid = stratified_split(class_counts[order], valid_size)
+        train_images = [image for image, v in zip(images, valid) if not v]
+        val_images = [image for image, v in zip(images, valid) if v]
+        train_labels = [label for label, v in zip(labels, valid) if not v]
+        val_labels = [label for label, v in zip(labels, valid) if v]
+        return train_images, val_images, train_labels, val_labels
     train_images, val_images, train_labels, val_labels = train_test_split(
         images, labels, test_size=float(valid_size), random_state=42
     )
     return train_images, val_images, train_labels, val_labels
 
 
+def yolo_label_path(image_path):
+    """Returns the path YOLOv5 reads the label of an image from
+
+    The last /images/ directory in the image path is replaced by /labels/, so labels are either
+    in a labels directory next to the images directory or next to the images themselves.
+
+    Args:
+        image_path: path to an image
+
+    Returns:
+        label_path: path to the label/annotation file of the image
+    """
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return sb.join(image_path.rsplit(sa, 1)).rsplit(".", 1)[0] + ".txt"
+
+
+def transfer_file(src, dst_dir, split_mode):
+    """Moves, hardlinks or symlinks a file into a directory
+
+    Hardlinks fall back to copies if the directory is on a different filesystem.
+
+    Args:
+        src: path to the file
+        dst_dir: directory to transfer the file to
+        split_mode: move, hardlink or symlink
+
+    Returns:
+        dst: path to the transferred file
+    """
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    if split_mode == "move":
+        shutil.move(src, dst)
+    elif split_mode == "symlink":
+        os.symlink(os.path.abspath(src), dst)
+    else:
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+    return dst
+
+
+def transfer_files(files, dst_dir, split_mode, workers):
+    """Transfers files into a directory with a pool of threads, as every transfer mostly waits on the filesystem
+
+    Args:
+        files: a list of paths to files
+        dst_dir: directory to transfer the files to
+        split_mode: move, hardlink or symlink
+        workers: number of threads
+
+    Returns:
+        dst_files: a list of paths to the transferred files
+    """
+    with ThreadPoolExecutor(max(workers, 1)) as pool:
+        return list(pool.map(transfer_file, files, repeat(dst_dir), repeat(split_mode)))
+
+
+def write_image_list(images, labels, img_src, lbl_src, list_file):
+    """Writes the absolute paths of images to a list file that YOLOv5 reads instead of a directory
+
+    Args:
+        images: a list containing image filenames
+        labels: a list containing the label/annotation filenames of the images
+        img_src: directory containing the images
+        lbl_src: directory containing the labels/annotations
+        list_file: path to the list file
+
+    Raises:
+        ImageListError: If YOLOv5 would not find the label of an image
+    """
+    paths = [os.path.abspath(os.path.join(img_src, image)) for image in images]
+    for path, label in zip(paths, labels):
+        label = os.path.abspath(os.path.join(lbl_src, label))
+        if yolo_label_path(path) != label:
+            raise ImageListError(path, label)
+    with open(list_file, "w") as file:
+        file.write("".join(f"{path}\n" for path in paths))
+
+
+def read_sample(args):
+    """Reads an image and its label/annotation file to pack them into a shard
+
+    Args:
+        args: a tuple of the image path and the label/annotation path
+
+    Returns:
+        data: the contents of the image file
+        text: the contents of the label/annotation file
+        shape: the (width, height) of the image after applying its EXIF orientation, as YOLOv5 does
+    """
+    image, label = args
+    with open(image, "rb") as f:
+        data = f.read()
+    with open(label, "rb") as f:
+        text = f.read()
+    with Image.open(io.BytesIO(data)) as im:  # only reads the header
+        shape = im.size
+        if im.getexif().get(274) in (6, 8):  # rotated by 90 or 270 degrees
+            shape = shape[::-1]
+    return data, text, shape
+
+
+def imap_bounded(pool, func, iterable, size):
+    """Applies a function to every item in a pool of threads, like pool.imap, with at most size results pending
+
+    pool.imap submits all items at once, so the results of a slow consumer pile up in memory.
+
+    Args:
+        pool: a ThreadPool
+        func: the function to apply
+        iterable: the items to apply it to
+        size: the largest number of items submitted but not yet returned
+
+    Yields:
+        result: the result of every item, in the order of the items
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= size:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def add_tar_member(tar, name, data):
+    """Appends a file to a tar archive
+
+    Args:
+        tar: tar archive opened for writing
+        name: name of the file in the archive
+        data: contents of the file
+
+    Returns:
+        offset: position of the contents in the archive
+    """
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+    blocks = -(-len(data) // tarfile.BLOCKSIZE)  # contents are padded to full blocks
+    return tar.offset - blocks * tarfile.BLOCKSIZE
+
+
+def write_shards(images, labels, img_src, lbl_src, index_file, shard_size, workers=8):
+    """Packs images and their labels/annotations into tar shards of about shard_size bytes
+
+    The shards follow the WebDataset layout: every image is stored as <name>.<ext>, followed by
+    its labels/annotations as <name>.txt, so a shard is read with one sequential pass. The shards
+    are written next to the index file, which lists the offset, size and (width, height) of every
+    image in them together with its label rows, so the labels are known without opening the
+    shards. The files are read ahead in a pool of threads, up to 4 samples per thread.
+
+    Args:
+        images: a list containing image filenames
+        labels: a list containing the label/annotation filenames of the images
+        img_src: directory containing the images
+        lbl_src: directory containing the labels/annotations
+        index_file: path to the .json index, i.e. shards/training.json for shards/training-000000.tar, ..
+        shard_size: size in bytes at which the next shard is started
+        workers: number of threads
+
+    Returns:
+        index: a dictionary with the list of shards, each with its file name and samples
+    """
+    shard_dir, name = os.path.split(os.path.splitext(index_file)[0])
+    os.makedirs(shard_dir or ".", exist_ok=True)
+    shards, tar = [], None
+    args = (
+        (os.path.join(img_src, image), os.path.join(lbl_src, label))
+        for image, label in zip(images, labels)
+    )
+    with ThreadPool(max(workers, 1)) as pool:
+        samples = imap_bounded(pool, read_sample, args, 4 * max(workers, 1))
+        for image, (data, text, shape) in zip(images, samples):
+            if tar is None or tar.offset >= shard_size:
+                if tar is not None:
+                    tar.close()
+                shards.append({"file": f"{name}-{len(shards):06d}.tar", "samples": []})
+                tar = tarfile.open(os.path.join(shard_dir, shards[-1]["file"]), "w")
+            image = os.path.basename(image)
+            offset = add_tar_member(tar, image, data)
+            add_tar_member(tar, os.path.splitext(image)[0] + ".txt", text)
+            rows = [x.split() for x in text.decode().strip().splitlines() if len(x)]
+            shards[-1]["samples"].append(
+                {
+                    "image": image,
+                    "offset": offset,
+                    "size": len(data),
+                    "shape": list(shape),
+                    "labels": [[float(v) for v in x] for x in rows],
+                }
+            )
+    if tar is not None:
+        tar.close()
+    index = {"shards": shards}
+    with open(index_file + ".tmp", "w") as file:  # only complete indexes are read
+        json.dump(index, file)
+    os.replace(index_file + ".tmp", index_file)
+    return index
+
+
 def prepare_dataset(
     data_directory,
     img_directory,
@@ -283,8 +705,39 @@ def prepare_dataset(
     train_labels,
     val_labels,
     config_dict,
+    split_mode="move",
 ):  # pragma: no cover
-    """Creates training and validation directories and moves these to the output directory"""
+    """Creates training and validation directories in the output directory and moves, hardlinks or symlinks the files into them, writes lists of the images in place, or packs them into shards"""
+    img_src, lbl_src = img_directory, lbl_directory
+    if data_directory.lower() != "none":
+        img_src, lbl_src = data_directory, data_directory
+
+    if split_mode == "list":
+        os.makedirs(output_dir, exist_ok=True)
+        for images, labels, key in (
+            (train_images, train_labels, "training_list_file"),
+            (val_images, val_labels, "validation_list_file"),
+        ):
+            list_file = os.path.join(output_dir, config_dict[key])
+            write_image_list(images, labels, img_src, lbl_src, list_file)
+        return
+
+    if split_mode == "shards":
+        for images, labels, key in (
+            (train_images, train_labels, "training_shards_index"),
+            (val_images, val_labels, "validation_shards_index"),
+        ):
+            write_shards(
+                images,
+                labels,
+                img_src,
+                lbl_src,
+                os.path.join(output_dir, config_dict[key]),
+                config_dict["shard_size_mb"] * 2**20,
+                config_dict["transfer_workers"],
+            )
+        return
+
     train_img_dst = os.path.join(output_dir, config_dict["training_images_dir"])
     train_lbl_dst = os.path.join(output_dir, config_dict["training_labels_dir"])
     valid_img_dst = os.path.join(output_dir, config_dict["validation_images_dir"])
@@ -294,30 +747,44 @@ def prepare_dataset(
     os.makedirs(valid_img_dst, exist_ok=True)
     os.makedirs(valid_lbl_dst, exist_ok=True)
 
-    img_src, lbl_src = img_directory, lbl_directory
-    if data_directory.lower() != "none":
-        img_src, lbl_src = data_directory, data_directory
-
-    for i in range(len(train_images)):
-        shutil.move(os.path.join(img_src, train_images[i]), train_img_dst)
-        shutil.move(os.path.join(lbl_src, train_labels[i]), train_lbl_dst)
-
-    for i in range(len(val_images)):
-        shutil.move(os.path.join(img_src, val_images[i]), valid_img_dst)
-        shutil.move(os.path.join(lbl_src, val_labels[i]), valid_lbl_dst)
+    for files, src, dst in (
+        (train_images, img_src, train_img_dst),
+        (train_labels, lbl_src, train_lbl_dst),
+        (val_images, img_src, valid_img_dst),
+        (val_labels, lbl_src, valid_lbl_dst),
+    ):
+        files = [os.path.join(src, file) for file in files]
+        transfer_files(files, dst, split_mode, config_dict["transfer_workers"])
 
 
-def create_dataset_config(class_list, output_dir, config_dict):  # pragma: no cover
+def create_dataset_config(
+    class_list, output_dir, config_dict, split_mode="move"
+):  # pragma: no cover
     """Creates a dataset configuration (.yaml) file in the output directory"""
     yaml_file = open(os.path.join(output_dir, config_dict["dataset_yaml_file"]), "w+")
 
     # Define keys for paths to training and validation sets
-    yaml_file.write(
-        f"{config_dict['train_key']}: ./{config_dict['training_images_dir']}/\n"
-    )
-    yaml_file.write(
-        f"{config_dict['valid_key']}: ./{config_dict['validation_images_dir']}/\n"
-    )
+    if split_mode == "shards":
+        yaml_file.write(
+            f"{config_dict['train_key']}: ./{config_dict['training_shards_index']}\n"
+        )
+        yaml_file.write(
+            f"{config_dict['valid_key']}: ./{config_dict['validation_shards_index']}\n"
+        )
+    elif split_mode == "list":
+        yaml_file.write(
+            f"{config_dict['train_key']}: ./{config_dict['training_list_file']}\n"
+        )
+        yaml_file.write(
+            f"{config_dict['valid_key']}: ./{config_dict['validation_list_file']}\n"
+        )
+    else:
+        yaml_file.write(
+            f"{config_dict['train_key']}: ./{config_dict['training_images_dir']}/\n"
+        )
+        yaml_file.write(
+            f"{config_dict['valid_key']}: ./{config_dict['validation_images_dir']}/\n"
+        )
 
     # Define keys for number of classes and class names
     yaml_file.write(f"{config_dict['num_classes']}: {len(class_list)}\n")
@@ -362,12 +829,37 @@ def data_preparation_main():  # pragma: no cover
         data_dir_contents, img_dir_contents, lbl_dir_contents, image_formats, class_list
     )
 
+    # Check the contents of all images and labels and save a summary report
+    img_src, lbl_src = args.image_dir, args.label_dir
+    if args.data_dir.lower() != "none":
+        img_src, lbl_src = args.data_dir, args.data_dir
+    report, class_counts = validate_labels(
+        images, labels, img_src, lbl_src, class_list, config["validation_workers"]
+    )
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, config["report_file"]), "w") as file:
+        json.dump(report, file, indent=2)
+    print(
+        f"{report['images']} images, {report['objects']} objects, {report['empty']} empty and {len(report['corrupt'])} invalid labels"
+    )
+    if len(report["corrupt"]) == len(images):
+        raise LabelContentError(report["corrupt"])
+    if report["corrupt"]:
+        print(
+            f"WARNING: Skipping {len(report['corrupt'])} invalid images or labels/annotations, listed in {config['report_file']}"
+        )
+        images, labels, class_counts = remove_corrupt(
+            images, labels, class_counts, report["corrupt"], img_src
+        )
+
     # Split dataset into training and validation sets
+    if args.split_strategy == "random":
+        class_counts = None
     train_images, valid_images, train_labels, valid_labels = train_valid_split(
-        images, labels, args.valid_size
+        images, labels, args.valid_size, class_counts
     )
 
-    # Move training and validation datasets to output directory
+    # Move, link, list or pack training and validation datasets in output directory
     prepare_dataset(
         args.data_dir,
         args.image_dir,
@@ -378,10 +870,11 @@ def data_preparation_main():  # pragma: no cover
         train_labels,
         valid_labels,
         config,
+        args.split_mode,
     )
 
     # Create a dataset configuration (.yaml) file in output directory
-    create_dataset_config(class_list, args.output_dir, config)
+    create_dataset_config(class_list, args.output_dir, config, args.split_mode)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""
+Benchmark the per-image NMS loop against batched NMS over the whole batch
+
+non_max_suppression loops over the images of the batch, batched_non_max_suppression scores
+and filters the candidates of all images at once and makes a single NMS call. The batched
+path is used by non_max_suppression(batched=True), the default on CUDA, for batches of at
+most max_nms candidates, as the cost of one NMS call grows with the square of its boxes.
+On CPU it only pays off with few candidates per image, so it is off there by default.
+
+Both run on the same synthetic YOLOv5 predictions (clustered boxes, peaked class scores like
+a trained model) for every batch size, in an inference setting (conf 0.25) and a validation
+setting (conf 0.001, multi-label). Their detections are compared before timing, and the
+best time of a few repeats is reported with the number of candidates of the batch.
+
+Usage:
+    $ python benchmark_nms.py --batch-sizes 1 2 4 8 16 32 64 --threads 1 --device 0
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+
+from utils.general import (
+    LOGGER,
+    batched_non_max_suppression,
+    non_max_suppression,
+    print_args,
+)
+from utils.torch_utils import select_device
+
+SETTINGS = {
+    "inference": dict(conf_thres=0.25, iou_thres=0.45, max_det=1000),
+    "validation": dict(conf_thres=0.001, iou_thres=0.6, multi_label=True, max_det=300),
+}
+
+
+def synthetic_predictions(bs, anchors=25200, nc=80, seed=0):
+    # YOLOv5s-like output at 640 pixels, boxes clustered around 40 objects per image
+    g = torch.Generator().manual_seed(seed)
+    p = torch.rand(bs, anchors, 5 + nc, generator=g)
+    centres = torch.rand(bs, 40, 2, generator=g) * 640
+    k = torch.randint(0, 40, (bs, anchors), generator=g)
+    p[..., :2] = torch.gather(centres, 1, k[..., None].expand(-1, -1, 2))
+    p[..., :2] += torch.randn(bs, anchors, 2, generator=g) * 8
+    p[..., 2:4] = 40 + torch.rand(bs, anchors, 2, generator=g) * 80
+    p[..., 4] = p[..., 4] ** 350  # few confident anchors
+    p[..., 5:] = p[..., 5:] ** 180  # peaked class scores
+    return p
+
+
+def same_detections(a, b):
+    # Equal sets of detections per image, detections with equal confidence may swap order
+    return all(
+        x.shape == y.shape
+        and {tuple(r.tolist()) for r in x} == {tuple(r.tolist()) for r in y}
+        for x, y in zip(a, b)
+    )
+
+
+def best_time(f, prediction, repeats, **kwargs):
+    # Best of 5 runs of the mean time per call, in milliseconds
+    f(prediction.clone(), **kwargs)  # warmup
+    times = []
+    for _ in range(5):
+        inputs = [prediction.clone() for _ in range(repeats)]  # NMS scales in place
+        if prediction.is_cuda:
+            torch.cuda.synchronize()
+        t = time.perf_counter()
+        for p in inputs:
+            f(p, **kwargs)
+        if prediction.is_cuda:
+            torch.cuda.synchronize()
+        times.append((time.perf_counter() - t) / repeats * 1e3)
+    return min(times)
+
+
+def run(batch_sizes=(1, 2, 4, 8, 16, 32, 64), threads=1, calls=64, device="cpu"):
+    torch.set_num_threads(threads)
+    device = select_device(device)
+    prediction = synthetic_predictions(max(batch_sizes)).to(device)
+    for name, kwargs in SETTINGS.items():
+        LOGGER.info(f"\n{name}: {kwargs}")
+        LOGGER.info(
+            f"{'bs':>4}{'candidates':>12}{'loop ms':>12}{'batched ms':>12}{'speedup':>9}{'det/img':>9}"
+        )
+        for bs in batch_sizes:
+            p = prediction[:bs].contiguous()
+            a = non_max_suppression(p.clone(), batched=False, **kwargs)
+            b = batched_non_max_suppression(p.clone(), **kwargs)
+            assert same_detections(a, b), f"detections differ at batch size {bs}"
+            repeats = max(1, calls // bs)
+            t0 = best_time(non_max_suppression, p, repeats, batched=False, **kwargs)
+            t1 = best_time(batched_non_max_suppression, p, repeats, **kwargs)
+            nc = int((p[..., 4] > kwargs["conf_thres"]).sum())  # candidates
+            n = sum(len(x) for x in a) / bs
+            LOGGER.info(
+                f"{bs:>4}{nc:>12}{t0:>12.2f}{t1:>12.2f}{t0 / t1:>8.2f}x{n:>9.0f}"
+            )
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--batch-sizes",
+        nargs="+",
+        type=int,
+        default=[1, 2, 4, 8, 16, 32, 64],
+        help="batch sizes to benchmark",
+    )
+    parser.add_argument("--threads", type=int, default=1, help="torch CPU threads")
+    parser.add_argument(
+        "--calls", type=int, default=64, help="images per timed run of each batch size"
+    )
+    parser.add_argument(
+        "--device", default="cpu", help="cuda device, i.e. 0 or 0,1,2,3 or cpu"
+    )
+    opt = parser.parse_args()
+    print_args(vars(opt))
+    return opt
+
+
+def main(opt):
+    run(**vars(opt))
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    main(opt)
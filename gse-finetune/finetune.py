@@ -20,6 +20,7 @@
 # SPDX-License-Identifier: MIT
 
 import argparse
+import glob
 import os
 import shutil
 import yaml
@@ -95,6 +96,41 @@ def parse_parameters():  # pragma: no cover
         default=cnvrg_workdir,
         help="""--- The path to save library artifacts to ---""",
     )
+    parser.add_argument(
+        "--fitness",
+        action="store",
+        dest="fitness",
+        required=False,
+        default="count",
+        choices=["map", "count"],
+        help="""--- Select the best model by the object count error (count) or by mAP (map) on the validation images ---""",
+    )
+    parser.add_argument(
+        "--cache_images",
+        action="store",
+        dest="cache_images",
+        required=False,
+        default="none",
+        choices=["none", "ram", "disk", "packed"],
+        help="""--- Cache the training and validation images in RAM, as .npy files next to the images, or as one memory-mapped file of resized images shared by all dataloader workers (packed) ---""",
+    )
+    parser.add_argument(
+        "--export_formats",
+        action="store",
+        dest="export_formats",
+        required=False,
+        default="none",
+        help="""--- Comma-separated formats to export the trained model to, next to best.pt, i.e. onnx,openvino, or none ---""",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store",
+        dest="quantize",
+        required=False,
+        default="false",
+        choices=["true", "false"],
+        help="""--- true to also build an INT8 OpenVINO model, kept only if its mAP and count error on the validation images are close to the trained model ---""",
+    )
     return parser.parse_args()
 
 
@@ -122,10 +158,23 @@ def validate_file_locations(img_dir, lbl_dir, data_config):
         raise ConfigNotFoundError(data_config)
 
 
+def find_best_weights(project_loc):
+    """Returns the best.pt file of the latest training run in project_loc, or None"""
+    weights = glob.glob(os.path.join(project_loc, "*", "weights", "best.pt"))
+    return max(weights, key=os.path.getmtime) if weights else None
+
+
 def move_data_files(config_dict):  # pragma: no cover
-    """Moves directories and the dataset config file to the working directory"""
-    shutil.move(config_dict["images_loc"], config_dict["move_dest"])
-    shutil.move(config_dict["labels_loc"], config_dict["move_dest"])
+    """Moves directories, image lists or shards and the dataset config file to the working directory"""
+    for key in (
+        "images_loc",
+        "labels_loc",
+        "train_list_loc",
+        "valid_list_loc",
+        "shards_loc",
+    ):
+        if os.path.exists(config_dict[key]):
+            shutil.move(config_dict[key], config_dict["move_dest"])
     shutil.move(config_dict["config_loc"], config_dict["move_dest"])
 
 
@@ -139,21 +188,56 @@ def finetune_main():  # pragma: no cover
         os.path.dirname(os.path.abspath(__file__)) + "/finetune_config.yaml", "r"
     ) as file:
         config_dict = yaml.load(file, Loader=yaml.FullLoader)
-    validate_file_locations(
-        config_dict["images_loc"], config_dict["labels_loc"], config_dict["config_loc"]
-    )
+    if os.path.exists(config_dict["train_list_loc"]) or os.path.exists(
+        config_dict["shards_loc"]
+    ):  # images listed in place or packed into shards
+        if not os.path.exists(config_dict["config_loc"]):
+            raise ConfigNotFoundError(config_dict["config_loc"])
+    else:
+        validate_file_locations(
+            config_dict["images_loc"],
+            config_dict["labels_loc"],
+            config_dict["config_loc"],
+        )
 
     # Move data directories and config file to current working directory
     move_data_files(config_dict)
 
+    # Keep verified labels and image shapes by file contents, so that they are
+    # reused by later runs on the same images wherever they were moved to
+    os.environ["YOLOV5_LABEL_CACHE_DIR"] = config_dict["label_cache_dir"]
+
     # Run YOLOv5 training script
     dataset_yaml_loc = config_dict["config_loc_new"]
     project_loc = args.output_dir + config_dict["project_name"]
-    command = f"python train.py --weights {args.model_weights} --batch {args.batch_size} --epochs {args.num_epochs} --data {dataset_yaml_loc} --project {project_loc}"
+    command = f"python train.py --weights {args.model_weights} --batch {args.batch_size} --epochs {args.num_epochs} --data {dataset_yaml_loc} --project {project_loc} --fitness {args.fitness}"
+    if args.cache_images != "none":
+        command += f" --cache {args.cache_images}"
     exit_code = os.system(command)
     if exit_code != 0:
         raise CommandFailedError(exit_code)
 
+    # Export the trained model so inference can pick the fastest backend, the
+    # trained weights are kept and used as they are if the export fails
+    formats = [f for f in args.export_formats.split(",") if f and f != "none"]
+    weights = find_best_weights(project_loc)
+    if formats and weights:
+        command = f"python export.py --weights {weights} --include {' '.join(formats)} --dynamic"
+        exit_code = os.system(command)
+        if exit_code != 0:
+            print(
+                f"WARNING: Export to {args.export_formats} failed with exit code {exit_code}, keeping {weights}"
+            )
+
+    # Quantize to INT8, calibrated and validated on the validation images
+    if args.quantize.lower() == "true" and weights:
+        command = f"python quantize.py --weights {weights} --data {dataset_yaml_loc}"
+        exit_code = os.system(command)
+        if exit_code != 0:
+            print(
+                f"WARNING: INT8 quantization failed with exit code {exit_code}, keeping {weights}"
+            )
+
 
 if __name__ == "__main__":
     finetune_main()
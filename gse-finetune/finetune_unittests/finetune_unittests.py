@@ -5,11 +5,23 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import pandas as pd
 import numpy as np
+import json
 import shutil
+import tarfile
+import tempfile
+import torch
 import unittest
 import yaml
+from pathlib import Path
 from finetune import DirectoryNotFoundError, ConfigNotFoundError
-from finetune import validate_file_locations
+from finetune import find_best_weights, validate_file_locations
+from quantize import object_counts
+from PIL import Image
+from utils.dataloaders import LoadImagesAndLabels, get_content_hash
+from utils.dataloaders import LoadImagesAndLabelsShards
+from utils.general import batched_non_max_suppression, non_max_suppression
+from utils.metrics import count_metrics, fitness
+from utils import dataloaders, s3
 
 np.random.seed(2)
 
@@ -26,10 +38,24 @@ class TestFineTune(unittest.TestCase):
         self.false_img_path = "../images"
         self.false_lbl_path = "../labels"
 
+        # Keep the label store of the training runs and datasets in a temporary directory
+        self.label_cache = tempfile.mkdtemp()
+        self.label_cache_env = os.environ.get("YOLOV5_LABEL_CACHE_DIR")
+        self.label_cache_dir = dataloaders.LABEL_CACHE_DIR
+        os.environ["YOLOV5_LABEL_CACHE_DIR"] = self.label_cache
+        dataloaders.LABEL_CACHE_DIR = Path(self.label_cache)
+
         # Train model using 4 images for 1 epoch for unit-testing
         os.system(self.config["test_command"])
         self.result_csv = pd.read_csv(self.config["run_dir"] + "/results.csv")
 
+    def setUp(self):
+        """Redirects the block cache and local files of s3:// datasets to a temporary directory"""
+        self.s3_cache = tempfile.mkdtemp()
+        self.s3_dirs = s3.S3_CACHE_DIR, s3.S3.cache_dir
+        s3.S3_CACHE_DIR = Path(self.s3_cache)
+        s3.S3.cache_dir = s3.S3_CACHE_DIR / "blocks"
+
     def test_dir_not_found_error(self):
         """Checks for DirectoryNotFoundError if the image or label directory does not exist"""
         with self.assertRaises(DirectoryNotFoundError):
@@ -58,6 +84,200 @@ class TestFineTune(unittest.TestCase):
         """Checks if the yolov5s.pt file was downloaded correctly from the YOLOv5 GitHub repo"""
         self.assertTrue(os.path.exists(self.config["model_loc"]), None)
 
+    def test_find_best_weights(self):
+        """Checks if the best.pt file of the training run is found for the export"""
+        self.assertEqual(
+            find_best_weights("runs/train"),
+            os.path.join(self.config["run_dir"], "weights", "best.pt"),
+        )
+        self.assertIsNone(find_best_weights("runs/missing"))
+
+    def test_object_counts(self):
+        """Checks if objects are counted per class and image from the confident detections"""
+        pred = torch.zeros(2, 3, 7)  # 2 images, 3 boxes, xywh + obj + 2 classes
+        pred[..., :4] = torch.tensor([[10, 10, 4, 4], [30, 30, 4, 4], [50, 50, 4, 4]])
+        pred[..., 5] = 1
+        pred[0, 1, 5:] = torch.tensor([0, 1])  # first image, second box of class 1
+        pred[0, :, 4] = torch.tensor([0.9, 0.9, 0.1])  # 2 confident boxes
+        pred[1, :, 4] = torch.tensor([0.9, 0.9, 0.9])  # 3 confident boxes of class 0
+        targets = torch.tensor(
+            [
+                [0, 0, 0.5, 0.5, 0.1, 0.1],
+                [0, 1, 0.5, 0.5, 0.1, 0.1],
+                [1, 0, 0.5, 0.5, 0.1, 0.1],
+                [1, 1, 0.5, 0.5, 0.1, 0.1],
+            ]
+        )
+        dataloader = [(torch.zeros(2, 3, 64, 64), targets, None, None)]
+        pred_counts, true_counts = object_counts(lambda im: pred, dataloader)
+        self.assertEqual(pred_counts.tolist(), [[1, 1], [3, 0]])
+        self.assertEqual(true_counts.tolist(), [[1, 1], [1, 1]])
+        np.testing.assert_allclose(count_metrics(pred_counts, true_counts)[0], [1, 0.5])
+
+    def test_count_metrics(self):
+        """Checks if the count errors are computed per class and best.pt can be selected by them"""
+        pred = np.array([[2, 0], [3, 1], [0, 0]])  # 3 images, 2 classes
+        true = np.array([[2, 1], [1, 1], [0, 0]])
+        mae, rmse, rel = count_metrics(pred, true)
+        np.testing.assert_allclose(mae, [2 / 3, 1 / 3])
+        np.testing.assert_allclose(rmse, [np.sqrt(4 / 3), np.sqrt(1 / 3)])
+        np.testing.assert_allclose(rel, [2 / 3, 1 / 2])
+        results = np.zeros((2, 10))
+        results[:, 3] = [0.5, 0.4]  # mAP@0.5:0.95
+        results[:, 9] = [0.2, 0.1]  # relative count error
+        self.assertEqual(fitness(results).argmax(), 0)
+        self.assertEqual(fitness(results, "count").argmax(), 1)
+
+    def test_batched_nms(self):
+        """Checks if NMS over the whole batch keeps the same detections as the per-image loop"""
+        pred = torch.rand(4, 500, 8, generator=torch.Generator().manual_seed(0))
+        pred[..., :2] *= 100  # box centres
+        pred[..., 2:4] = 10 + pred[..., 2:4] * 20  # box sizes
+        pred[1, :, 4] = 0  # an image without candidates
+        for kwargs in dict(), dict(multi_label=True, conf_thres=0.1), dict(max_det=5):
+            loop = non_max_suppression(pred.clone(), batched=False, **kwargs)
+            batched = batched_non_max_suppression(pred.clone(), **kwargs)
+            self.assertEqual(len(batched), 4)
+            self.assertEqual(len(batched[1]), 0)
+            for a, b in zip(loop, batched):
+                self.assertTrue(torch.equal(a, b))
+
+    def test_content_hash(self):
+        """Checks if the label cache key follows the file contents and not the file paths"""
+        os.makedirs("runs/moved", exist_ok=True)
+        im, lb = (
+            "images/training/117-with-mask.jpg",
+            "labels/training/117-with-mask.txt",
+        )
+        shutil.copy(im, "runs/moved/img.jpg")
+        shutil.copy(lb, "runs/moved/img.txt")
+        h = get_content_hash((im, lb))
+        self.assertEqual(
+            get_content_hash(("runs/moved/img.jpg", "runs/moved/img.txt")), h
+        )
+        with open("runs/moved/img.txt", "a") as file:
+            file.write("1 0.5 0.5 0.1 0.1\n")
+        self.assertNotEqual(
+            get_content_hash(("runs/moved/img.jpg", "runs/moved/img.txt")), h
+        )
+        self.assertIsNone(get_content_hash(("runs/moved/missing.jpg", lb)))
+
+    def test_packed_cache(self):
+        """Checks if the packed image cache returns the same resized images as decoding them"""
+        for d in ("images", "labels"):
+            shutil.copytree(f"{d}/training", f"runs/packed/{d}/training")
+        dataset = LoadImagesAndLabels("runs/packed/images/training", 64)
+        packed = LoadImagesAndLabels(
+            "runs/packed/images/training", 64, cache_images="packed"
+        )
+        self.assertTrue(os.path.exists("runs/packed/labels/training-64.packed"))
+        for i in range(len(dataset)):
+            im, hw0, hw = packed.load_image(i)
+            self.assertEqual((hw0, hw), dataset.load_image(i)[1:])
+            np.testing.assert_array_equal(im, dataset.load_image(i)[0])
+
+    def test_s3_dataset(self):
+        """Checks if an s3:// dataset loads the same labels and images as the local copy, using moto as S3"""
+        try:
+            import boto3
+            from moto import mock_aws
+        except ImportError:
+            self.skipTest("boto3 and moto are required for the S3 stand-in")
+
+        os.environ.update(
+            AWS_ACCESS_KEY_ID="test",
+            AWS_SECRET_ACCESS_KEY="test",
+            AWS_DEFAULT_REGION="us-east-1",
+        )
+        s3.S3.pid = None  # connect to the moto stand-in
+        s3.S3.clear()
+        with mock_aws():
+            client = boto3.client("s3")
+            client.create_bucket(Bucket="dataset")
+            for d in ("images", "labels"):
+                for f in os.listdir(f"{d}/training"):
+                    client.upload_file(
+                        f"{d}/training/{f}", "dataset", f"{d}/training/{f}"
+                    )
+            dataset = LoadImagesAndLabels(os.path.abspath("images/training"), 64)
+            remote = LoadImagesAndLabels("s3://dataset/images/training", 64)
+            self.assertEqual(len(remote), len(dataset))
+            for i in range(len(dataset)):
+                np.testing.assert_array_equal(remote.labels[i], dataset.labels[i])
+                np.testing.assert_array_equal(
+                    remote.load_image(i)[0], dataset.load_image(i)[0]
+                )
+
+    def test_shard_dataset(self):
+        """Checks if a dataset packed into tar shards streams the same samples as the directories"""
+        os.makedirs("runs/shards", exist_ok=True)
+        images = sorted(os.listdir("images/training"))
+        index = {"shards": []}
+        for i in range(0, len(images), 2):  # 2 images per shard
+            shard = {"file": f"training-{i // 2:06d}.tar", "samples": []}
+            with tarfile.open(f"runs/shards/{shard['file']}", "w") as tar:
+                for image in images[i : i + 2]:
+                    tar.add(f"images/training/{image}", image)
+            with tarfile.open(f"runs/shards/{shard['file']}") as tar:
+                for member in tar.getmembers():
+                    with open(f"labels/training/{Path(member.name).stem}.txt") as f:
+                        rows = [x.split() for x in f.read().splitlines() if x]
+                    shard["samples"].append(
+                        {
+                            "image": member.name,
+                            "offset": member.offset_data,
+                            "size": member.size,
+                            "shape": Image.open(f"images/training/{member.name}").size,
+                            "labels": [[float(v) for v in x] for x in rows],
+                        }
+                    )
+            index["shards"].append(shard)
+        with open("runs/shards/training.json", "w") as f:
+            json.dump(index, f)
+
+        dataset = LoadImagesAndLabels(os.path.abspath("images/training"), 64)
+        shards = LoadImagesAndLabelsShards("runs/shards/training.json", 64)
+        self.assertEqual(len(shards), len(dataset))
+        for i, (im, labels, path, shapes) in enumerate(shards):
+            self.assertEqual(Path(path).name, images[i])
+            self.assertEqual(shapes, dataset[i][3])
+            self.assertTrue(torch.equal(im, dataset[i][0]))
+            self.assertTrue(torch.equal(labels, dataset[i][1]))
+        shards = LoadImagesAndLabelsShards(
+            "runs/shards/training.json", 64, shuffle=True, buffer_size=2
+        )
+        for epoch in range(2):
+            paths = [Path(x[2]).name for x in shards]
+            self.assertEqual(sorted(paths), images)
+
+        # Every DDP rank streams the same number of samples, the last one padded
+        paths = []
+        for rank in range(3):
+            shards.rank, shards.world_size = rank, 3
+            paths.append([Path(x[2]).name for x in shards])
+            self.assertEqual(len(paths[-1]), len(shards))
+        self.assertEqual(len(shards), 2)
+        self.assertEqual(sorted(set(sum(paths, []))), images)
+
+    def test_noval_count_fitness(self):
+        """Checks if training with --noval selects best.pt by the object counts of the final validation"""
+        command = self.config["test_command"].replace("--epochs 1", "--epochs 2")
+        self.assertEqual(
+            os.system(f"{command} --noval --fitness count --name noval"), 0
+        )
+        results = pd.read_csv("runs/train/noval/results.csv")
+        results.columns = [x.strip() for x in results.columns]
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results["metrics/count_rel_error"].iloc[0], 0)
+        self.assertGreater(results["x/lr0"].iloc[0], 0)
+        best, last = (
+            torch.load(f"runs/train/noval/weights/{f}.pt", map_location="cpu")
+            for f in ("best", "last")
+        )
+        # best.pt is the final epoch, the only validated one
+        for k, v in best["model"].state_dict().items():
+            self.assertTrue(torch.equal(v, last["model"].state_dict()[k]))
+
     def test_model_metrics(self):
         """Checks if metrics generated by the model are as expected"""
         self.assertAlmostEqual(
@@ -75,6 +295,11 @@ class TestFineTune(unittest.TestCase):
             self.config["ref_map_0.5_0.95"],
         )
 
+    def tearDown(self):
+        """Restores the s3:// dataset cache and deletes the temporary one"""
+        s3.S3_CACHE_DIR, s3.S3.cache_dir = self.s3_dirs
+        shutil.rmtree(self.s3_cache)
+
     @classmethod
     def tearDownClass(self):
         """Deletes artiacts generated by unittests"""
@@ -82,6 +307,12 @@ class TestFineTune(unittest.TestCase):
         os.remove("./labels/training.cache")
         os.remove("./labels/validation.cache")
         shutil.rmtree("runs")
+        dataloaders.LABEL_CACHE_DIR = self.label_cache_dir
+        if self.label_cache_env is None:
+            os.environ.pop("YOLOV5_LABEL_CACHE_DIR")
+        else:
+            os.environ["YOLOV5_LABEL_CACHE_DIR"] = self.label_cache_env
+        shutil.rmtree(self.label_cache)
 
 
 if __name__ == "__main__":
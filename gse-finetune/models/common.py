@@ -35,6 +35,7 @@ from utils.general import (
     check_suffix,
     check_version,
     colorstr,
+    file_sha256,
     increment_path,
     is_notebook,
     make_divisible,
@@ -817,6 +818,80 @@ class DetectMultiBackend(nn.Module):
         return None, None
 
 
+def exported_weights(weights):
+    # Existing exports of a *.pt model, i.e. best.pt -> [best_int8_openvino_model, best_openvino_model, best.onnx]
+    w = Path(weights)
+    if w.suffix != ".pt":
+        return []
+    exports = (
+        w.with_name(f"{w.stem}_int8_openvino_model"),  # quantize.py
+        w.with_name(f"{w.stem}_openvino_model"),
+        w.with_suffix(".onnx"),
+    )
+    return [str(f) for f in exports if f.exists()]
+
+
+@smart_inference_mode()
+def select_backend(weights, device=torch.device("cpu"), imgsz=(640, 640), runs=3):
+    """Picks the fastest backend for a *.pt model among its OpenVINO and ONNX exports
+
+    Every export found next to the model is loaded with DetectMultiBackend, checked
+    for parity against the PyTorch output on a random batch of two images and timed.
+    Exports that fail to load or differ by more than 0.5 pixels or 1e-3 in score,
+    e.g. stale exports of an earlier model, are skipped. INT8 models were already
+    checked on the validation set by quantize.py, so they are only checked to be
+    quantized from this model.
+
+    Args:
+        weights: path to the *.pt model file
+        device: torch device the model will run on, exports are only used on CPU
+        imgsz: inference size (height, width)
+        runs: number of timed forward passes per backend
+
+    Returns:
+        path to the fastest matching model, weights if there is none
+    """
+    exports = exported_weights(weights)
+    if not exports or device.type != "cpu":
+        return str(weights)
+
+    im = torch.rand(2, 3, *imgsz, generator=torch.Generator().manual_seed(0))
+
+    def profile(w):
+        model = DetectMultiBackend(w, device=device)
+        y = model(im)  # warmup, DetectMultiBackend.warmup() skips CPU devices
+        dt = Profile()
+        for _ in range(runs):
+            with dt:
+                model(im)
+        return (y[0] if isinstance(y, (list, tuple)) else y), dt.t / runs
+
+    ref, best_t = profile(str(weights))
+    best = str(weights)
+    LOGGER.info(f"Backend {best}: {best_t * 1e3:.1f}ms per batch of 2")
+    for w in exports:
+        try:
+            y, t = profile(w)
+        except Exception as e:
+            LOGGER.warning(f"WARNING ⚠️ Backend {w} failed to load, skipping: {e}")
+            continue
+        match = y.shape == ref.shape
+        if w.endswith("_int8_openvino_model"):
+            meta = yaml_load(Path(w) / f"{Path(weights).stem}.yaml")
+            match &= meta.get("sha256") == file_sha256(weights)
+        elif match:  # boxes within 0.5 pixels and scores within 1e-3
+            d = (y - ref).abs().flatten(0, -2).amax(0)  # per output column
+            match = d[:4].max() <= 0.5 and d[4:].max() <= 1e-3
+        if not match:
+            LOGGER.warning(f"WARNING ⚠️ Backend {w} does not match {weights}, skipping")
+            continue
+        LOGGER.info(f"Backend {w}: {t * 1e3:.1f}ms per batch of 2")
+        if t < best_t:
+            best, best_t = w, t
+    LOGGER.info(f"Selected backend {best}")
+    return best
+
+
 class AutoShape(nn.Module):
     # YOLOv5 input-robust model wrapper for passing cv2/np/PIL/torch inputs. Includes preprocessing, inference and NMS
     conf = 0.25  # NMS confidence threshold
@@ -0,0 +1,255 @@
+# Copyright (c) 2023 Intel Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Quantize a finetuned YOLOv5 model to INT8 with OpenVINO NNCF post-training quantization
+
+The FP32 OpenVINO export of the model is calibrated on a random sample of the validation
+images, then both models are validated. The INT8 model is only kept if its mAP and object
+count error are close enough to the FP32 model, and the comparison is saved to
+quantization.json next to the weights.
+
+Usage:
+    $ python quantize.py --weights runs/train/exp/weights/best.pt --data dataset.yaml
+
+Output:
+    runs/train/exp/weights/best_int8_openvino_model/  # loaded by DetectMultiBackend
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+from torch.utils.data import Subset
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
+
+import export
+import val as validate
+from models.common import DetectMultiBackend
+from utils.dataloaders import create_dataloader
+from utils.general import (
+    LOGGER,
+    check_dataset,
+    check_requirements,
+    check_yaml,
+    colorstr,
+    file_sha256,
+    non_max_suppression,
+    print_args,
+    yaml_load,
+    yaml_save,
+)
+from utils.metrics import count_metrics
+from utils.torch_utils import smart_inference_mode
+
+
+def object_counts(model, dataloader, conf_thres=0.25, iou_thres=0.45, max_det=1000):
+    # Number of detected and labelled objects of every class in every image
+    pred_counts, true_counts = [], []
+    for im, targets, _, _ in dataloader:
+        pred = model(im.float() / 255)  # uint8 to fp32, 0 - 255 to 0.0 - 1.0
+        nc = pred.shape[2] - 5  # number of classes
+        pred = non_max_suppression(pred, conf_thres, iou_thres, max_det=max_det)
+        for i, det in enumerate(pred):
+            labels = targets[targets[:, 0] == i, 1]
+            pred_counts.append(np.bincount(det[:, 5].long().cpu(), minlength=nc))
+            true_counts.append(np.bincount(labels.long().cpu(), minlength=nc))
+    return np.array(pred_counts), np.array(true_counts)
+
+
+def evaluate(weights, data, dataloader, imgsz, workers, save_dir, conf_thres):
+    # mAP from val.py and object count errors of an exported model on the validation set
+    mp, mr, map50, map, *_ = validate.run(
+        data,
+        weights=weights,
+        batch_size=1,
+        imgsz=imgsz,
+        workers=workers,
+        half=False,
+        plots=False,
+        project=save_dir,
+        name=Path(weights).name,
+        exist_ok=True,
+    )[0]
+    pred, true = object_counts(DetectMultiBackend(weights), dataloader, conf_thres)
+    mae = count_metrics(pred, true)[0]  # per class, as in val.py
+    labelled = true.sum(0) > 0  # classes with labels in the dataset
+    return {
+        "precision": float(mp),
+        "recall": float(mr),
+        "mAP50": float(map50),
+        "mAP50-95": float(map),
+        "count_mae": float(mae[labelled].mean() if labelled.any() else 0.0),
+        "count_accuracy": float((pred == true).all(1).mean()),  # images counted exactly
+    }
+
+
+@smart_inference_mode()
+def run(
+    data,  # dataset.yaml path
+    weights,  # model.pt path
+    imgsz=640,  # inference size (pixels)
+    calib_size=300,  # number of validation images to calibrate on
+    max_map_drop=0.01,  # largest accepted mAP50-95 drop
+    max_count_mae_increase=0.25,  # largest accepted increase of the mean count error
+    conf_thres=0.25,  # confidence threshold of the count error
+    workers=8,  # max dataloader workers
+):
+    check_requirements("nncf>=2.5.0")
+    import nncf  # noqa
+    import openvino.runtime as ov  # noqa
+
+    weights = Path(weights)
+    fp32 = weights.with_name(f"{weights.stem}_openvino_model")
+    int8 = weights.with_name(f"{weights.stem}_int8_openvino_model")
+    if not fp32.exists():
+        export.run(
+            weights=weights, imgsz=(imgsz, imgsz), include=("openvino",), dynamic=True
+        )
+
+    # Calibrate on a random sample of the square-padded validation images
+    data = check_dataset(data)
+    dataloader = create_dataloader(
+        data["val"], imgsz, 1, 32, pad=0.5, workers=workers, prefix=colorstr("val: ")
+    )[0]
+    dataset = dataloader.dataset
+    sample = random.Random(0).sample(range(len(dataset)), min(calib_size, len(dataset)))
+    calibration = nncf.Dataset(
+        Subset(dataset, sample), lambda x: x[0][None].numpy().astype(np.float32) / 255
+    )
+    ov_model = ov.Core().read_model(fp32 / f"{weights.stem}.xml")
+    ov_model = nncf.quantize(
+        ov_model,
+        calibration,
+        preset=nncf.QuantizationPreset.MIXED,
+        subset_size=len(sample),
+    )
+
+    # Save with the metadata of the FP32 model and the model it was quantized from,
+    # outside the weights directory until accepted so that inference cannot pick it up
+    save_dir = weights.parents[1] / "quantize"
+    f = save_dir / int8.name
+    shutil.rmtree(int8, ignore_errors=True)  # quantized from an earlier model
+    shutil.rmtree(f, ignore_errors=True)
+    f.mkdir(parents=True)
+    ov.serialize(ov_model, str(f / f"{weights.stem}.xml"))
+    meta = yaml_load(fp32 / f"{weights.stem}.yaml")
+    yaml_save(f / f"{weights.stem}.yaml", {**meta, "sha256": file_sha256(weights)})
+
+    # Compare INT8 with FP32 on the validation set
+    results = {
+        name: evaluate(str(w), data, dataloader, imgsz, workers, save_dir, conf_thres)
+        for name, w in (("fp32", fp32), ("int8", f))
+    }
+    results["map_drop"] = results["fp32"]["mAP50-95"] - results["int8"]["mAP50-95"]
+    results["count_mae_increase"] = (
+        results["int8"]["count_mae"] - results["fp32"]["count_mae"]
+    )
+    results["accepted"] = (
+        results["map_drop"] <= max_map_drop
+        and results["count_mae_increase"] <= max_count_mae_increase
+    )
+    with open(weights.with_name("quantization.json"), "w") as file:
+        json.dump(results, file, indent=2)
+
+    # Report
+    pf = "%10s" + "%11.3g" * 4  # print format
+    LOGGER.info(
+        ("\n%10s" + "%11s" * 4) % ("", "mAP50", "mAP50-95", "count MAE", "count acc")
+    )
+    for name in ("fp32", "int8"):
+        r = results[name]
+        LOGGER.info(
+            pf % (name, r["mAP50"], r["mAP50-95"], r["count_mae"], r["count_accuracy"])
+        )
+    s = f"mAP50-95 drop {results['map_drop']:.4f}, count MAE increase {results['count_mae_increase']:.3f}"
+    if results["accepted"]:
+        shutil.move(str(f), str(int8))
+        LOGGER.info(f"{colorstr('INT8:')} accepted, {s}, saved as {int8}")
+    else:
+        shutil.rmtree(f)  # keep serving the FP32 model
+        LOGGER.warning(
+            f"WARNING ⚠️ INT8 model rejected, {s} exceeds --max-map-drop {max_map_drop} "
+            f"or --max-count-mae-increase {max_count_mae_increase}"
+        )
+    return results
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type=str, required=True, help="dataset.yaml path")
+    parser.add_argument("--weights", type=str, required=True, help="model.pt path")
+    parser.add_argument(
+        "--imgsz",
+        "--img",
+        "--img-size",
+        type=int,
+        default=640,
+        help="inference size (pixels)",
+    )
+    parser.add_argument(
+        "--calib-size",
+        type=int,
+        default=300,
+        help="number of validation images to calibrate on",
+    )
+    parser.add_argument(
+        "--max-map-drop",
+        type=float,
+        default=0.01,
+        help="largest accepted mAP50-95 drop",
+    )
+    parser.add_argument(
+        "--max-count-mae-increase",
+        type=float,
+        default=0.25,
+        help="largest accepted increase of the mean object count error per image",
+    )
+    parser.add_argument(
+        "--conf-thres",
+        type=float,
+        default=0.25,
+        help="confidence threshold for counting objects",
+    )
+    parser.add_argument("--workers", type=int, default=8, help="max dataloader workers")
+    opt = parser.parse_args()
+    opt.data = check_yaml(opt.data)  # check YAML
+    print_args(vars(opt))
+    return opt
+
+
+def main(opt):
+    run(**vars(opt))
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    main(opt)
@@ -367,7 +367,8 @@ def train(hyp, opt, device, callbacks):  # hyp is path/to/hyp.yaml or hyp dictio
     # nw = min(nw, (epochs - start_epoch) / 2 * nb)  # limit warmup to < 1/2 of training
     last_opt_step = -1
     maps = np.zeros(nc)  # mAP per class
-    results = (0, 0, 0, 0, 0, 0, 0)  # P, R, mAP@.5, mAP@.5-.95, val_loss(box, obj, cls)
+    # P, R, mAP@.5, mAP@.5-.95, val_loss(box, obj, cls), count MAE, RMSE, relative error
+    results = (0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
     scheduler.last_epoch = start_epoch - 1  # do not move
     scaler = torch.cuda.amp.GradScaler(enabled=amp)
     stopper, stop = EarlyStopping(patience=opt.patience), False
@@ -402,7 +403,7 @@ def train(hyp, opt, device, callbacks):  # hyp is path/to/hyp.yaml or hyp dictio
         # dataset.mosaic_border = [b - imgsz, -b]  # height, width borders
 
         mloss = torch.zeros(3, device=device)  # mean losses
-        if RANK != -1:
+        if RANK != -1 and hasattr(train_loader.sampler, "set_epoch"):  # not sharded
             train_loader.sampler.set_epoch(epoch)
         pbar = enumerate(train_loader)
         LOGGER.info(
@@ -527,7 +528,8 @@ def train(hyp, opt, device, callbacks):  # hyp is path/to/hyp.yaml or hyp dictio
                 model, include=["yaml", "nc", "hyp", "names", "stride", "class_weights"]
             )
             final_epoch = (epoch + 1 == epochs) or stopper.possible_stop
-            if not noval or final_epoch:  # Calculate mAP
+            validated = not noval or final_epoch
+            if validated:  # Calculate mAP
                 results, maps, _ = validate.run(
                     data_dict,
                     batch_size=batch_size // WORLD_SIZE * 2,
@@ -542,10 +544,12 @@ def train(hyp, opt, device, callbacks):  # hyp is path/to/hyp.yaml or hyp dictio
                     compute_loss=compute_loss,
                 )
 
-            # Update best mAP
-            fi = fitness(
-                np.array(results).reshape(1, -1)
-            )  # weighted combination of [P, R, mAP@.5, mAP@.5-.95]
+            # Update best mAP or object count accuracy, from validated epochs only
+            fi = (
+                fitness(np.array(results).reshape(1, -1), opt.fitness)
+                if validated
+                else np.zeros(1)
+            )  # weighted combination of [P, R, mAP@.5, mAP@.5-.95] or 1 / (1 + count err)
             stop = stopper(epoch=epoch, fitness=fi)  # early stop check
             if fi > best_fitness:
                 best_fitness = fi
@@ -685,13 +689,20 @@ def parse_opt(known=False):
         const=300,
         help="evolve hyperparameters for x generations",
     )
+    parser.add_argument(
+        "--fitness",
+        type=str,
+        choices=["map", "count"],
+        default="map",
+        help="select best.pt and evolve by mAP or by object count accuracy",
+    )
     parser.add_argument("--bucket", type=str, default="", help="gsutil bucket")
     parser.add_argument(
         "--cache",
         type=str,
         nargs="?",
         const="ram",
-        help='--cache images in "ram" (default) or "disk"',
+        help='--cache images in "ram" (default), "disk" or one memory-mapped "packed" file',
     )
     parser.add_argument(
         "--image-weights",
@@ -932,8 +943,10 @@ def main(opt, callbacks=Callbacks()):
                 parent = "single"  # parent selection method: 'single' or 'weighted'
                 x = np.loadtxt(evolve_csv, ndmin=2, delimiter=",", skiprows=1)
                 n = min(5, len(x))  # number of previous results to consider
-                x = x[np.argsort(-fitness(x))][:n]  # top n mutations
-                w = fitness(x) - fitness(x).min() + 1e-6  # weights (sum > 0)
+                x = x[np.argsort(-fitness(x, opt.fitness))][:n]  # top n mutations
+                w = (
+                    fitness(x, opt.fitness) - fitness(x, opt.fitness).min() + 1e-6
+                )  # weights (sum > 0)
                 if parent == "single" or len(x) == 1:
                     # x = x[random.randint(0, n - 1)]  # random selection
                     x = x[random.choices(range(n), weights=w)[0]]  # weighted selection
@@ -952,7 +965,7 @@ def main(opt, callbacks=Callbacks()):
                         g * (npr.random(ng) < mp) * npr.randn(ng) * npr.random() * s + 1
                     ).clip(0.3, 3.0)
                 for i, k in enumerate(hyp.keys()):  # plt.hist(v.ravel(), 300)
-                    hyp[k] = float(x[i + 7] * v[i])  # mutate
+                    hyp[k] = float(x[i + 10] * v[i])  # mutate
 
             # Constrain to limits
             for k, v in meta.items():
@@ -972,11 +985,14 @@ def main(opt, callbacks=Callbacks()):
                 "val/box_loss",
                 "val/obj_loss",
                 "val/cls_loss",
+                "metrics/count_MAE",
+                "metrics/count_RMSE",
+                "metrics/count_rel_error",
             )
-            print_mutation(keys, results, hyp.copy(), save_dir, opt.bucket)
+            print_mutation(keys, results, hyp.copy(), save_dir, opt.bucket, opt.fitness)
 
         # Plot results
-        plot_evolve(evolve_csv)
+        plot_evolve(evolve_csv, opt.fitness)
         LOGGER.info(
             f"Hyperparameter evolution finished {opt.evolve} generations\n"
             f"Results saved to {colorstr('bold', save_dir)}\n"
@@ -6,12 +6,15 @@ Dataloaders and dataset utils
 import contextlib
 import glob
 import hashlib
+import io
 import json
 import math
 import os
 import random
 import shutil
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from itertools import repeat
 from multiprocessing.pool import Pool, ThreadPool
 from pathlib import Path
@@ -24,7 +27,14 @@ import torch.nn.functional as F
 import torchvision
 import yaml
 from PIL import ExifTags, Image, ImageOps
-from torch.utils.data import DataLoader, Dataset, dataloader, distributed
+from torch.utils.data import (
+    DataLoader,
+    Dataset,
+    IterableDataset,
+    dataloader,
+    distributed,
+    get_worker_info,
+)
 from tqdm import tqdm
 
 from utils.augmentations import (
@@ -39,6 +49,7 @@ from utils.augmentations import (
     random_perspective,
 )
 from utils.general import (
+    CONFIG_DIR,
     DATASETS_DIR,
     LOGGER,
     NUM_THREADS,
@@ -47,6 +58,7 @@ from utils.general import (
     check_yaml,
     clean_str,
     cv2,
+    file_sha256,
     is_colab,
     is_kaggle,
     segments2boxes,
@@ -56,6 +68,7 @@ from utils.general import (
     xywhn2xyxy,
     xyxy2xywhn,
 )
+from utils.s3 import S3, is_s3, local_path
 from utils.torch_utils import torch_distributed_zero_first
 
 # Parameters
@@ -93,6 +106,12 @@ RANK = int(os.getenv("RANK", -1))
 PIN_MEMORY = (
     str(os.getenv("PIN_MEMORY", True)).lower() == "true"
 )  # global pin_memory for dataloaders
+LABEL_CACHE_DIR = Path(
+    os.getenv("YOLOV5_LABEL_CACHE_DIR", CONFIG_DIR / "label_cache")
+)  # labels cache shared by all datasets, keyed by file contents
+SHUFFLE_BUFFER = int(
+    os.getenv("YOLOV5_SHUFFLE_BUFFER", 1000)
+)  # images per dataloader worker that samples of sharded datasets are shuffled in
 
 # Get orientation exif tag
 for orientation in ExifTags.TAGS.keys():
@@ -105,9 +124,27 @@ def get_hash(paths):
     size = sum(os.path.getsize(p) for p in paths if os.path.exists(p))  # sizes
     h = hashlib.md5(str(size).encode())  # hash sizes
     h.update("".join(paths).encode())  # hash paths
+    h.update(
+        "".join(str(S3.stat(p)) for p in paths if is_s3(p)).encode()
+    )  # hash S3 object sizes and ETags
     return h.hexdigest()  # return hash
 
 
+def get_content_hash(args):
+    # Returns a hash of the contents of an image and its label file, or None if the image can not be read
+    im_file, lb_file = args
+    if is_s3(im_file):  # S3 ETags identify the contents without downloading them
+        if S3.stat(im_file):
+            h = f"{S3.stat(im_file)}{S3.stat(lb_file)}"
+            return hashlib.md5(h.encode()).hexdigest()
+        return None
+    with contextlib.suppress(OSError):
+        h = file_sha256(im_file)
+        if os.path.isfile(lb_file):
+            h += file_sha256(lb_file)
+        return hashlib.md5(h.encode()).hexdigest()
+
+
 def exif_size(img):
     # Returns exif-corrected PIL size
     s = img.size  # (width, height)
@@ -175,21 +212,38 @@ def create_dataloader(
             "WARNING ⚠️ --rect is incompatible with DataLoader shuffle, setting shuffle=False"
         )
         shuffle = False
+    shards = str(path).endswith(".json")  # shards index of gse-data-preparation
     with torch_distributed_zero_first(rank):  # init dataset *.cache only once if DDP
-        dataset = LoadImagesAndLabels(
-            path,
-            imgsz,
-            batch_size,
-            augment=augment,  # augmentation
-            hyp=hyp,  # hyperparameters
-            rect=rect,  # rectangular batches
-            cache_images=cache,
-            single_cls=single_cls,
-            stride=int(stride),
-            pad=pad,
-            image_weights=image_weights,
-            prefix=prefix,
-        )
+        if shards:
+            dataset = LoadImagesAndLabelsShards(
+                path,
+                imgsz,
+                batch_size,
+                augment=augment,
+                hyp=hyp,
+                rect=rect,
+                single_cls=single_cls,
+                stride=int(stride),
+                pad=pad,
+                shuffle=shuffle,
+                rank=rank,
+                prefix=prefix,
+            )
+        else:
+            dataset = LoadImagesAndLabels(
+                path,
+                imgsz,
+                batch_size,
+                augment=augment,  # augmentation
+                hyp=hyp,  # hyperparameters
+                rect=rect,  # rectangular batches
+                cache_images=cache,
+                single_cls=single_cls,
+                stride=int(stride),
+                pad=pad,
+                image_weights=image_weights,
+                prefix=prefix,
+            )
 
     batch_size = min(batch_size, len(dataset))
     nd = torch.cuda.device_count()  # number of CUDA devices
@@ -197,10 +251,12 @@ def create_dataloader(
         [os.cpu_count() // max(nd, 1), batch_size if batch_size > 1 else 0, workers]
     )  # number of workers
     sampler = (
-        None if rank == -1 else distributed.DistributedSampler(dataset, shuffle=shuffle)
+        None
+        if rank == -1 or shards
+        else distributed.DistributedSampler(dataset, shuffle=shuffle)
     )
     loader = (
-        DataLoader if image_weights else InfiniteDataLoader
+        DataLoader if image_weights or shards else InfiniteDataLoader
     )  # only DataLoader allows for attribute updates
     generator = torch.Generator()
     generator.manual_seed(6148914691236517205 + RANK)
@@ -208,10 +264,11 @@ def create_dataloader(
         loader(
             dataset,
             batch_size=batch_size,
-            shuffle=shuffle and sampler is None,
+            shuffle=shuffle and sampler is None and not shards,
             num_workers=nw,
             sampler=sampler,
             pin_memory=PIN_MEMORY,
+            persistent_workers=shards and nw > 0,  # keep the epoch of the shard order
             collate_fn=LoadImagesAndLabels.collate_fn4
             if quad
             else LoadImagesAndLabels.collate_fn,
@@ -325,6 +382,9 @@ class LoadImages:
     ):
         files = []
         for p in sorted(path) if isinstance(path, (list, tuple)) else [path]:
+            if is_s3(p):
+                files.extend(S3.list(p))  # S3 prefix or object
+                continue
             p = str(Path(p).resolve())
             if "*" in p:
                 files.extend(sorted(glob.glob(p, recursive=True)))  # glob
@@ -427,6 +487,137 @@ class LoadImages:
         return self.nf  # number of files
 
 
+class LoadImageBatches:
+    # YOLOv5 batched image dataloader, i.e. `python detect.py --source path/ --batch-size 16`
+    # Worker threads decode and letterbox images ahead to one fixed shape so they can be stacked
+    def __init__(
+        self, path, img_size=640, stride=32, batch_size=16, workers=8, prefetch=2
+    ):
+        files = []
+        for p in sorted(path) if isinstance(path, (list, tuple)) else [path]:
+            if is_s3(p):
+                files.extend(S3.list(p))  # S3 prefix or object
+                continue
+            p = str(Path(p).resolve())
+            if "*" in p:
+                files.extend(sorted(glob.glob(p, recursive=True)))  # glob
+            elif os.path.isdir(p):
+                files.extend(sorted(glob.glob(os.path.join(p, "*.*"))))  # dir
+            elif os.path.isfile(p):
+                files.append(p)  # files
+            else:
+                raise FileNotFoundError(f"{p} does not exist")
+
+        images = [x for x in files if x.split(".")[-1].lower() in IMG_FORMATS]
+        videos = [x for x in files if x.split(".")[-1].lower() in VID_FORMATS]
+        assert not videos, f"Use batch size 1 for videos, found {len(videos)} in {p}"
+
+        self.img_size = img_size
+        self.stride = stride
+        self.files = images
+        self.nf = len(images)  # number of files
+        self.batch_size = batch_size
+        self.nb = math.ceil(self.nf / batch_size)  # number of batches
+        self.workers = max(min(workers, NUM_THREADS), 1)
+        self.lookahead = batch_size * max(prefetch, 1)  # images decoded ahead
+        self.mode = "image"
+        self.cap = None
+        assert self.nf > 0, (
+            f"No images found in {p}. Supported formats are:\nimages: {IMG_FORMATS}"
+        )
+
+    def _load(self, path):
+        im0 = cv2.imread(path)  # BGR
+        assert im0 is not None, f"Image Not Found {path}"
+        im = letterbox(im0, self.img_size, stride=self.stride, auto=False)[
+            0
+        ]  # padded resize to a fixed shape
+        im = im.transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
+        return path, np.ascontiguousarray(im), im0
+
+    def close(self):
+        # Stops the worker threads, also when iteration stopped early
+        pool, self.pool = getattr(self, "pool", None), None
+        if pool is not None:
+            for future in self.futures:
+                future.cancel()  # not started yet
+            pool.shutdown(wait=False)
+
+    def __del__(self):
+        self.close()
+
+    def __iter__(self):
+        self.close()  # from an earlier iteration that stopped early
+        self.count = 0  # batches returned
+        self.queued = 0  # files submitted to the pool
+        self.pool = ThreadPoolExecutor(self.workers)
+        self.futures = deque()
+        self._fill()
+        return self
+
+    def _fill(self):
+        # Keep at most self.lookahead images in flight to bound memory
+        while self.queued < self.nf and len(self.futures) < self.lookahead:
+            self.futures.append(self.pool.submit(self._load, self.files[self.queued]))
+            self.queued += 1
+
+    def __next__(self):
+        if self.count == self.nb:
+            self.close()
+            raise StopIteration
+        n = min(self.batch_size, len(self.futures))
+        batch = [self.futures.popleft().result() for _ in range(n)]
+        self._fill()
+        self.count += 1
+        paths, ims, im0s = zip(*batch)
+        s = f"batch {self.count}/{self.nb} ({n} images): "
+        return list(paths), np.stack(ims), list(im0s), None, s
+
+    def __len__(self):
+        return self.nb  # number of batches
+
+
+class LoadArrays:
+    # YOLOv5 in-memory image dataloader, i.e. `detect.run(source={"image.jpg": im0})` for decoded BGR arrays
+    def __init__(self, arrays, img_size=640, stride=32, auto=True, transforms=None):
+        self.names = list(arrays.keys())
+        self.arrays = list(arrays.values())
+        self.img_size = img_size
+        self.stride = stride
+        self.nf = len(self.arrays)  # number of images
+        self.mode = "image"
+        self.auto = auto
+        self.transforms = transforms  # optional
+        self.cap = None
+        assert self.nf > 0, "No images provided"
+
+    def __iter__(self):
+        self.count = 0
+        return self
+
+    def __next__(self):
+        if self.count == self.nf:
+            raise StopIteration
+        path, im0 = self.names[self.count], self.arrays[self.count]
+        self.count += 1
+        assert im0 is not None, f"Image Not Decoded {path}"
+        s = f"image {self.count}/{self.nf} {path}: "
+
+        if self.transforms:
+            im = self.transforms(im0)  # transforms
+        else:
+            im = letterbox(im0, self.img_size, stride=self.stride, auto=self.auto)[
+                0
+            ]  # padded resize
+            im = im.transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
+            im = np.ascontiguousarray(im)  # contiguous
+
+        return path, im, im0, self.cap, s
+
+    def __len__(self):
+        return self.nf  # number of images
+
+
 class LoadStreams:
     # YOLOv5 streamloader, i.e. `python detect.py --source 'rtsp://example.com/media.mp4'  # RTSP, RTMP, HTTP streams`
     def __init__(
@@ -614,6 +805,17 @@ class LoadImagesAndLabels(Dataset):
         try:
             f = []  # image files
             for p in path if isinstance(path, list) else [path]:
+                if is_s3(p):  # S3 prefix or image list
+                    if p.endswith(".txt"):
+                        t = S3.read(p).decode().strip().splitlines()
+                        parent = p.rsplit("/", 1)[0] + "/"
+                        f += [
+                            x.replace("./", parent) if x.startswith("./") else x
+                            for x in t
+                        ]
+                    else:
+                        f += S3.list(p)
+                    continue
                 p = Path(p)  # os-agnostic
                 if p.is_dir():  # dir
                     f += glob.glob(str(p / "**" / "*.*"), recursive=True)
@@ -643,9 +845,15 @@ class LoadImagesAndLabels(Dataset):
 
         # Check cache
         self.label_files = img2label_paths(self.im_files)  # labels
-        cache_path = (
-            p if p.is_file() else Path(self.label_files[0]).parent
-        ).with_suffix(".cache")
+        if is_s3(p):  # keep the cache files of S3 datasets on local disk
+            cache_path = local_path(
+                p if p.endswith(".txt") else self.label_files[0].rsplit("/", 1)[0]
+            ).with_suffix(".cache")
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+        else:
+            cache_path = (
+                p if p.is_file() else Path(self.label_files[0]).parent
+            ).with_suffix(".cache")
         try:
             cache, exists = (
                 np.load(cache_path, allow_pickle=True).item(),
@@ -753,8 +961,17 @@ class LoadImagesAndLabels(Dataset):
 
         # Cache images into RAM/disk for faster training (WARNING: large datasets may exceed system resources)
         self.ims = [None] * n
-        self.npy_files = [Path(f).with_suffix(".npy") for f in self.im_files]
-        if cache_images:
+        self.npy_files = [
+            (local_path(f) if is_s3(f) else Path(f)).with_suffix(".npy")
+            for f in self.im_files
+        ]
+        self.packed, self.packed_ims = None, None  # packed cache index, memory map
+        if cache_images == "packed":
+            self.packed_file = cache_path.with_name(
+                f"{cache_path.stem}-{img_size}{'-augment' if augment else ''}.packed"
+            )
+            self.packed = self.cache_images_to_packed(self.packed_file, prefix)
+        elif cache_images:
             gb = 0  # Gigabytes of cached images
             self.im_hw0, self.im_hw = [None] * n, [None] * n
             fcn = (
@@ -791,16 +1008,36 @@ class LoadImagesAndLabels(Dataset):
             [],
         )  # number missing, found, empty, corrupt, messages
         desc = f"{prefix}Scanning '{path.parent / path.stem}' images and labels..."
+        store_path = LABEL_CACHE_DIR / f"labels-{self.cache_version}.cache"
+        try:
+            store = np.load(store_path, allow_pickle=True).item()  # hash: labels
+        except Exception:
+            store = {}
         with Pool(NUM_THREADS) as pool:
-            pbar = tqdm(
-                pool.imap(
-                    verify_image_label,
-                    zip(self.im_files, self.label_files, repeat(prefix)),
+            # Only verify images and labels whose contents were not verified before,
+            # wherever they were stored at the time
+            keys = pool.map(get_content_hash, zip(self.im_files, self.label_files))
+            hits = {
+                i: (self.im_files[i], *store[k], "")
+                for i, k in enumerate(keys)
+                if k in store
+            }
+            todo = [i for i in range(len(keys)) if i not in hits]
+            verified = pool.imap(
+                verify_image_label,
+                zip(
+                    [self.im_files[i] for i in todo],
+                    [self.label_files[i] for i in todo],
+                    repeat(prefix),
                 ),
+            )
+            pbar = tqdm(
+                (hits[i] if i in hits else next(verified) for i in range(len(keys))),
                 desc=desc,
                 total=len(self.im_files),
                 bar_format=BAR_FORMAT,
             )
+            hashes = dict(zip(self.im_files, keys))
             for im_file, lb, shape, segments, nm_f, nf_f, ne_f, nc_f, msg in pbar:
                 nm += nm_f
                 nf += nf_f
@@ -808,11 +1045,27 @@ class LoadImagesAndLabels(Dataset):
                 nc += nc_f
                 if im_file:
                     x[im_file] = [lb, shape, segments]
+                    k = hashes[im_file]
+                    if k:  # image could be read
+                        store[k] = lb, shape, segments, nm_f, nf_f, ne_f, nc_f
                 if msg:
                     msgs.append(msg)
                 pbar.desc = f"{desc}{nf} found, {nm} missing, {ne} empty, {nc} corrupt"
 
         pbar.close()
+        if hits:
+            LOGGER.info(
+                f"{prefix}{len(hits)}/{len(keys)} images and labels found in {store_path}"
+            )
+        if len(hits) < len(keys):
+            try:
+                LABEL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                np.save(store_path, store)
+                store_path.with_suffix(".cache.npy").rename(store_path)
+            except Exception as e:
+                LOGGER.warning(
+                    f"{prefix}WARNING ⚠️ Label cache directory {LABEL_CACHE_DIR} is not writeable: {e}"
+                )
         if msgs:
             LOGGER.info("\n".join(msgs))
         if nf == 0:
@@ -931,6 +1184,8 @@ class LoadImagesAndLabels(Dataset):
             self.im_files[i],
             self.npy_files[i],
         )
+        if im is None and self.packed:  # resized in the packed cache
+            return self.load_packed_image(i)
         if im is None:  # not cached in RAM
             if fn.exists():  # load npy
                 im = np.load(fn)
@@ -949,8 +1204,61 @@ class LoadImagesAndLabels(Dataset):
         # Saves an image as an *.npy file for faster loading
         f = self.npy_files[i]
         if not f.exists():
+            f.parent.mkdir(parents=True, exist_ok=True)  # for S3 datasets
             np.save(f.as_posix(), cv2.imread(self.im_files[i]))
 
+    def cache_images_to_packed(self, path, prefix=""):
+        # Writes all resized images into one uint8 file, returns the offset and shape of every image in it
+        index_path = path.with_suffix(".index")
+        h = get_hash(self.im_files)  # image files in dataset order
+        with contextlib.suppress(Exception):
+            index = np.load(index_path, allow_pickle=True).item()
+            if index["hash"] == h and path.stat().st_size == index["size"]:
+                LOGGER.info(f"{prefix}Using packed image cache {path}")
+                return index
+
+        n = len(self.im_files)
+        offsets, shapes, hw0 = (
+            np.zeros(n, dtype=np.int64),
+            np.zeros((n, 3), dtype=np.int64),
+            np.zeros((n, 2), dtype=np.int64),
+        )
+        tmp, gb = path.with_suffix(".packed.tmp"), 0
+        with open(tmp, "wb") as f:
+            results = ThreadPool(NUM_THREADS).imap(self.load_image, range(n))
+            pbar = tqdm(
+                enumerate(results),
+                total=n,
+                bar_format=BAR_FORMAT,
+                disable=LOCAL_RANK > 0,
+            )
+            for i, (im, hw, _) in pbar:
+                offsets[i], shapes[i], hw0[i] = f.tell(), im.shape, hw
+                f.write(np.ascontiguousarray(im).data)
+                gb += im.nbytes
+                pbar.desc = f"{prefix}Caching images ({gb / 1E9:.1f}GB packed)"
+            pbar.close()
+        tmp.rename(path)
+        index = {
+            "hash": h,
+            "size": path.stat().st_size,
+            "offsets": offsets,
+            "shapes": shapes,
+            "hw0": hw0,
+        }
+        np.save(index_path, index)
+        index_path.with_suffix(".index.npy").rename(index_path)  # remove .npy suffix
+        LOGGER.info(f"{prefix}New packed image cache created: {path}")
+        return index
+
+    def load_packed_image(self, i):
+        # Returns a read-only view of image 'i' in the packed cache, shared by all processes
+        if self.packed_ims is None:  # mapped by every worker on first use
+            self.packed_ims = np.memmap(self.packed_file, dtype=np.uint8, mode="r")
+        o, shape = self.packed["offsets"][i], self.packed["shapes"][i]
+        im = self.packed_ims[o : o + shape.prod()].reshape(shape)
+        return im, tuple(self.packed["hw0"][i]), im.shape[:2]
+
     def load_mosaic(self, index):
         # YOLOv5 4-mosaic loader. Loads 1 image + 3 random images into a 4-image mosaic
         labels4, segments4 = [], []
@@ -1174,6 +1482,198 @@ class LoadImagesAndLabels(Dataset):
         return torch.stack(im4, 0), torch.cat(label4, 0), path4, shapes4
 
 
+def read_range(path, offset, size):
+    # Return size bytes from offset of a local or s3:// file
+    if is_s3(path):
+        return S3.read_range(path, offset, size)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def read_ranges(path, ranges):
+    # Yield the bytes of ascending (offset, size) ranges of a local or s3:// file, read in one sequential pass
+    if not is_s3(path):
+        with open(path, "rb", buffering=2**20) as f:
+            for offset, size in ranges:
+                f.seek(offset)
+                yield f.read(size)
+        return
+    blocks, chunks = None, deque()  # blocks read so far, (offset, data)
+    for offset, size in ranges:
+        if blocks is None:
+            blocks = S3.blocks(path, offset)
+            end = offset - offset % S3.block_size  # end of the blocks read
+        while end < offset + size:
+            chunks.append((end, next(blocks)))
+            end += len(chunks[-1][1])
+        while chunks[0][0] + len(chunks[0][1]) <= offset:  # drop blocks read past
+            chunks.popleft()
+        yield b"".join(
+            data[max(offset - start, 0) : offset + size - start]
+            for start, data in chunks
+            if start < offset + size
+        )
+
+
+class LoadImagesAndLabelsShards(LoadImagesAndLabels, IterableDataset):
+    # YOLOv5 train_loader/val_loader for datasets packed into tar shards, i.e. `train: shards/training.json`
+    # Every DDP rank streams the same number of consecutive samples of the shards, split between its dataloader workers,
+    # which read them sequentially and shuffle them in a buffer that also provides the mosaic images. The labels and
+    # image shapes are read from the shards index
+    def __init__(
+        self,
+        path,
+        img_size=640,
+        batch_size=16,
+        augment=False,
+        hyp=None,
+        rect=False,
+        single_cls=False,
+        stride=32,
+        pad=0.0,
+        shuffle=False,
+        buffer_size=SHUFFLE_BUFFER,
+        seed=0,
+        rank=-1,
+        prefix="",
+    ):
+        if rect:
+            LOGGER.warning(
+                f"{prefix}WARNING ⚠️ --rect is not supported by sharded datasets, using square images"
+            )
+        self.img_size = img_size
+        self.augment = augment
+        self.hyp = hyp
+        self.image_weights = False
+        self.rect = False
+        self.mosaic = augment  # load 4 images at a time into a mosaic
+        self.mosaic_border = [-img_size // 2, -img_size // 2]
+        self.stride = stride
+        self.path = path
+        self.albumentations = Albumentations(size=img_size) if augment else None
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size if shuffle else 0
+        self.seed, self.epoch = seed, 0  # shard order
+        self.rank, self.world_size = (
+            (max(RANK, 0), int(os.getenv("WORLD_SIZE", 1))) if rank != -1 else (0, 1)
+        )
+
+        try:
+            index = json.loads(S3.read(path) if is_s3(path) else Path(path).read_text())
+            parent = path.rsplit("/", 1)[0] if is_s3(path) else str(Path(path).parent)
+            self.shards = []  # (shard file, index of its first image, number of images)
+            self.im_files, self.offsets, self.segments = [], [], []
+            labels, shapes = [], []
+            for shard in index["shards"]:
+                f = f"{parent}/{shard['file']}"
+                self.shards.append((f, len(self.im_files), len(shard["samples"])))
+                for x in shard["samples"]:
+                    self.im_files.append(f"{f}/{x['image']}")
+                    self.offsets.append((x["offset"], x["size"]))
+                    shapes.append(x["shape"])
+                    lb, segments = x["labels"], []
+                    if any(len(x) > 6 for x in lb):  # is segment
+                        classes = np.array([x[0] for x in lb], dtype=np.float32)
+                        segments = [
+                            np.array(x[1:], dtype=np.float32).reshape(-1, 2) for x in lb
+                        ]  # (cls, xy1...)
+                        lb = np.concatenate(
+                            (classes.reshape(-1, 1), segments2boxes(segments)), 1
+                        )  # (cls, xywh)
+                    lb = np.array(lb, dtype=np.float32).reshape(-1, 5)
+                    _, i = np.unique(lb, axis=0, return_index=True)
+                    if len(i) < len(lb):  # remove duplicates
+                        lb = lb[i]
+                        segments = [segments[j] for j in i] if segments else []
+                    labels.append(lb)
+                    self.segments.append(segments)
+            assert self.im_files, f"{prefix}No images found"
+        except Exception as e:
+            raise Exception(
+                f"{prefix}Error loading data from {path}: {e}\n{HELP_URL}"
+            ) from e
+        assert (
+            sum(map(len, labels)) > 0 or not augment
+        ), f"{prefix}All labels empty in {path}, can not start training. {HELP_URL}"
+        if single_cls:  # single-class training, merge all classes into 0
+            for lb in labels:
+                lb[:, 0] = 0
+        self.labels = labels
+        self.shapes = np.array(shapes)  # wh
+        self.n = n = len(self.labels)
+        self.batch = np.floor(np.arange(n) / batch_size).astype(int)  # batch index
+        self.indices = range(n)
+        self.shard_index = np.repeat(
+            np.arange(len(self.shards)), [x[2] for x in self.shards]
+        )  # shard of every sample
+        self.buffer = {}  # image bytes of the samples in the shuffle buffer
+        LOGGER.info(
+            f"{prefix}Streaming {n} images from {len(self.shards)} shards in {path}"
+        )
+
+    def __len__(self):
+        # Number of samples of every rank, the last rank is padded with the first samples so that DDP ranks stay in step
+        return -(-self.n // self.world_size)
+
+    def __iter__(self):
+        # Yields the samples of this rank and worker, shuffled in a buffer of buffer_size samples
+        info = get_worker_info()
+        worker, workers = (info.id, info.num_workers) if info else (0, 1)
+        shards = self.shards
+        if self.shuffle:  # same shard order in all ranks and workers
+            rng = np.random.default_rng([self.seed, self.epoch])
+            shards = [shards[i] for i in rng.permutation(len(shards))]
+        self.epoch += 1
+        samples = np.concatenate([np.arange(x[1], x[1] + x[2]) for x in shards])
+        samples = np.resize(samples, len(self) * self.world_size)  # pad
+        samples = samples[self.rank * len(self) : (self.rank + 1) * len(self)]
+        samples = np.array_split(samples, workers)[worker]
+
+        # Read every run of consecutive samples of a shard in one sequential pass
+        shard = self.shard_index[samples]
+        runs = np.flatnonzero((np.diff(samples) != 1) | (np.diff(shard) != 0)) + 1
+        self.indices = []  # samples in the buffer, read by load_mosaic
+        try:
+            for run in np.split(samples, runs):
+                if not len(run):
+                    continue
+                f = self.shards[self.shard_index[run[0]]][0]
+                ranges = [self.offsets[i] for i in run]
+                for i, data in zip(run.tolist(), read_ranges(f, ranges)):
+                    self.buffer[i] = data
+                    self.indices.append(i)
+                    if len(self.indices) > self.buffer_size:
+                        yield self.pop_sample()
+            while self.indices:
+                yield self.pop_sample()
+        finally:
+            self.buffer, self.indices = {}, range(self.n)
+
+    def pop_sample(self):
+        # Returns a random sample of the buffer (the oldest one without shuffle) and removes it from the buffer
+        j = random.randrange(len(self.indices)) if self.shuffle else 0
+        sample = self[j]
+        del self.buffer[self.indices[j]]
+        self.indices[j] = self.indices[-1]
+        self.indices.pop()
+        return sample
+
+    def load_image(self, i):
+        # Loads 1 image from the buffer, or with a random read outside of it (MixUp), returns (im, original hw, resized hw)
+        data = self.buffer.get(i)
+        if data is None:
+            data = read_range(self.im_files[i].rsplit("/", 1)[0], *self.offsets[i])
+        im = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)  # BGR
+        assert im is not None, f"Image Not Found {self.im_files[i]}"
+        h0, w0 = im.shape[:2]  # orig hw
+        r = self.img_size / max(h0, w0)  # ratio
+        if r != 1:  # if sizes are not equal
+            interp = cv2.INTER_LINEAR if (self.augment or r > 1) else cv2.INTER_AREA
+            im = cv2.resize(im, (int(w0 * r), int(h0 * r)), interpolation=interp)
+        return im, (h0, w0), im.shape[:2]  # im, hw_original, hw_resized
+
+
 # Ancillary functions --------------------------------------------------------------------------------------------------
 def flatten_recursive(path=DATASETS_DIR / "coco128"):
     # Flatten a recursive directory by bringing all files to top level
@@ -1288,26 +1788,32 @@ def verify_image_label(args):
     )  # number (missing, found, empty, corrupt), message, segments
     try:
         # verify images
-        im = Image.open(im_file)
+        s3 = is_s3(im_file)  # S3 objects are read into memory
+        data = io.BytesIO(S3.read(im_file)) if s3 else None
+        im = Image.open(data or im_file)
         im.verify()  # PIL verify
         shape = exif_size(im)  # image size
         assert (shape[0] > 9) & (shape[1] > 9), f"image size {shape} <10 pixels"
         assert im.format.lower() in IMG_FORMATS, f"invalid image format {im.format}"
         if im.format.lower() in ("jpg", "jpeg"):
-            with open(im_file, "rb") as f:
+            with data or open(im_file, "rb") as f:
                 f.seek(-2, 2)
                 if f.read() != b"\xff\xd9":  # corrupt JPEG
-                    ImageOps.exif_transpose(Image.open(im_file)).save(
-                        im_file, "JPEG", subsampling=0, quality=100
-                    )
-                    msg = (
-                        f"{prefix}WARNING ⚠️ {im_file}: corrupt JPEG restored and saved"
-                    )
+                    if s3:  # can not be saved
+                        msg = f"{prefix}WARNING ⚠️ {im_file}: corrupt JPEG"
+                    else:
+                        ImageOps.exif_transpose(Image.open(im_file)).save(
+                            im_file, "JPEG", subsampling=0, quality=100
+                        )
+                        msg = f"{prefix}WARNING ⚠️ {im_file}: corrupt JPEG restored and saved"
 
         # verify labels
-        if os.path.isfile(lb_file):
+        lb_s3 = is_s3(lb_file)
+        if S3.stat(lb_file) if lb_s3 else os.path.isfile(lb_file):
             nf = 1  # label found
-            with open(lb_file) as f:
+            with (
+                io.StringIO(S3.read(lb_file).decode()) if lb_s3 else open(lb_file)
+            ) as f:
                 lb = [x.split() for x in f.read().strip().splitlines() if len(x)]
                 if any(len(x) > 6 for x in lb):  # is segment
                     classes = np.array([x[0] for x in lb], dtype=np.float32)
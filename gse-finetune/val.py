@@ -75,7 +75,7 @@ from utils.general import (
     xywh2xyxy,
     xyxy2xywh,
 )
-from utils.metrics import ConfusionMatrix, ap_per_class, box_iou
+from utils.metrics import ConfusionMatrix, ap_per_class, box_iou, count_metrics
 from utils.plots import output_to_target, plot_images, plot_val_study
 from utils.torch_utils import select_device, smart_inference_mode
 
@@ -148,6 +148,9 @@ def run(
     conf_thres=0.001,  # confidence threshold
     iou_thres=0.6,  # NMS IoU threshold
     max_det=300,  # maximum detections per image
+    count_conf_thres=0.25,  # confidence threshold of the object counts
+    count_iou_thres=0.45,  # NMS IoU threshold of the object counts
+    count_max_det=1000,  # maximum objects counted per image
     task="val",  # train, val, test, speed or study
     device="",  # cuda device, i.e. 0 or 0,1,2,3 or cpu
     workers=8,  # max dataloader workers (per RANK in DDP mode)
@@ -257,7 +260,7 @@ def run(
     if isinstance(names, (list, tuple)):  # old format
         names = dict(enumerate(names))
     class_map = coco80_to_coco91_class() if is_coco else list(range(1000))
-    s = ("%22s" + "%11s" * 6) % (
+    s = ("%22s" + "%11s" * 9) % (
         "Class",
         "Images",
         "Instances",
@@ -265,6 +268,9 @@ def run(
         "R",
         "mAP50",
         "mAP50-95",
+        "count MAE",
+        "count RMSE",
+        "count err",
     )
     tp, fp, p, r, f1, mp, mr, map50, ap50, map = (
         0.0,
@@ -280,7 +286,7 @@ def run(
     )
     dt = Profile(), Profile(), Profile()  # profiling times
     loss = torch.zeros(3, device=device)
-    jdict, stats, ap, ap_class = [], [], [], []
+    jdict, stats, ap, ap_class, counts = [], [], [], [], []
     callbacks.run("on_val_start")
     pbar = tqdm(
         dataloader, desc=s, bar_format="{l_bar}{bar:10}{r_bar}{bar:-10b}"
@@ -313,6 +319,14 @@ def run(
             [targets[targets[:, 0] == i, 1:] for i in range(nb)] if save_hybrid else []
         )  # for autolabelling
         with dt[2]:
+            # Objects are counted from single-label NMS with the inference settings
+            count_preds = non_max_suppression(
+                preds,
+                count_conf_thres,
+                count_iou_thres,
+                agnostic=single_cls,
+                max_det=count_max_det,
+            )
             preds = non_max_suppression(
                 preds,
                 conf_thres,
@@ -331,6 +345,19 @@ def run(
             correct = torch.zeros(npr, niou, dtype=torch.bool, device=device)  # init
             seen += 1
 
+            # Object counts per class (predicted, labelled)
+            pcls = count_preds[si][:, 5].long()
+            if single_cls:
+                pcls[:] = 0
+            counts.append(
+                torch.stack(
+                    (
+                        torch.bincount(pcls, minlength=nc),
+                        torch.bincount(labels[:, 0].long(), minlength=nc),
+                    )
+                )
+            )
+
             if npr == 0:
                 if nl:
                     stats.append(
@@ -402,10 +429,19 @@ def run(
         ap50, ap = ap[:, 0], ap.mean(1)  # AP@0.5, AP@0.5:0.95
         mp, mr, map50, map = p.mean(), r.mean(), ap50.mean(), ap.mean()
     nt = np.bincount(stats[3].astype(int), minlength=nc)  # number of targets per class
+    counts = torch.stack(counts).cpu().numpy() if counts else np.zeros((0, 2, nc))
+    cmae, crmse, crel = count_metrics(counts[:, 0], counts[:, 1])  # per class
+    labelled = counts[:, 1].sum(0) > 0  # classes with labels in the dataset
+    count_mae, count_rmse, count_rel = (
+        (x[labelled].mean() if labelled.any() else 0.0) for x in (cmae, crmse, crel)
+    )
 
     # Print results
-    pf = "%22s" + "%11i" * 2 + "%11.3g" * 4  # print format
-    LOGGER.info(pf % ("all", seen, nt.sum(), mp, mr, map50, map))
+    pf = "%22s" + "%11i" * 2 + "%11.3g" * 7  # print format
+    LOGGER.info(
+        pf
+        % ("all", seen, nt.sum(), mp, mr, map50, map, count_mae, count_rmse, count_rel)
+    )
     if nt.sum() == 0:
         LOGGER.warning(
             f"WARNING ⚠️ no labels found in {task} set, can not compute metrics without labels"
@@ -414,7 +450,21 @@ def run(
     # Print results per class
     if (verbose or (nc < 50 and not training)) and nc > 1 and len(stats):
         for i, c in enumerate(ap_class):
-            LOGGER.info(pf % (names[c], seen, nt[c], p[i], r[i], ap50[i], ap[i]))
+            LOGGER.info(
+                pf
+                % (
+                    names[c],
+                    seen,
+                    nt[c],
+                    p[i],
+                    r[i],
+                    ap50[i],
+                    ap[i],
+                    cmae[c],
+                    crmse[c],
+                    crel[c],
+                )
+            )
 
     # Print speeds
     t = tuple(x.t / seen * 1e3 for x in dt)  # speeds per image
@@ -478,7 +528,20 @@ def run(
     maps = np.zeros(nc) + map
     for i, c in enumerate(ap_class):
         maps[c] = ap[i]
-    return (mp, mr, map50, map, *(loss.cpu() / len(dataloader)).tolist()), maps, t
+    return (
+        (
+            mp,
+            mr,
+            map50,
+            map,
+            *(loss.cpu() / len(dataloader)).tolist(),
+            count_mae,
+            count_rmse,
+            count_rel,
+        ),
+        maps,
+        t,
+    )
 
 
 def parse_opt():
@@ -511,6 +574,24 @@ def parse_opt():
     parser.add_argument(
         "--max-det", type=int, default=300, help="maximum detections per image"
     )
+    parser.add_argument(
+        "--count-conf-thres",
+        type=float,
+        default=0.25,
+        help="confidence threshold of the object counts",
+    )
+    parser.add_argument(
+        "--count-iou-thres",
+        type=float,
+        default=0.45,
+        help="NMS IoU threshold of the object counts",
+    )
+    parser.add_argument(
+        "--count-max-det",
+        type=int,
+        default=1000,
+        help="maximum objects counted per image",
+    )
     parser.add_argument(
         "--task", default="val", help="train, val, test, speed or study"
     )
@@ -204,6 +204,9 @@ def export_onnx(model, im, file, opset, dynamic, simplify, prefix=colorstr("ONNX
         input_names=["images"],
         output_names=output_names,
         dynamic_axes=dynamic or None,
+        **(
+            {"dynamo": False} if check_version(torch.__version__, "2.5.0") else {}
+        ),  # TorchScript-based exporter, the default before torch 2.9
     )
 
     # Checks
@@ -241,15 +244,22 @@ def export_onnx(model, im, file, opset, dynamic, simplify, prefix=colorstr("ONNX
 def export_openvino(file, metadata, half, prefix=colorstr("OpenVINO:")):
     # YOLOv5 OpenVINO export
     check_requirements(
-        "openvino-dev"
+        "openvino-dev>=2023.0"
     )  # requires openvino-dev: https://pypi.org/project/openvino-dev/
-    import openvino.inference_engine as ie
+    import openvino.runtime as ov  # noqa
+    from openvino.tools import mo  # noqa
 
-    LOGGER.info(f"\n{prefix} starting export with openvino {ie.__version__}...")
+    LOGGER.info(f"\n{prefix} starting export with openvino {ov.__version__}...")
     f = str(file).replace(".pt", f"_openvino_model{os.sep}")
+    f_ov = str(Path(f) / file.with_suffix(".xml").name)
 
-    cmd = f"mo --input_model {file.with_suffix('.onnx')} --output_dir {f} --data_type {'FP16' if half else 'FP32'}"
-    subprocess.run(cmd.split(), check=True, env=os.environ)  # export
+    ov_model = mo.convert_model(
+        file.with_suffix(".onnx"),
+        model_name=file.stem,
+        framework="onnx",
+        compress_to_fp16=half,
+    )  # export
+    ov.serialize(ov_model, f_ov)  # save
     yaml_save(Path(f) / file.with_suffix(".yaml").name, metadata)  # add metadata.yaml
     return f, None
 
@@ -26,11 +26,23 @@ sys.path.append(str(pathlib.Path(__file__).parent.resolve()))
 
 import base64
 import cv2
+import itertools
+import json
 import magic
 import numpy as np
 import os
+import queue
+import tempfile
+import threading
+import time
+import torch
 import yaml
-from detect import run
+from concurrent.futures import Future
+from detect import count_detections, summarize_detections
+from models.common import DetectMultiBackend, exported_weights, select_backend
+from utils.augmentations import letterbox
+from utils.general import LOGGER, check_img_size, non_max_suppression, scale_boxes
+from utils.torch_utils import select_device, smart_inference_mode
 
 # Define path to gse-inference library for dev or prod
 lib_path = "/cnvrg_libraries/dev-gse-inference/"
@@ -49,9 +61,222 @@ def find_model(trained_path, standalone_path):
     return standalone_path
 
 
-# Get location of object counter model
-model_path = find_model(
-    config["trained_model_path"], lib_path + config["standalone_model_name"]
+class InferenceEngine:
+    """Keeps the object counter model resident in memory between requests
+
+    The model is loaded and warmed up once. Before serving a request the engine
+    checks whether the model file has changed on disk (or a trained model has
+    appeared) and, if so, loads the new model and swaps it in. Requests that are
+    already running keep using the previous model. With auto_backend, the OpenVINO
+    or ONNX export next to the model is used instead when it is faster on the host
+    CPU and matches the PyTorch output.
+
+    Args:
+        trained_path: path to the finetuned model file
+        standalone_path: path to the fallback (pre-trained) model file
+        imgsz: inference size (height, width)
+        device: cuda device, i.e. 0 or 0,1,2,3 or cpu
+        auto_backend: pick the fastest of the model and its OpenVINO and ONNX exports
+    """
+
+    def __init__(
+        self,
+        trained_path,
+        standalone_path,
+        imgsz=(640, 640),
+        device="",
+        auto_backend=False,
+    ):
+        self.trained_path = trained_path
+        self.standalone_path = standalone_path
+        self.imgsz = imgsz
+        self.device = select_device(device)
+        self.auto_backend = auto_backend
+        self.lock = threading.Lock()
+        self.model, self.model_path, self.model_mtime = None, None, None
+        self.load(find_model(trained_path, standalone_path))
+
+    @staticmethod
+    def _mtime(path):
+        # Newest change to the model or its exports, so that finished exports are picked up
+        if not os.path.exists(path):
+            return None
+        return max(os.path.getmtime(p) for p in [path, *exported_weights(path)])
+
+    def load(self, path):
+        """Loads and warms up the model at path, then makes it the active model"""
+        mtime = self._mtime(path)
+        weights = path
+        if self.auto_backend:
+            weights = select_backend(path, self.device, self.imgsz)
+        model = DetectMultiBackend(weights, device=self.device)
+        imgsz = check_img_size(self.imgsz, s=model.stride)
+
+        # DetectMultiBackend.warmup() skips CPU devices, so run one real forward pass
+        im = torch.zeros(
+            1,
+            3,
+            *imgsz,
+            dtype=torch.half if model.fp16 else torch.float,
+            device=model.device,
+        )
+        model(im)
+
+        self.model, self.model_path, self.model_mtime = model, path, mtime
+        LOGGER.info(f"Loaded resident model {weights}")
+
+    def get_model(self):
+        """Returns the active model, reloading it first if the file changed on disk"""
+        path = find_model(self.trained_path, self.standalone_path)
+        if path != self.model_path or self._mtime(path) != self.model_mtime:
+            with self.lock:
+                # Another request may have reloaded the model while we waited
+                if path != self.model_path or self._mtime(path) != self.model_mtime:
+                    try:
+                        self.load(path)
+                    except Exception as e:
+                        # Keep serving the previous model, e.g. if the file is still being written
+                        LOGGER.warning(f"Failed to reload model {path}: {e}")
+        return self.model
+
+
+class MicroBatcher:
+    """Runs images from concurrent requests through the resident model in batches
+
+    Requests are queued and a single worker thread collects them for up to
+    max_wait_ms or until max_batch_size images are waiting. The images are
+    letterboxed to the same fixed shape, run as one batched tensor and the NMS
+    output is split back to each caller.
+
+    Args:
+        engine: the InferenceEngine holding the resident model
+        max_batch_size: maximum number of images per forward pass
+        max_wait_ms: maximum time to wait for more images before running a batch
+        conf_thres: confidence threshold
+        iou_thres: NMS IoU threshold
+        max_det: maximum detections per image
+        topk: number of most confident candidates per image kept before NMS, 0 keeps all
+        topk_objectness: select the topk candidates by objectness before class scoring
+    """
+
+    def __init__(
+        self,
+        engine,
+        max_batch_size=8,
+        max_wait_ms=10,
+        conf_thres=0.25,
+        iou_thres=0.45,
+        max_det=1000,
+        topk=0,
+        topk_objectness=False,
+    ):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1e3
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        self.max_det = max_det
+        self.topk = topk
+        self.topk_objectness = topk_objectness
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, im0):
+        """Queues a BGR image and blocks until its detections are ready
+
+        Returns:
+            det: NMS output (xyxy, conf, cls) scaled to im0
+            names: class names of the model that made the prediction
+        """
+        return self.submit_many([im0])[0]
+
+    def submit_many(self, ims0):
+        """Queues several BGR images at once so they can share a batch
+
+        Returns:
+            a list of (det, names) tuples in the same order as ims0
+        """
+        futures = []
+        for im0 in ims0:
+            future = Future()
+            self.queue.put((im0, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _collect(self):
+        # Block for the first request, then gather more until the batch is full or time is up
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.predict_batch([im0 for im0, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception:
+                # Retry one by one so that a bad image only fails its own request
+                for im0, future in batch:
+                    try:
+                        future.set_result(self.predict_batch([im0])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+
+    @smart_inference_mode()
+    def predict_batch(self, ims0):
+        """Runs a list of BGR images through the model as one batch"""
+        model = self.engine.get_model()
+        imgsz = check_img_size(self.engine.imgsz, s=model.stride)
+
+        # Letterbox every image to the same fixed shape so they can be stacked
+        ims = np.stack(
+            [letterbox(im0, imgsz, stride=model.stride, auto=False)[0] for im0 in ims0]
+        )
+        ims = np.ascontiguousarray(ims.transpose((0, 3, 1, 2))[:, ::-1])  # BGR to RGB
+        im = torch.from_numpy(ims).to(model.device)
+        im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
+        im /= 255  # 0 - 255 to 0.0 - 1.0
+
+        pred = model(im)
+        pred = non_max_suppression(
+            pred,
+            self.conf_thres,
+            self.iou_thres,
+            max_det=self.max_det,
+            topk=self.topk,
+            topk_objectness=self.topk_objectness,
+        )
+
+        results = []
+        for det, im0 in zip(pred, ims0):
+            det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
+            results.append((det.cpu(), model.names))
+        return results
+
+
+# Load the object counter model once, it is shared by all requests
+engine = InferenceEngine(
+    config["trained_model_path"],
+    lib_path + config["standalone_model_name"],
+    auto_backend=config["auto_backend"],
+)
+batcher = MicroBatcher(
+    engine,
+    max_batch_size=config["batch_max_size"],
+    max_wait_ms=config["batch_max_wait_ms"],
+    topk=config["nms_topk"],
+    topk_objectness=config["nms_topk_objectness"],
 )
 
 # Specify acceptable file formats
@@ -59,13 +284,134 @@ img_formats = ["jpg", "jpeg", "png"]
 vid_formats = ["mov", "avi", "mp4", "mpg", "mpeg", "m4v", "wmv", "mkv"]
 
 
+def format_output(obj_info, obj_counts):
+    """Returns the list of detections followed by the object count for each class"""
+    output = []
+    for classname in obj_info:
+        output += obj_info[classname]
+        count_dict = {
+            "object": classname,
+            "object_count": obj_counts[classname],
+        }
+        output.append(count_dict)
+    return output
+
+
+def summarize(det, names, shape, counts_only=False):
+    """Returns the output list for one image or frame
+
+    With counts_only, the per-class counts come from one bincount and the
+    output only contains the object count for each class.
+    """
+    if counts_only:
+        obj_counts = count_detections(det, names)
+        return [{"object": c, "object_count": n} for c, n in obj_counts.items()]
+    return format_output(*summarize_detections(det, names, shape))
+
+
+def read_video_frames(path, vid_stride=1, max_frames=0):
+    """Yields (frame number, BGR frame) for every vid_stride-th frame of a video
+
+    Frame numbers are the 1-based indexes of the frames in the source video.
+    Frames are decoded one at a time and reading stops after max_frames processed
+    frames (0 means no limit), so long videos are never held in memory.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        n = 0  # processed frames
+        while not max_frames or n < max_frames:
+            for _ in range(vid_stride):
+                ret_val = cap.grab()
+            if not ret_val:
+                break
+            ret_val, frame = cap.retrieve()
+            if not ret_val:
+                break
+            n += 1
+            yield n * vid_stride, frame
+    finally:
+        cap.release()
+
+
+def predict_video(decoded, file_ext, vid_stride=1, max_frames=0, counts_only=False):
+    """Performs object counting on a video frame by frame
+
+    The video is written to a temporary file private to this request. Frames are
+    submitted to the batcher in chunks and results are yielded as soon as each
+    chunk is done.
+
+    Args:
+        decoded: the uploaded video bytes
+        file_ext: file extension of the video
+        vid_stride: only every vid_stride-th frame is processed
+        max_frames: maximum number of frames to process, 0 means no limit
+        counts_only: only return the object count for each class
+    Yields:
+        frame_name: name of the frame by its index in the video, i.e. test_frame1.jpg
+        output: list of detections and object counts for the frame
+    """
+    name = os.path.basename(config["test_file_name"])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f"{name}.{file_ext}")
+        with open(path, "wb") as fh:
+            fh.write(decoded)
+
+        frames = read_video_frames(path, vid_stride, max_frames)
+        while True:
+            chunk = list(itertools.islice(frames, batcher.max_batch_size))
+            if not chunk:
+                break
+            results = batcher.submit_many([frame for _, frame in chunk])
+            for (n, frame), (det, names) in zip(chunk, results):
+                output = summarize(det, names, frame.shape, counts_only)
+                yield f"{name}_frame{n}.jpg", output
+
+
+def predict_image(decoded, counts_only=False):
+    """Performs object counting on an uploaded image and returns its output list"""
+    # Decode straight to a 3-channel BGR array, ignoring EXIF orientation
+    # like the previous imwrite/imread round trip did
+    nparr = np.frombuffer(decoded, np.uint8)
+    test_img = cv2.imdecode(nparr, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if test_img is None:  # fail this request only, before it joins a batch
+        raise ValueError("The uploaded image could not be decoded")
+
+    # Make predictions on the in-memory image, batched with concurrent requests
+    det, names = batcher.submit(test_img)
+    return summarize(det, names, test_img.shape, counts_only)
+
+
+def video_options(data):
+    """Returns the request-level vid_stride and max_frames, falling back to the config"""
+    vid_stride = int(data.get("vid_stride", config["vid_stride"]))
+    max_frames = int(data.get("max_frames", config["max_frames"]))
+    return max(vid_stride, 1), max(max_frames, 0)
+
+
+def counts_only_option(data):
+    """Returns the request-level counts_only flag, falling back to the config"""
+    return str(data.get("counts_only", config["counts_only"])).lower() == "true"
+
+
+def stream_option(data):
+    """Returns the request-level stream flag, streaming is off unless requested"""
+    return str(data.get("stream", False)).lower() == "true"
+
+
 def predict(data):
     """Performs object counting on an image provided as input to the webservice
     Args:
-        data: a json object representing input data
+        data: a json object representing input data. An optional counts_only key
+            returns only the object counts, and an optional stream key set to true
+            streams the results with predict_stream. Videos accept optional
+            vid_stride and max_frames keys
     Returns:
-        response: dictionary containing the prediction/results
+        response: dictionary containing the prediction/results, or the NDJSON
+            lines of predict_stream when streaming was requested
     """
+    if stream_option(data):
+        return predict_stream(data)
+
     # Define json response
     response = {}
     response["output"] = []
@@ -73,51 +419,46 @@ def predict(data):
     # Perform base 64 conversion on uploaded data
     decoded = base64.b64decode(data["media"][0])
 
-    # Get file extension and define save path for test image/video
+    # Get file extension
     file_ext = magic.from_buffer(decoded, mime=True).split("/")[-1]
-    savepath = config["test_file_name"] + f".{file_ext}"
 
     # Process images and videos depending on file format
     if file_ext in img_formats:
-        nparr = np.fromstring(decoded, np.uint8)
-        test_img = cv2.imdecode(nparr, cv2.IMREAD_UNCHANGED)
-        cv2.imwrite(savepath, test_img)
-
-        # Make predictions
-        result = run(weights=model_path, source=savepath, save_conf=True, save_txt=True)
-
-        # create json response for image
-        obj_info = result[savepath][0]
-        obj_counts = result[savepath][1]
-        for classname in obj_info:
-            response["output"] += obj_info[classname]
-            count_dict = {
-                "object": classname,
-                "object_count": obj_counts[classname],
-            }
-            response["output"].append(count_dict)
+        response["output"] = predict_image(decoded, counts_only_option(data))
 
     elif file_ext in vid_formats:
-        fh = open(savepath, "wb")
-        fh.write(decoded)
-        fh.close()
-
-        # Make predictions
-        result = run(weights=model_path, source=savepath, save_conf=True, save_txt=True)
-
         # create json response for video
-        for filename in result:
-            file_dict = {}
-            file_dict[filename] = []
-            obj_info = result[filename][0]
-            obj_counts = result[filename][1]
-            for classname in obj_info:
-                file_dict[filename] += obj_info[classname]
-                count_dict = {
-                    "object": classname,
-                    "object_count": obj_counts[classname],
-                }
-                file_dict[filename].append(count_dict)
-            response["output"].append(file_dict)
+        vid_stride, max_frames = video_options(data)
+        for frame_name, output in predict_video(
+            decoded, file_ext, vid_stride, max_frames, counts_only_option(data)
+        ):
+            response["output"].append({frame_name: output})
 
     return response
+
+
+def predict_stream(data):
+    """Performs object counting and streams the results as NDJSON
+
+    Yields one JSON line per processed video frame as soon as it is available,
+    or a single line for an image, instead of buffering the whole response.
+    Args:
+        data: a json object representing input data. An optional counts_only key
+            returns only the object counts. Videos accept optional vid_stride and
+            max_frames keys
+    Yields:
+        line: a JSON encoded result followed by a newline
+    """
+    decoded = base64.b64decode(data["media"][0])
+    file_ext = magic.from_buffer(decoded, mime=True).split("/")[-1]
+
+    if file_ext in img_formats:
+        output = predict_image(decoded, counts_only_option(data))
+        yield json.dumps({"output": output}) + "\n"
+
+    elif file_ext in vid_formats:
+        vid_stride, max_frames = video_options(data)
+        for frame_name, output in predict_video(
+            decoded, file_ext, vid_stride, max_frames, counts_only_option(data)
+        ):
+            yield json.dumps({"frame": frame_name, "output": output}) + "\n"
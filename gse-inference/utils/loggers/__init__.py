@@ -92,6 +92,9 @@ class Loggers:
             "val/box_loss",
             "val/obj_loss",
             "val/cls_loss",  # val loss
+            "metrics/count_MAE",
+            "metrics/count_RMSE",
+            "metrics/count_rel_error",  # object count metrics
             "x/lr0",
             "x/lr1",
             "x/lr2",
@@ -355,7 +358,7 @@ class Loggers:
                 )
 
         if self.wandb:
-            self.wandb.log(dict(zip(self.keys[3:10], results)))
+            self.wandb.log(dict(zip(self.keys[3:13], results)))
             self.wandb.log(
                 {"Results": [wandb.Image(str(f), caption=f.name) for f in files]}
             )
@@ -377,7 +380,7 @@ class Loggers:
             )
 
         if self.comet_logger:
-            final_results = dict(zip(self.keys[3:10], results))
+            final_results = dict(zip(self.keys[3:13], results))
             self.comet_logger.on_train_end(
                 files, self.save_dir, last, best, epoch, final_results
             )
@@ -14,12 +14,33 @@ import torch
 from utils import TryExcept, threaded
 
 
-def fitness(x):
-    # Model fitness as a weighted combination of metrics
+def fitness(x, mode="map"):
+    # Model fitness as a weighted combination of metrics, or the object count accuracy
+    if mode == "count":
+        return 1 / (1 + x[:, 9])  # column 9 of the val.py results: relative count error
     w = [0.0, 0.0, 0.1, 0.9]  # weights for [P, R, mAP@0.5, mAP@0.5:0.95]
     return (x[:, :4] * w).sum(1)
 
 
+def count_metrics(pred, true):
+    """
+    Compute the object count errors of every class over a set of images
+    Arguments:
+        pred (array[N, nc]), number of predicted objects of every class in every image
+        true (array[N, nc]), number of labelled objects of every class in every image
+    Returns:
+        mae (array[nc]), mean absolute count error per image
+        rmse (array[nc]), root mean squared count error per image
+        rel (array[nc]), absolute count errors relative to the number of labelled objects
+    """
+    e = pred.astype(np.float64) - true
+    n = max(len(e), 1)
+    mae = np.abs(e).sum(0) / n
+    rmse = np.sqrt((e**2).sum(0) / n)
+    rel = np.abs(e).sum(0) / np.maximum(true.sum(0), 1)
+    return mae, rmse, rel
+
+
 def smooth(y, f=0.05):
     # Box filter of fraction f
     nf = round(len(y) * f * 2) // 2 + 1  # number of filter elements (must be odd)
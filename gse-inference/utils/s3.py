@@ -0,0 +1,218 @@
+# YOLOv5 🚀 by Ultralytics, GPL-3.0 license
+"""
+S3 dataset source, reads s3:// images and labels on demand instead of staging the dataset to local disk
+
+Objects are read through one pooled boto3 client per process in range GETs of YOLOV5_S3_BLOCK_MB, which are kept in a
+local block cache of at most YOLOV5_S3_CACHE_GB, evicting the least recently used blocks. Object sizes and ETags come
+from one listing per directory, so reads need no HEAD requests and blocks of changed objects are never reused.
+
+Usage:
+    $ python train.py --data dataset.yaml  # with train: s3://bucket/images/train
+    $ python detect.py --source s3://bucket/images/test
+
+Credentials and endpoint are read by boto3, i.e. AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and AWS_ENDPOINT_URL_S3 for
+S3-compatible storage like MinIO.
+"""
+
+import contextlib
+import hashlib
+import math
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+from utils.general import CONFIG_DIR, check_requirements
+
+S3_CACHE_DIR = Path(
+    os.getenv("YOLOV5_S3_CACHE_DIR", CONFIG_DIR / "s3_cache")
+)  # block cache and local files of s3:// datasets
+S3_CACHE_GB = float(os.getenv("YOLOV5_S3_CACHE_GB", 20))  # block cache size limit
+S3_BLOCK_MB = float(os.getenv("YOLOV5_S3_BLOCK_MB", 4))  # range GET size
+S3_WORKERS = int(os.getenv("YOLOV5_S3_WORKERS", 16))  # concurrent GETs per process
+
+
+def is_s3(path):
+    # Return True for s3://bucket/key URLs
+    return str(path).startswith("s3://")
+
+
+def split_url(url):
+    # Split s3://bucket/key into bucket and key
+    u = urlparse(str(url))
+    return u.netloc, u.path.lstrip("/")
+
+
+def local_path(url):
+    # Local path for files derived from an s3:// URL, i.e. *.cache label caches and *.npy image caches
+    bucket, key = split_url(url)
+    return S3_CACHE_DIR / "files" / bucket / key
+
+
+class S3Store:
+    # Reads S3 objects in pooled range GETs through a least recently used block cache on local disk
+    def __init__(
+        self,
+        cache_dir=S3_CACHE_DIR / "blocks",
+        cache_gb=S3_CACHE_GB,
+        block_mb=S3_BLOCK_MB,
+        workers=S3_WORKERS,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_bytes = int(cache_gb * 1e9)
+        self.block_size = max(int(block_mb * 2**20), 1)
+        self.workers = workers
+        self.objects = {}  # url: (size, etag) from listings
+        self.listed = set()  # (bucket, prefix) listed into self.objects
+        self.lock = threading.Lock()
+        self.written = 0  # bytes cached since the last eviction
+        self.pid = None  # process the client and pool belong to
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        # Dataloader workers inherit the listings, but not a lock held by another thread or the client
+        self.lock, self.pid = threading.Lock(), None
+
+    def connect(self):
+        # boto3 clients can not be used across fork(), each process creates its own client and thread pool
+        with self.lock:
+            if self.pid != os.getpid():
+                check_requirements("boto3")
+                import boto3
+                from botocore.config import Config
+
+                config = Config(
+                    max_pool_connections=self.workers,
+                    retries={"max_attempts": 10, "mode": "adaptive"},
+                )
+                self.client = boto3.client("s3", config=config)
+                self.pool = ThreadPoolExecutor(self.workers)
+                self.pid = os.getpid()
+        return self.client
+
+    def list(self, url):
+        # Return the sorted URLs of all objects under an s3:// prefix, or [url] if it is an object
+        if url in self.objects:  # listed object, i.e. from a list of images
+            return [url]
+        bucket, key = split_url(url)
+        prefix = f"{key.rstrip('/')}/" if key.rstrip("/") else ""
+        urls = []
+        for page in (
+            self.connect()
+            .get_paginator("list_objects_v2")
+            .paginate(Bucket=bucket, Prefix=prefix)
+        ):
+            for x in page.get("Contents", []):
+                u = f"s3://{bucket}/{x['Key']}"
+                self.objects[u] = x["Size"], x["ETag"]
+                if not u.endswith("/"):
+                    urls.append(u)
+        self.listed.add((bucket, prefix))
+        if not urls and self.stat(url.rstrip("/")):
+            return [url.rstrip("/")]
+        return sorted(urls)
+
+    def stat(self, url):
+        # Return (size, ETag) of an object, or None if it does not exist. Lists its directory on first use
+        if url not in self.objects:
+            bucket, key = split_url(url)
+            if not any(b == bucket and key.startswith(p) for b, p in self.listed):
+                parent = key.rsplit("/", 1)[0] if "/" in key else ""
+                self.list(f"s3://{bucket}/{parent}")
+        return self.objects.get(url)
+
+    def read(self, url):
+        # Return the contents of an object, reading all its blocks concurrently
+        info = self.stat(url)
+        if info is None:
+            raise FileNotFoundError(f"{url} does not exist")
+        size, etag = info
+        n = max(math.ceil(size / self.block_size), 1)  # number of blocks
+        if n == 1:
+            return self.read_block(url, size, etag, 0)
+        self.connect()
+        return b"".join(
+            self.pool.map(lambda i: self.read_block(url, size, etag, i), range(n))
+        )
+
+    def read_range(self, url, offset, size):
+        # Return size bytes of an object from offset, i.e. one image in a shard
+        total, etag = self.stat(url)
+        first, last = offset // self.block_size, (offset + size - 1) // self.block_size
+        blocks = range(first, last + 1)
+        data = b"".join(self.read_block(url, total, etag, i) for i in blocks)
+        start = offset - first * self.block_size
+        return data[start : start + size]
+
+    def blocks(self, url, offset=0):
+        # Yield the blocks of an object in order from the one containing offset, reading up to workers blocks ahead
+        size, etag = self.stat(url)
+        n = max(math.ceil(size / self.block_size), 1)  # number of blocks
+        self.connect()
+        pending = deque()
+        for i in range(offset // self.block_size, n):
+            pending.append(self.pool.submit(self.read_block, url, size, etag, i))
+            if len(pending) > self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def read_block(self, url, size, etag, i):
+        # Return block i of an object from the cache, or with a range GET
+        h = hashlib.sha1(f"{url} {etag} {self.block_size} {i}".encode()).hexdigest()
+        f = self.cache_dir / h[:2] / h
+        with contextlib.suppress(OSError):  # not cached, or evicted meanwhile
+            data = f.read_bytes()
+            os.utime(f)  # mark as recently used
+            return data
+        bucket, key = split_url(url)
+        start, end = i * self.block_size, min((i + 1) * self.block_size, size) - 1
+        kwargs = {"Range": f"bytes={start}-{end}"} if size else {}
+        data = (
+            self.connect()
+            .get_object(Bucket=bucket, Key=key, IfMatch=etag, **kwargs)["Body"]
+            .read()
+        )
+        self.save_block(f, data)
+        return data
+
+    def save_block(self, f, data):
+        # Add a block to the cache, evicting the least recently used blocks every 10% of the cache size written
+        # The cache is optional, i.e. on a full or read-only disk
+        with contextlib.suppress(OSError):
+            f.parent.mkdir(parents=True, exist_ok=True)
+            tmp = f.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, f)  # atomic, blocks are shared by all processes
+            with self.lock:
+                self.written += len(data)
+                evict = self.written > self.cache_bytes / 10
+                if evict:
+                    self.written = 0
+            if evict:
+                self.evict()
+
+    def evict(self):
+        # Delete the least recently used blocks until the cache is below 90% of its size limit
+        files = []
+        for f in self.cache_dir.glob("*/*"):
+            with contextlib.suppress(OSError):
+                s = f.stat()
+                files.append((s.st_mtime, s.st_size, f))
+        total = sum(x[1] for x in files)
+        for _, size, f in sorted(files, key=lambda x: x[0]):
+            if total <= 0.9 * self.cache_bytes:
+                break
+            with contextlib.suppress(OSError):
+                f.unlink()
+                total -= size
+
+    def clear(self):
+        # Forget all listings, i.e. to see objects changed since they were listed
+        self.objects, self.listed = {}, set()
+
+
+S3 = S3Store()  # shared by all s3:// datasets of a process
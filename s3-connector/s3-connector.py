@@ -27,18 +27,24 @@ Sample python script to work with S3 buckets and objects.
 This package performs basic S3 operations.
 """
 import argparse
+import copy
 import functools
+import hashlib
+import json
 import logging
 import os
 import pprint
 import sys
+import threading
 import time
 import boto3
 import botocore
 import tabulate
 import tqdm
 import urllib3
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
 from botocore.handlers import disable_signing
+from s3transfer.subscribers import BaseSubscriber
 from cnvrgv2 import Cnvrg
 from cnvrgv2.errors import CnvrgHttpError
 
@@ -56,6 +62,7 @@ def parse_parameters():
         %(prog)s -e https://s3.amazonaws.com listobj my_bucket -t
         %(prog)s -e https://s3.amazonaws.com upload my_bucket -f file1
         %(prog)s -e https://s3.amazonaws.com upload my_bucket -d mydir
+        %(prog)s -e https://s3.amazonaws.com sync my_bucket -p mydir -l /data
     """
     # Create the argparse object and define global options
     parser = argparse.ArgumentParser(
@@ -72,6 +79,18 @@ def parse_parameters():
     parser.add_argument(
         "-r", "--region", default=None, dest="region_name", help="S3 Region Name"
     )
+    parser.add_argument(
+        "--multipart_threshold",
+        type=int,
+        default=8,
+        help="Size in MB from which objects are transferred in parts. Default 8",
+    )
+    parser.add_argument(
+        "--multipart_chunksize",
+        type=int,
+        default=8,
+        help="Size in MB of the parts of large objects. Default 8",
+    )
 
     # Add subcommands options
     subparsers = parser.add_subparsers(title="Commands", dest="command")
@@ -141,6 +160,13 @@ def parse_parameters():
         action="store_true",
         help="Do not keep local directory structure on uploaded objects names",
     )
+    upload_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=16,
+        help="Number of files uploaded concurrently from a directory. Default 16",
+    )
     upload_group = upload_parser.add_mutually_exclusive_group(required=True)
     upload_group.add_argument("-f", "--file", dest="filename", help="File to upload")
     upload_group.add_argument(
@@ -177,6 +203,13 @@ def parse_parameters():
         "--versionid",
         help="Object version id",
     )
+    download_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=16,
+        help="Number of objects downloaded concurrently with a prefix. Default 16",
+    )
     download_group = download_parser.add_mutually_exclusive_group(required=True)
     download_group.add_argument(
         "-f", "--file", dest="filename", help="Download a specific file"
@@ -189,6 +222,54 @@ def parse_parameters():
     )
     download_parser.set_defaults(func=cmd_download)
 
+    # Sync directory
+    sync_parser = subparsers.add_parser(
+        "sync", help="Transfer only new or changed files between bucket and directory"
+    )
+    sync_parser.add_argument("bucket", help="Bucket Name")
+    sync_parser.add_argument(
+        "--bucketname",
+        action="store_true",
+        help="Disable progress bar",
+    )
+    sync_parser.add_argument(
+        "-l",
+        "--localdir",
+        default=".",
+        dest="localdir",
+        help="Local directory to synchronize. Default current directory",
+    )
+    sync_parser.add_argument(
+        "-p",
+        "--prefix",
+        default="",
+        dest="prefix",
+        help="Only objects and files with a prefix. Default all objects",
+    )
+    sync_parser.add_argument(
+        "--direction",
+        default="download",
+        choices=["download", "upload", "both"],
+        help="""
+        Download changed objects, upload changed files, or both (the newer
+        version wins if an object and its file both changed). Default download
+        """,
+    )
+    sync_parser.add_argument(
+        "-m",
+        "--manifest",
+        default=".s3-manifest.json",
+        help="Manifest file in the local directory. Default .s3-manifest.json",
+    )
+    sync_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=16,
+        help="Number of objects transferred concurrently. Default 16",
+    )
+    sync_parser.set_defaults(func=cmd_sync)
+
     # cnvrg_dataset
     download_parser.add_argument(
         "--cnvrg_dataset",
@@ -373,31 +454,103 @@ class Config:
         return os.environ.get(var)
 
 
+def describe_error(error):
+    """Return a short description of a failed transfer."""
+    if isinstance(error, PermissionError):
+        return "permission denied to access file {}".format(error.filename)
+    if isinstance(error, FileNotFoundError):
+        return "file '{}' not found".format(error.filename)
+    if isinstance(error, botocore.exceptions.ClientError):
+        if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return "object not found"
+        return error.response["Error"].get("Message") or str(error)
+    return "{}: {}".format(type(error).__name__, error)
+
+
 class ProgressBar(tqdm.tqdm):
     """Class to display progress bar."""
 
+    update_lock = threading.Lock()
+
     def update_to(self, bytes_sent):
         """
         Update tqdm status bar.
 
+        It is called from the transfer threads, so updates are serialized.
+
         Params:
             bytes_sent    (int): number of bytes transferred
         """
-        return self.update(bytes_sent)
+        with self.update_lock:
+            return self.update(bytes_sent)
+
+
+MB = 1024**2
+
+
+class TransferSubscriber(BaseSubscriber):
+    """Class to follow a transfer of the s3transfer TransferManager."""
+
+    def __init__(self, size, callback, on_done=None, etag=None):
+        """
+        Initialize TransferSubscriber class.
+
+        Params:
+            size          (int): Object size, known from the listing, so that
+                                 the download does not need a HeadObject
+                                 request. None to let s3transfer request it
+            callback     (func): Called with the number of bytes transferred
+            on_done      (func): Called when the transfer is done
+            etag          (str): Object ETag, known from the listing. Recent
+                                 s3transfer versions also need it to skip the
+                                 HeadObject request
+        """
+        self.size = size
+        self.callback = callback
+        self.done_callback = on_done
+        self.etag = etag
+
+    def on_queued(self, future, **kwargs):
+        """Provide the object size and ETag when the transfer is queued."""
+        if self.size is not None:
+            future.meta.provide_transfer_size(self.size)
+        if self.etag is not None and hasattr(future.meta, "provide_object_etag"):
+            future.meta.provide_object_etag(self.etag)
+
+    def on_progress(self, future, bytes_transferred, **kwargs):
+        """Report the bytes transferred."""
+        self.callback(bytes_transferred)
+
+    def on_done(self, future, **kwargs):
+        """Report the transfer as done."""
+        if self.done_callback:
+            self.done_callback()
 
 
 class S3:
     """Class to handle S3 operations."""
 
-    def __init__(self, key, secret, s3_endpoint, region_name):
+    def __init__(
+        self,
+        key,
+        secret,
+        s3_endpoint,
+        region_name,
+        max_workers=1,
+        transfer_config=None,
+    ):
         """
         Initialize s3 class.
 
         Params:
-            key           (str): AWS_ACCESS_KEY_ID
-            secret        (str): AWS_SECRET_ACCESS_KEY
-            s3_endpoint   (str): S3 endpoint URL
-            region_name   (str): Region Name
+            key               (str): AWS_ACCESS_KEY_ID
+            secret            (str): AWS_SECRET_ACCESS_KEY
+            s3_endpoint       (str): S3 endpoint URL
+            region_name       (str): Region Name
+            max_workers       (int): Number of concurrent transfers. The client
+                                     keeps at least as many connections open
+            transfer_config   (obj): TransferConfig with the multipart
+                                     settings. Default boto3 settings
         """
         self.s3_resource = boto3.resource(
             "s3",
@@ -406,7 +559,12 @@ class S3:
             region_name=region_name,
             aws_access_key_id=key,
             aws_secret_access_key=secret,
+            config=botocore.config.Config(max_pool_connections=max(max_workers, 10)),
         )
+        # Clients are thread safe, resources are not: concurrent transfers
+        # share the client of the resource
+        self.s3_client = self.s3_resource.meta.client
+        self.transfer_config = transfer_config or TransferConfig()
         self.disable_pbar = False
         self.buckets_exist = []
 
@@ -543,6 +701,18 @@ class S3:
             Delete={"Objects": [obj]}
         )
 
+    def create_transfer_manager(self, workers):
+        """
+        Create a TransferManager using the shared client.
+
+        Params:
+            workers        (int): Number of concurrent transfers of objects
+                                  or parts of large objects (max_concurrency)
+        """
+        config = copy.copy(self.transfer_config)
+        config.max_concurrency = max(workers, 1)
+        return create_transfer_manager(self.s3_client, config)
+
     @time_elapsed
     def upload_file(self, bucket_name, file_name, key_name=None):
         """
@@ -568,12 +738,15 @@ class S3:
             total=obj_size,
             miniters=1,
             disable=self.disable_pbar,
-        ) as pbar:
-            self.s3_resource.Bucket(bucket_name).upload_file(
-                Filename=file_name,
-                Key=key_name,
-                Callback=pbar.update_to,
-            )
+        ) as pbar, self.create_transfer_manager(
+            self.transfer_config.max_concurrency
+        ) as manager:
+            manager.upload(
+                file_name,
+                bucket_name,
+                key_name,
+                subscribers=[TransferSubscriber(obj_size, pbar.update_to)],
+            ).result()
 
     @time_elapsed
     def download_object(self, bucket_name, object_name, dest_name, versionid=None):
@@ -588,18 +761,13 @@ class S3:
         """
         log.debug("Downloading object %s to dest %s", object_name, dest_name)
 
-        if versionid:
-            extraargs = {"VersionId": versionid}
-            resp = self.s3_resource.ObjectVersion(
-                bucket_name, object_name, versionid
-            ).head()
-            obj_size = resp["ContentLength"]
-            # Change to 'size' attribute when this boto3 bug got fixed:
-            # https://github.com/boto/boto3/issues/832
-            # self.s3_resource.ObjectVersion(bucket_name, object_name, versionid).size
-        else:
-            extraargs = None
-            obj_size = self.s3_resource.ObjectSummary(bucket_name, object_name).size
+        # A single HeadObject request for the size, which is then passed on
+        # to the download so that it does not request it again
+        extraargs = {"VersionId": versionid} if versionid else {}
+        resp = self.s3_client.head_object(
+            Bucket=bucket_name, Key=object_name, **extraargs
+        )
+        obj_size = resp["ContentLength"]
 
         log.debug("obj_size: %s, extraargs: %s", obj_size, extraargs)
         with ProgressBar(
@@ -609,10 +777,109 @@ class S3:
             total=obj_size,
             miniters=1,
             disable=self.disable_pbar,
-        ) as pbar:
-            self.s3_resource.Bucket(bucket_name).download_file(
-                object_name, dest_name, ExtraArgs=extraargs, Callback=pbar.update_to
-            )
+        ) as pbar, self.create_transfer_manager(
+            self.transfer_config.max_concurrency
+        ) as manager:
+            manager.download(
+                bucket_name,
+                object_name,
+                dest_name,
+                extraargs,
+                [TransferSubscriber(obj_size, pbar.update_to, etag=resp["ETag"])],
+            ).result()
+
+    def transfer_objects(self, bucket_name, jobs, workers, upload=False):
+        """
+        Download or upload objects concurrently.
+
+        All objects and the parts of large objects are transferred by one
+        TransferManager with a pool of workers threads. The sizes of the
+        jobs are passed on, so downloads make no HeadObject requests. A
+        single progress bar shows the aggregate throughput. A failed
+        transfer does not stop the others.
+
+        Params:
+            bucket_name     (str): Bucket name
+            jobs           (list): (object_name, file_name, size, etag) tuples
+            workers         (int): Number of concurrent transfers
+            upload   (True/False): Upload the files instead of downloading
+
+        Returns:
+            A list of (object_name, error message) tuples for the failed jobs
+        """
+        errors, done = [], [0]
+
+        def on_done():
+            with ProgressBar.update_lock:
+                done[0] += 1
+                pbar.set_postfix(
+                    objects="{}/{}".format(done[0], len(jobs)), refresh=False
+                )
+
+        with ProgressBar(
+            unit="B",
+            unit_scale=True,
+            desc="data transferred",
+            total=sum(job[2] for job in jobs),
+            disable=self.disable_pbar,
+        ) as pbar, self.create_transfer_manager(workers) as manager:
+            futures, dirs = [], set()
+            for object_name, file_name, size, etag in jobs:
+                subscribers = [TransferSubscriber(size, pbar.update_to, on_done, etag)]
+                if upload:
+                    future = manager.upload(
+                        file_name, bucket_name, object_name, subscribers=subscribers
+                    )
+                else:
+                    local_path = os.path.dirname(file_name)
+                    if local_path not in dirs:
+                        try:
+                            os.makedirs(local_path or ".", exist_ok=True)
+                        except OSError as error:
+                            errors.append((object_name, describe_error(error)))
+                            continue
+                        dirs.add(local_path)
+                    future = manager.download(
+                        bucket_name, object_name, file_name, subscribers=subscribers
+                    )
+                futures.append((object_name, future))
+
+            for object_name, future in futures:
+                try:
+                    future.result()
+                except Exception as error:  # pylint: disable=broad-except
+                    log.debug("Transfer of %s failed: %r", object_name, error)
+                    errors.append((object_name, describe_error(error)))
+        return errors
+
+    def download_objects(self, bucket_name, objects, workers):
+        """
+        Download objects from S3 to local source concurrently.
+
+        Params:
+            bucket_name            (str): Bucket name
+            objects               (list): (object_name, dest_name, size, etag)
+                                          tuples from the listing
+            workers                (int): Number of concurrent downloads
+
+        Returns:
+            A list of (object_name, error message) tuples for the failed objects
+        """
+        return self.transfer_objects(bucket_name, objects, workers)
+
+    def upload_files(self, bucket_name, files, workers):
+        """
+        Upload files from local source to S3 concurrently.
+
+        Params:
+            bucket_name            (str): Bucket name
+            files                 (list): (key_name, file_name, size, None) tuples
+            workers                (int): Number of concurrent uploads
+
+        Returns:
+            A list of (key_name, error message) tuples for the failed files
+        """
+        return self.transfer_objects(bucket_name, files, workers, upload=True)
 
 
 class Download:
@@ -664,17 +931,38 @@ class Download:
             else:
                 raise
 
-    def download_prefix(self, prefix, overwrite):
+    def download_prefix(self, prefix, overwrite, workers=16):
         """
-        Download files that start with a prefix from S3.
+        Download files that start with a prefix from S3 concurrently.
+
+        Existing files are skipped unless overwrite is set. Objects that fail
+        to download are reported together at the end.
 
         Params:
             prefix             (str): Object prefix name
             overwrite   (True/False): Overwrite local file if it already exist
+            workers            (int): Number of concurrent downloads
         """
+        objects, skipped = [], 0
         for obj in self.s3.list_objects(self.bucket_name, prefix=prefix):
-            if not str(obj.key).endswith("/"):
-                self.download_file(obj.key, overwrite)
+            if str(obj.key).endswith("/"):
+                continue
+            dest_name = self.define_dest_name(obj.key)
+            if not overwrite and os.path.isfile(dest_name):
+                skipped += 1
+            else:
+                objects.append((obj.key, dest_name, obj.size, obj.e_tag))
+
+        msg(
+            "cyan",
+            "Downloading {} objects with prefix {} to path {}".format(
+                len(objects), prefix, self.local_dir
+            ),
+        )
+        if skipped:
+            msg("yellow", "  - Skipped {} existing files".format(skipped))
+        errors = self.s3.download_objects(self.bucket_name, objects, workers)
+        report_errors("download", len(objects), errors)
 
     def define_dest_name(self, object_name):
         """
@@ -706,6 +994,226 @@ class Download:
             )
 
 
+def report_errors(action, num_objects, errors):
+    """
+    Print the objects that failed to transfer and exit if there are any.
+
+    Params:
+        action         (str): download or upload
+        num_objects    (int): Number of objects to transfer
+        errors        (list): (object_name, error message) tuples
+    """
+    for object_name, error in errors:
+        msg("red", "Error: {} of '{}' failed: {}".format(action, object_name, error))
+    if errors:
+        msg(
+            "red",
+            "Error: {} of {} objects failed".format(len(errors), num_objects),
+            1,
+        )
+    msg("green", "  - {} of {} objects completed".format(action.title(), num_objects))
+
+
+def file_md5(file_name, chunk_size=1 << 20):
+    """Return the hex md5 of a file, the ETag of objects uploaded in one part."""
+    md5 = hashlib.md5()
+    with open(file_name, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def multipart_etag(file_name, part_size):
+    """Return the ETag of a file uploaded in parts of part_size bytes."""
+    digests = []
+    with open(file_name, "rb") as file:
+        for part in iter(lambda: file.read(part_size), b""):
+            digests.append(hashlib.md5(part).digest())
+    return "{}-{}".format(hashlib.md5(b"".join(digests)).hexdigest(), len(digests))
+
+
+class Sync(Download):
+    """Class to transfer only new or changed files, like rsync."""
+
+    def __init__(self, s3, bucket_name, local_dir, manifest_name):
+        """
+        Initialize Sync class.
+
+        The manifest records the size, ETag and last modification time of
+        every synchronized object together with the size and modification
+        time of its local file. Later runs compare it with one listing of
+        the bucket, so no object has to be requested or file hashed again.
+
+        Params:
+            s3             (obj): Instance of S3 class
+            bucket_name    (str): Bucket name
+            local_dir      (str): Local directory to synchronize
+            manifest_name  (str): Manifest file name in local_dir
+        """
+        super().__init__(s3, bucket_name, local_dir)
+        self.manifest_file = os.path.join(local_dir, manifest_name)
+        self.manifest = {}
+        if os.path.isfile(self.manifest_file):
+            with open(self.manifest_file) as file:
+                self.manifest = json.load(file)
+
+    def save_manifest(self):
+        """Write the manifest, replacing the previous one only when complete."""
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(self.manifest, file)
+        os.replace(tmp_file, self.manifest_file)
+
+    def list_local(self, prefix):
+        """Return a dict of object name to os.stat_result of local files."""
+        files = {}
+        for dirpath, _dirnames, filenames in os.walk(self.local_dir):
+            for filename in filenames:
+                file_name = os.path.join(dirpath, filename)
+                key = os.path.relpath(file_name, self.local_dir).replace(os.sep, "/")
+                if key.startswith(prefix) and file_name not in (
+                    self.manifest_file,
+                    self.manifest_file + ".tmp",
+                ):
+                    files[key] = os.stat(file_name)
+        return files
+
+    def record(self, key, obj):
+        """Add an object and the current state of its file to the manifest."""
+        stat = os.stat(self.define_dest_name(key))
+        self.manifest[key] = {
+            "size": obj.size,
+            "etag": obj.e_tag,
+            "last_modified": obj.last_modified.isoformat(),
+            "file_size": stat.st_size,
+            "file_mtime_ns": stat.st_mtime_ns,
+        }
+
+    def same_content(self, obj, stat):
+        """
+        Check if an object not in the manifest matches its local file.
+
+        The ETag of a multipart upload is the md5 of the md5s of its parts,
+        so the file is hashed in parts of the multipart_chunksize and of the
+        smallest size in MB giving the same number of parts, as used by
+        clients that grow the parts of large files. Objects uploaded with
+        other part sizes count as changed.
+        """
+        if obj.size != stat.st_size:
+            return False
+        file_name = self.define_dest_name(obj.key)
+        etag = obj.e_tag.strip('"')
+        if "-" not in etag:
+            return etag == file_md5(file_name)
+        parts = int(etag.rsplit("-", 1)[1])
+        part_sizes = {
+            self.s3.transfer_config.multipart_chunksize,
+            -(-obj.size // (parts * MB)) * MB,
+        }
+        return any(
+            -(-obj.size // part_size) == parts
+            and multipart_etag(file_name, part_size) == etag
+            for part_size in sorted(part_sizes)
+        )
+
+    def plan(self, remote, local, direction):
+        """
+        Decide which objects to download and which files to upload.
+
+        Params:
+            remote        (dict): Object name to ObjectSummary resource
+            local         (dict): Object name to os.stat_result of the file
+            direction      (str): download, upload or both
+
+        Returns:
+            downloads, uploads: lists of object names
+        """
+        downloads, uploads = [], []
+        for key in sorted(remote.keys() | local.keys()):
+            obj, stat, entry = remote.get(key), local.get(key), self.manifest.get(key)
+            if obj and stat and not entry and self.same_content(obj, stat):
+                self.record(key, obj)  # already synchronized without a manifest
+                continue
+            remote_changed = obj is not None and (
+                entry is None or entry["etag"] != obj.e_tag
+            )
+            local_changed = stat is not None and (
+                entry is None
+                or (entry["file_size"], entry["file_mtime_ns"])
+                != (stat.st_size, stat.st_mtime_ns)
+            )
+            if direction == "both" and remote_changed and local_changed:
+                # Conflict: keep the most recently modified version
+                if stat.st_mtime > obj.last_modified.timestamp():
+                    remote_changed = False
+                else:
+                    local_changed = False
+            if direction != "upload" and obj and (remote_changed or not stat):
+                downloads.append(key)
+            elif direction == "download" and obj and local_changed:
+                downloads.append(key)  # restore the local copy
+            elif direction != "download" and stat and (local_changed or not obj):
+                uploads.append(key)
+            elif direction == "upload" and stat and remote_changed:
+                uploads.append(key)  # restore the object
+        return downloads, uploads
+
+    def sync(self, prefix, direction, workers=16):
+        """
+        Transfer the new or changed objects and files with a prefix.
+
+        Params:
+            prefix             (str): Object prefix name
+            direction          (str): download, upload or both
+            workers            (int): Number of concurrent transfers
+        """
+        remote = {
+            obj.key: obj
+            for obj in self.s3.list_objects(self.bucket_name, prefix=prefix)
+            if not str(obj.key).endswith("/")
+        }
+        local = self.list_local(prefix)
+        downloads, uploads = self.plan(remote, local, direction)
+        msg(
+            "cyan",
+            "Synchronizing {} objects: {} to download, {} to upload".format(
+                len(remote.keys() | local.keys()), len(downloads), len(uploads)
+            ),
+        )
+
+        errors = self.s3.download_objects(
+            self.bucket_name,
+            [
+                (key, self.define_dest_name(key), remote[key].size, remote[key].e_tag)
+                for key in downloads
+            ],
+            workers,
+        )
+        failed = {key for key, _error in errors}
+        for key in downloads:
+            if key not in failed:
+                self.record(key, remote[key])
+
+        if uploads:
+            files = [
+                (key, self.define_dest_name(key), local[key].st_size, None)
+                for key in uploads
+            ]
+            upload_errors = self.s3.upload_files(self.bucket_name, files, workers)
+            errors += upload_errors
+            # The ETags of the uploaded objects come from a new listing
+            uploaded = set(uploads) - {key for key, _error in upload_errors}
+            for obj in self.s3.list_objects(self.bucket_name, prefix=prefix):
+                if obj.key in uploaded:
+                    self.record(obj.key, obj)
+
+        # Forget objects that no longer exist on either side
+        for key in self.manifest.keys() - (remote.keys() | local.keys()):
+            del self.manifest[key]
+        self.save_manifest()
+        report_errors("sync", len(downloads) + len(uploads), errors)
+
+
 ##############################################################################
 # Command to list object metadata
 ##############################################################################
@@ -839,10 +1347,22 @@ def cmd_upload(s3, args):
         if not os.path.isdir(args.dir):
             msg("red", "Error: Directory '{}' not found".format(args.dir), 1)
 
-        for dirpath, _dirnames, files in os.walk(args.dir):
-            for filename in files:
+        files, errors = [], []
+        for dirpath, _dirnames, filenames in os.walk(args.dir):
+            for filename in filenames:
                 file_path = os.path.join(dirpath, filename)
-                upload_single_file(s3, args.bucket, file_path, args.nokeepdir)
+                key_name = filename if args.nokeepdir else file_path
+                try:
+                    size = os.path.getsize(file_path)
+                except OSError as error:  # i.e. a broken symlink
+                    errors.append((key_name, describe_error(error)))
+                    continue
+                files.append((key_name, file_path, size, None))
+
+        num_files = len(files) + len(errors)
+        msg("cyan", "Uploading {} files from {}".format(num_files, args.dir))
+        errors += s3.upload_files(args.bucket, files, args.workers)
+        report_errors("upload", num_files, errors)
 
 
 ##############################################################################
@@ -868,7 +1388,7 @@ def cmd_download(s3, args):
 
     # Download all objects with a prefix
     if args.prefix:
-        download.download_prefix(args.prefix, args.overwrite)
+        download.download_prefix(args.prefix, args.overwrite, args.workers)
 
     if args.cnvrg_dataset and args.cnvrg_dataset.lower() != "none":
         cnvrg = Cnvrg()
@@ -887,6 +1407,22 @@ def cmd_download(s3, args):
                 ds.put_files(paths=[args.localdir])
 
 
+##############################################################################
+# Command to synchronize a directory
+##############################################################################
+def cmd_sync(s3, args):
+    """Handle sync option."""
+    # Check if bucket exist
+    if not s3.check_bucket_exist(args.bucket):
+        msg("red", "Error: Bucket '{}' does not exist".format(args.bucket), 1)
+
+    s3.disable_pbar = args.bucketname
+    create_dir(args.localdir)
+
+    sync = Sync(s3, args.bucket, args.localdir, args.manifest)
+    sync.sync(args.prefix, args.direction, args.workers)
+
+
 ##############################################################################
 # Main function
 ##############################################################################
@@ -919,6 +1455,12 @@ def main():
         config.aws_secret_access_key,
         args.endpoint,
         args.region_name,
+        getattr(args, "workers", 1),
+        TransferConfig(
+            multipart_threshold=args.multipart_threshold * MB,
+            multipart_chunksize=args.multipart_chunksize * MB,
+            max_concurrency=getattr(args, "workers", 10),
+        ),
     )
     if config.aws_access_key_id is None:
         s3.s3_resource.meta.client.meta.events.register(